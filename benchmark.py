@@ -0,0 +1,193 @@
+#!/usr/bin/python
+"""
+    Time the main steps of the analysis (loading the models, building the
+    LPs and solving them), for both OptKnock backends, and write the results
+    to a JSON file so that runs can be compared.
+
+    Usage:
+        python benchmark.py [-o results.json] [-n repeats] [--solver glpk]
+                            [--models toy,core,full] [--compare old.json]
+
+    Each benchmark is repeated n times, and the minimum, median and mean
+    wall times are recorded. With --compare, the median times are compared
+    to those of an earlier run, and the script exits with an error if any
+    benchmark became slower by more than the given threshold.
+"""
+import sys
+import time
+import json
+import platform
+import argparse
+import subprocess
+from collections import OrderedDict
+import numpy as np
+from python import optknock_pulp, optknock_optlang
+from python.models import Model
+
+BACKENDS = OrderedDict([('pulp', optknock_pulp.OptKnock),
+                        ('optlang', optknock_optlang.OptKnock)])
+
+TARGET_REACTION = 'H6PS'
+KNOCKINS = 'MEDH,H6PS,H6PI,H4MPTP,FDH'
+
+# the fixed grid of the analyze_kos benchmark
+CARBON_SOURCES = ['methanol,succ', 'methanol,xu5p_D']
+SINGLE_KOS = ['', 'FBP', 'RPI', 'TKT1', 'TALA']
+N_KNOCKOUTS = 2
+
+def get_wt_model():
+    wt_model = Model.initialize('core')
+    wt_model.knockin_reactions(KNOCKINS, 0, 1000)
+    wt_model.set_exchange_bounds('methanol', lower_bound=-10)
+    wt_model.set_exchange_bounds('xu5p_D', lower_bound=-2)
+    return wt_model
+
+def measure(func, setup=None, n_repeats=3):
+    """
+        Call func n_repeats times and return the wall times of the calls.
+        If setup is given, it is called (untimed) before each call, and its
+        return value is passed to func.
+    """
+    times = []
+    for _ in range(n_repeats):
+        args = () if setup is None else (setup(),)
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+    return times
+
+def iter_benchmarks(models, solver):
+    """
+        Yields the (name, func, setup) of every benchmark
+    """
+    for model_name in models:
+        yield ('initialize_%s' % model_name,
+               lambda model_name=model_name: Model.initialize(model_name),
+               None)
+
+    wt_model = get_wt_model()
+    yield 'clone', lambda: wt_model.clone(), None
+
+    for backend, optknock_class in BACKENDS.items():
+        engine = optknock_class.get_solver(solver)
+
+        def new_optknock(optknock_class=optknock_class, engine=engine):
+            optknock = optknock_class(wt_model, engine)
+            optknock.create_prob()
+            return optknock
+
+        yield ('%s.add_primal_variables_and_constraints' % backend,
+               lambda ok: ok.add_primal_variables_and_constraints(),
+               new_optknock)
+        yield ('%s.add_dual_variables_and_constraints' % backend,
+               lambda ok: ok.add_dual_variables_and_constraints(),
+               new_optknock)
+        yield ('%s.prepare_optknock' % backend,
+               lambda ok: ok.prepare_optknock(TARGET_REACTION,
+                                              num_deletions=1),
+               new_optknock)
+        yield ('%s.solve_FBA' % backend,
+               lambda ok: ok.solve_FBA(), new_optknock)
+        yield ('%s.get_slope' % backend,
+               lambda ok: ok.get_slope(TARGET_REACTION), new_optknock)
+        yield ('%s.get_PPP_data' % backend,
+               lambda ok: ok.get_PPP_data(TARGET_REACTION), new_optknock)
+        yield ('%s.get_PPP_data(adaptive)' % backend,
+               lambda ok: ok.get_PPP_data(TARGET_REACTION, adaptive=True),
+               new_optknock)
+        yield ('%s.analyze_kos' % backend,
+               lambda optknock_class=optknock_class:
+                   optknock_class.analyze_kos(
+                       CARBON_SOURCES, SINGLE_KOS, TARGET_REACTION, KNOCKINS,
+                       n_knockouts=N_KNOCKOUTS, n_threads=1, solver=solver),
+               None)
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.STDOUT
+                                       ).decode('utf-8').strip()
+    except Exception:
+        return None
+
+def get_versions():
+    versions = OrderedDict()
+    for package in ['numpy', 'scipy', 'pandas', 'cobra', 'pulp', 'optlang']:
+        try:
+            versions[package] = __import__(package).__version__
+        except Exception:
+            versions[package] = None
+    return versions
+
+def run(models, solver, n_repeats):
+    results = OrderedDict()
+    for name, func, setup in iter_benchmarks(models, solver):
+        times = measure(func, setup, n_repeats)
+        results[name] = OrderedDict([('min', min(times)),
+                                     ('median', float(np.median(times))),
+                                     ('mean', float(np.mean(times))),
+                                     ('times', times)])
+        sys.stdout.write("%-50s %9.3fs\n" % (name, results[name]['median']))
+        sys.stdout.flush()
+
+    return OrderedDict([('date', time.strftime('%Y-%m-%d %H:%M:%S')),
+                        ('revision', get_git_revision()),
+                        ('python', platform.python_version()),
+                        ('platform', platform.platform()),
+                        ('versions', get_versions()),
+                        ('solver', solver),
+                        ('n_repeats', n_repeats),
+                        ('benchmarks', results)])
+
+def compare(old_results, new_results, threshold):
+    """
+        Print the ratio between the new and old median times of every
+        benchmark which appears in both, and return the names of those
+        which became slower by more than the threshold (e.g. 0.2 for 20%)
+    """
+    old = old_results['benchmarks']
+    new = new_results['benchmarks']
+    regressions = []
+    sys.stdout.write("\n%-50s %10s %10s %7s\n" %
+                     ('benchmark', 'old', 'new', 'ratio'))
+    for name in new:
+        if name not in old:
+            continue
+        ratio = new[name]['median'] / max(old[name]['median'], 1e-9)
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  <- slower'
+        sys.stdout.write("%-50s %9.3fs %9.3fs %7.2f%s\n" %
+                         (name, old[name]['median'], new[name]['median'],
+                          ratio, flag))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='the JSON file to write the results to')
+    parser.add_argument('-n', '--repeats', type=int, default=3,
+                        help='the number of times each benchmark is run')
+    parser.add_argument('--solver', default='glpk',
+                        help='the solver used by both backends')
+    parser.add_argument('--models', default='toy,core,full',
+                        help='the models for the initialize benchmarks')
+    parser.add_argument('--compare', default=None,
+                        help='a JSON file of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='the relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    results = run(args.models.split(','), args.solver, args.repeats)
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as fp:
+            old_results = json.load(fp)
+        regressions = compare(old_results, results, args.threshold)
+        if regressions:
+            sys.stdout.write("%d benchmarks are slower by more than %d%%\n" %
+                             (len(regressions), 100 * args.threshold))
+            sys.exit(1)
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+"""
+    Compare the MILP solve time of OptKnock on the E. coli core model, when
+    the knockouts are linked to the fluxes and dual variables using big-M
+    constraints or using indicator constraints.
+
+    Usage:
+        python benchmark_indicators.py [solver] [num_deletions]
+
+    Indicator constraints are used only if the solver supports them (e.g.
+    CPLEX), otherwise the second run falls back to big-M constraints.
+"""
+import sys
+import time
+from python import optknock_optlang
+from python.models import Model
+
+TARGET_REACTION = 'H6PS'
+KNOCKINS = 'MEDH,H6PS,H6PI,H4MPTP,FDH'
+N_REPEATS = 3
+
+def run(engine, wt_model, num_deletions, use_indicators, tighten_bounds):
+    start = time.time()
+    ok = optknock_optlang.OptKnock(wt_model, engine)
+    ok.prepare_optslope(TARGET_REACTION, num_deletions=num_deletions,
+                        tighten_bounds=tighten_bounds,
+                        use_indicators=use_indicators)
+    prepare_time = time.time() - start
+
+    start = time.time()
+    ok.solve()
+    solve_time = time.time() - start
+
+    obj = ok.get_objective_value()
+    kos = ok.get_optknock_knockouts() if obj is not None else ''
+    return obj, kos, prepare_time, solve_time
+
+if __name__ == "__main__":
+    solver = sys.argv[1] if len(sys.argv) > 1 else 'cplex'
+    num_deletions = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    engine = optknock_optlang.OptKnock.get_solver(solver)
+
+    wt_model = Model.initialize('core')
+    wt_model.knockin_reactions(KNOCKINS, 0, 1000)
+    wt_model.set_exchange_bounds('methanol', lower_bound=-10)
+    wt_model.set_exchange_bounds('xu5p_D', lower_bound=-2)
+
+    print("%-10s %-8s %10s %10s %10s  %s" % ('formulation', 'bounds',
+          'objective', 'prepare', 'solve', 'knockouts'))
+    for use_indicators in [False, True]:
+        for tighten_bounds in [False, True]:
+            for _ in range(N_REPEATS):
+                obj, kos, prepare_time, solve_time = run(
+                    engine, wt_model, num_deletions, use_indicators,
+                    tighten_bounds)
+                print("%-10s %-8s %10.3f %9.2fs %9.2fs  %s" %
+                      ('indicator' if use_indicators else 'big-M',
+                       'tight' if tighten_bounds else 'M', obj or 0,
+                       prepare_time, solve_time, kos))
@@ -37,8 +37,10 @@ if __name__ == "__main__":
     
     df_fname = 'res/data_%s_%d.csv' % (title, max_ko)
     if not os.path.exists(df_fname):    
+        # a killed run can be resumed from the checkpoint file
         df = OptKnock.analyze_kos(CARBON_SOURCES, SINGLE_KOS,
-                                  target_reaction, knockins, max_ko)
+                                  target_reaction, knockins, max_ko,
+                                  checkpoint='res/checkpoint_%s_%d.csv' % (title, max_ko))
         with open(df_fname, 'w') as fp:
             df.round(3).to_csv(fp)
     else:
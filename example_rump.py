@@ -33,10 +33,12 @@ if __name__ == "__main__":
     title = 'rump'; target_reaction = 'H6PS'; knockins = 'MEDH,H6PS,H6PI,H4MPTP,FDH'
     
     df_fname = 'res/data_%s.csv' % title
-    if True:    
+    if not os.path.exists(df_fname):
+        # a killed run can be resumed from the checkpoint file
         df = OptKnock.analyze_kos(CARBON_SOURCES, SINGLE_KOS,
                                   target_reaction, knockins, max_ko,
-                                  solver='gurobi')
+                                  solver='gurobi',
+                                  checkpoint='res/checkpoint_%s.csv' % title)
         with open(df_fname, 'w') as fp:
             df.round(3).to_csv(fp)
     else:
@@ -0,0 +1,211 @@
+"""
+    Flux Variability Analysis (FVA) over many reactions, shared by the
+    OptKnock backends (optknock_pulp and optknock_optlang).
+
+    The maximal biomass production is found once, and the biomass is then
+    fixed to (a fraction of) this optimum. Each worker process builds the FBA
+    problem only once, and then iterates over its reactions, minimizing and
+    maximizing the flux of each one. Since only the objective changes between
+    consecutive solves, warm starts are enabled by default.
+
+    filter_ko_candidates uses FVA to find the knockout candidates which are
+    not worth knocking out: blocked reactions (which carry no flux anyway)
+    and essential ones (without which the model cannot grow), and
+    get_ko_candidates reports them for the prefilter option of the backends.
+    find_blocked_reactions uses it to find the reactions that can be removed
+    from the model before compressing it (see Model.compress), and
+    get_big_M_bounds uses the flux ranges to tighten the big-M constraints
+    of the OptKnock MILP.
+"""
+
+import sys
+import multiprocessing
+import pandas as pd
+
+COLUMNS = ['reaction', 'minimum', 'maximum']
+
+FILTER_COLUMNS = ['candidate', 'reason']
+
+# fluxes smaller than this (in absolute value) are considered to be zero
+FLUX_TOLERANCE = 1e-7
+
+# the tolerance used when fixing the biomass production to its optimum
+BIOMASS_TOLERANCE = 1e-5
+
+# the state of the current (worker) process, set by init_worker()
+_worker = {}
+
+def init_worker(optknock_class, model, solver, bm_lower_bound,
+                warm_start=True):
+    """
+        Build the FBA problem used for all the reactions in this process
+    """
+    optknock = optknock_class(model, solver)
+    if warm_start:
+        optknock.enable_warm_start()
+    optknock.prepare_FBA_primal()
+    _worker['optknock'] = optknock
+    _worker['bm_lower_bound'] = bm_lower_bound
+
+def get_flux_range(reaction_id):
+    min_flux, max_flux = _worker['optknock'].get_flux_range(
+        reaction_id, _worker['bm_lower_bound'])
+    return (reaction_id, min_flux, max_flux)
+
+def run_FVA(optknock_class, model, solver, reaction_ids=None,
+            fraction_of_optimum=1.0, n_threads=1, chunksize=None,
+            warm_start=True):
+    """
+        Args:
+            optknock_class      - the OptKnock class of the backend to use
+            model               - the Model to analyze
+            solver              - the solver (as returned by get_solver())
+            reaction_ids        - the reactions to analyze (default: all)
+            fraction_of_optimum - the fraction of the maximal biomass
+                                  production that must be maintained
+            n_threads           - the number of worker processes (1 for serial)
+            chunksize           - the number of reactions sent to a worker
+                                  at once
+            warm_start          - start each solve from the previous basis
+
+        Returns:
+            a DataFrame with the minimal and maximal flux of each reaction
+    """
+    if reaction_ids is None:
+        reaction_ids = model.reaction_ids
+    else:
+        reaction_ids = list(reaction_ids)
+
+    max_biomass = optknock_class(model, solver).solve_FBA()
+    if max_biomass is None:
+        raise Exception("Cannot run FVA because the model is infeasible")
+    bm_lower_bound = max(0, fraction_of_optimum * max_biomass -
+                         BIOMASS_TOLERANCE)
+
+    sys.stdout.write("Running FVA on %d reactions\n" % len(reaction_ids))
+
+    init_args = (optknock_class, model, solver, bm_lower_bound, warm_start)
+    if n_threads is None or n_threads <= 1:
+        init_worker(*init_args)
+        data = list(map(get_flux_range, reaction_ids))
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(reaction_ids) // (4 * n_threads))
+        pool = multiprocessing.Pool(n_threads, init_worker, init_args)
+        try:
+            data = list(pool.imap(get_flux_range, reaction_ids, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+
+    return pd.DataFrame(data=data, columns=COLUMNS).set_index('reaction')
+
+def find_blocked_reactions(optknock_class, model, solver, n_threads=1):
+    """
+        Returns the IDs of the reactions that carry no flux in any steady
+        state of the model (e.g. to be removed by Model.compress)
+    """
+    df = run_FVA(optknock_class, model, solver, fraction_of_optimum=0,
+                 n_threads=n_threads)
+    blocked = (df['minimum'].abs() <= FLUX_TOLERANCE) & \
+              (df['maximum'].abs() <= FLUX_TOLERANCE)
+    return list(df.index[blocked])
+
+def get_big_M_bounds(lower_bound, upper_bound, min_flux, max_flux, big_m):
+    """
+        Returns tightened bounds for the OptKnock variables of one reaction,
+        given its bounds and its flux range in the wild-type (knockouts can
+        only make this range smaller):
+            min_flux, max_flux - the flux bounds of the knockout constraints
+                                 (L_jj * y_j <= v_j <= U_jj * y_j)
+            w_L_max, w_U_max   - the upper bounds of the dual variables of
+                                 the flux bounds, which are 0 for a bound that
+                                 is never reached (by complementary slackness)
+            mu_min, mu_max     - the bounds of mu_j = y_j * (U_jj * w_U_j -
+                                 L_jj * w_L_j), which are used as the big-M
+                                 values of the constraints on mu_j
+    """
+    w_L_max = big_m if min_flux <= lower_bound + FLUX_TOLERANCE else 0
+    w_U_max = big_m if max_flux >= upper_bound - FLUX_TOLERANCE else 0
+    terms = [upper_bound * w_U_max, -lower_bound * w_L_max]
+    mu_min = max(-big_m, sum(min(0, t) for t in terms))
+    mu_max = min(big_m, sum(max(0, t) for t in terms))
+    return min_flux, max_flux, w_L_max, w_U_max, mu_min, mu_max
+
+def filter_ko_candidates(optknock_class, model, solver, candidates=None,
+                         essential_fraction=0.01, drop_exchanges=True,
+                         n_threads=1):
+    """
+        Find the knockout candidates which should not be considered, using
+        FVA on the (wild-type) model:
+            'not in model' - one of the reactions does not exist
+            'exchange'     - all the reactions are exchange reactions
+            'blocked'      - all the reactions carry no flux in any state
+            'essential'    - one of the reactions must carry flux for the
+                             model to reach essential_fraction of its
+                             maximal growth rate
+
+        Args:
+            candidates - a list of knockout candidates, each one is a reaction
+                         ID or a comma-separated list of reaction IDs. The
+                         empty candidate ('') is always kept. By default, all
+                         the reactions except the biomass reaction.
+
+        Returns:
+            the list of candidates that were kept, and a DataFrame of the
+            dropped ones (with the reason for dropping each one)
+    """
+    if candidates is None:
+        candidates = [rid for rid, c in zip(model.reaction_ids,
+                                            model.objective_coefficients)
+                      if c == 0]
+
+    dropped = []
+    remaining = []
+    for ko in candidates:
+        rids = [rid for rid in ko.split(',') if rid != '']
+        if not rids:
+            continue
+        if not all(model.has_reaction(rid) for rid in rids):
+            dropped.append((ko, 'not in model'))
+        elif drop_exchanges and all(rid.startswith('EX_') for rid in rids):
+            dropped.append((ko, 'exchange'))
+        else:
+            remaining.append((ko, rids))
+
+    reaction_ids = sorted(set(rid for _, rids in remaining for rid in rids))
+    if reaction_ids:
+        df_any = run_FVA(optknock_class, model, solver, reaction_ids,
+                         fraction_of_optimum=0, n_threads=n_threads)
+        df_growth = run_FVA(optknock_class, model, solver, reaction_ids,
+                            fraction_of_optimum=essential_fraction,
+                            n_threads=n_threads)
+        blocked = (df_any['minimum'].abs() <= FLUX_TOLERANCE) & \
+                  (df_any['maximum'].abs() <= FLUX_TOLERANCE)
+        essential = (df_growth['minimum'] > FLUX_TOLERANCE) | \
+                    (df_growth['maximum'] < -FLUX_TOLERANCE)
+        for ko, rids in remaining:
+            if all(blocked[rid] for rid in rids):
+                dropped.append((ko, 'blocked'))
+            elif any(essential[rid] for rid in rids):
+                dropped.append((ko, 'essential'))
+
+    dropped_kos = set(ko for ko, _ in dropped)
+    kept = [ko for ko in candidates if ko not in dropped_kos]
+    return kept, pd.DataFrame(data=dropped, columns=FILTER_COLUMNS)
+
+def get_ko_candidates(optknock_class, model, solver, essential_fraction=0.01,
+                      verbose=False):
+    """
+        Returns the reactions worth knocking out (see filter_ko_candidates),
+        printing how many were dropped (and, if verbose, the reason for
+        dropping each one). Used by prepare_optknock and prepare_optslope of
+        the backends when prefilter is True.
+    """
+    kept, dropped = filter_ko_candidates(optknock_class, model, solver,
+                                         essential_fraction=essential_fraction)
+    print("Dropped %d of the %d knockout candidates" %
+          (dropped.shape[0], dropped.shape[0] + len(kept)))
+    if verbose:
+        print(dropped.to_string(index=False))
+    return kept
@@ -0,0 +1,229 @@
+"""
+    An in-process GLPK solver for PuLP (through the swiglpk bindings).
+
+    PuLP's GLPK solver writes the whole problem to an LP file, runs glpsol
+    and parses its solution file for every call to solve(). GLPK_API instead
+    keeps a GLPK problem in memory for every PuLP problem it solves (stored
+    in LpProblem.solverModel), and before each solve it only pushes the
+    changes made since the previous one:
+
+        - variable bounds (e.g. knockouts and the biomass lower bound)
+        - the objective and its sense
+        - new constraints (and new variables appearing in them)
+        - the right-hand side and sense of existing constraints (e.g. after
+          LpConstraint.changeRHS), and constraints replaced by new ones
+
+    Changing the coefficients of an existing constraint in place is not
+    detected. Since the problem is kept between solves, GLPK starts each
+    solve from the basis of the previous one.
+"""
+
+from pulp import LpSolver, LpInteger, LpConstraintEQ, LpConstraintLE, \
+                 LpMinimize, LpStatusOptimal, LpStatusInfeasible, \
+                 LpStatusUnbounded, LpStatusUndefined, LpStatusNotSolved
+
+try:
+    import swiglpk as glpk
+except ImportError:
+    glpk = None
+
+class _Session(object):
+    """
+        A GLPK problem mirroring a PuLP problem
+    """
+
+    def __init__(self, lp):
+        self.problem = glpk.glp_create_prob()
+        glpk.glp_set_prob_name(self.problem, lp.name)
+        self.columns = {} # variable -> [column index, lower bound, upper bound]
+        self.rows = {}    # name -> [row index, constraint, sense, rhs]
+        self.objective = {} # variable -> coefficient
+        self.has_integers = False
+        self.add_constraints(lp, list(lp.constraints.items()))
+
+    def __del__(self):
+        if glpk is not None and self.problem is not None:
+            glpk.glp_delete_prob(self.problem)
+            self.problem = None
+
+    def add_columns(self, variables):
+        variables = [v for v in variables if v not in self.columns]
+        if not variables:
+            return
+        first = glpk.glp_add_cols(self.problem, len(variables))
+        for j, v in enumerate(variables, first):
+            if v.cat == LpInteger:
+                glpk.glp_set_col_kind(self.problem, j, glpk.GLP_IV)
+                self.has_integers = True
+            self.columns[v] = [j, v.lowBound, v.upBound]
+            self.set_column_bounds(j, v.lowBound, v.upBound)
+
+    def set_column_bounds(self, j, lower_bound, upper_bound):
+        glpk.glp_set_col_bnds(self.problem, j,
+                              *_get_bounds(lower_bound, upper_bound))
+
+    def set_row_bounds(self, i, sense, rhs):
+        if sense == LpConstraintEQ:
+            glpk.glp_set_row_bnds(self.problem, i, glpk.GLP_FX, rhs, rhs)
+        elif sense == LpConstraintLE:
+            glpk.glp_set_row_bnds(self.problem, i, glpk.GLP_UP, 0, rhs)
+        else:
+            glpk.glp_set_row_bnds(self.problem, i, glpk.GLP_LO, rhs, 0)
+
+    def set_row_coefficients(self, i, constraint):
+        items = list(constraint.items())
+        indices = glpk.intArray(len(items) + 1)
+        values = glpk.doubleArray(len(items) + 1)
+        for k, (v, coeff) in enumerate(items, 1):
+            indices[k] = self.columns[v][0]
+            values[k] = coeff
+        glpk.glp_set_mat_row(self.problem, i, len(items), indices, values)
+
+    def add_constraints(self, lp, constraints):
+        if not constraints:
+            return
+        self.add_columns(v for _, c in constraints for v in c.keys())
+        first = glpk.glp_add_rows(self.problem, len(constraints))
+        for i, (name, c) in enumerate(constraints, first):
+            self.rows[name] = [i, c, c.sense, -c.constant]
+            self.set_row_coefficients(i, c)
+            self.set_row_bounds(i, c.sense, -c.constant)
+
+    def update(self, lp):
+        """
+            Push the changes made to the PuLP problem since the last update
+        """
+        # new and changed constraints
+        new_constraints = []
+        for name, c in lp.constraints.items():
+            row = self.rows.get(name)
+            if row is None:
+                new_constraints.append((name, c))
+                continue
+            i, old_c, sense, rhs = row
+            if c is not old_c:
+                self.add_columns(c.keys())
+                self.set_row_coefficients(i, c)
+                row[1] = c
+            if c.sense != sense or -c.constant != rhs:
+                row[2], row[3] = c.sense, -c.constant
+                self.set_row_bounds(i, c.sense, -c.constant)
+        self.add_constraints(lp, new_constraints)
+
+        # variable bounds
+        for v, column in self.columns.items():
+            if v.lowBound != column[1] or v.upBound != column[2]:
+                column[1], column[2] = v.lowBound, v.upBound
+                self.set_column_bounds(column[0], v.lowBound, v.upBound)
+
+        # the objective
+        objective = dict(lp.objective.items())
+        self.add_columns(objective.keys())
+        for v, coeff in objective.items():
+            if self.objective.get(v) != coeff:
+                glpk.glp_set_obj_coef(self.problem, self.columns[v][0], coeff)
+        for v in self.objective:
+            if v not in objective:
+                glpk.glp_set_obj_coef(self.problem, self.columns[v][0], 0)
+        self.objective = objective
+        glpk.glp_set_obj_coef(self.problem, 0, lp.objective.constant)
+        glpk.glp_set_obj_dir(self.problem, glpk.GLP_MIN
+                             if lp.sense == LpMinimize else glpk.GLP_MAX)
+
+    def solve(self, msg, mip):
+        """
+            Solve the LP (and the MIP, if there are integer variables and
+            mip is True), and return the PuLP status
+        """
+        smcp = glpk.glp_smcp()
+        glpk.glp_init_smcp(smcp)
+        smcp.msg_lev = glpk.GLP_MSG_ALL if msg else glpk.GLP_MSG_OFF
+        ret = glpk.glp_simplex(self.problem, smcp)
+        if ret in (glpk.GLP_EBADB, glpk.GLP_ESING, glpk.GLP_ECOND):
+            # the previous basis cannot be used, start from a new one
+            glpk.glp_adv_basis(self.problem, 0)
+            ret = glpk.glp_simplex(self.problem, smcp)
+        if ret == glpk.GLP_EBOUND:
+            # some variable has a lower bound above its upper bound
+            return LpStatusInfeasible
+        if ret != 0:
+            return LpStatusUndefined
+
+        status = glpk.glp_get_status(self.problem)
+        if status != glpk.GLP_OPT or not (mip and self.has_integers):
+            return _get_lp_status(status)
+
+        iocp = glpk.glp_iocp()
+        glpk.glp_init_iocp(iocp)
+        iocp.msg_lev = glpk.GLP_MSG_ALL if msg else glpk.GLP_MSG_OFF
+        if glpk.glp_intopt(self.problem, iocp) != 0:
+            return LpStatusUndefined
+        status = glpk.glp_mip_status(self.problem)
+        if status == glpk.GLP_OPT:
+            return LpStatusOptimal
+        if status == glpk.GLP_NOFEAS:
+            return LpStatusInfeasible
+        return LpStatusNotSolved
+
+    def assign_values(self, is_mip):
+        """
+            Copy the solution to the PuLP variables (and the duals of the
+            constraints, for LPs)
+        """
+        if is_mip:
+            for v, column in self.columns.items():
+                v.varValue = glpk.glp_mip_col_val(self.problem, column[0])
+        else:
+            for v, column in self.columns.items():
+                v.varValue = glpk.glp_get_col_prim(self.problem, column[0])
+                v.dj = glpk.glp_get_col_dual(self.problem, column[0])
+            for row in self.rows.values():
+                row[1].pi = glpk.glp_get_row_dual(self.problem, row[0])
+
+def _get_bounds(lower_bound, upper_bound):
+    if lower_bound is None and upper_bound is None:
+        return glpk.GLP_FR, 0, 0
+    if lower_bound is None:
+        return glpk.GLP_UP, 0, upper_bound
+    if upper_bound is None:
+        return glpk.GLP_LO, lower_bound, 0
+    if lower_bound == upper_bound:
+        return glpk.GLP_FX, lower_bound, upper_bound
+    return glpk.GLP_DB, lower_bound, upper_bound
+
+def _get_lp_status(status):
+    if status == glpk.GLP_OPT:
+        return LpStatusOptimal
+    if status in (glpk.GLP_INFEAS, glpk.GLP_NOFEAS):
+        return LpStatusInfeasible
+    if status == glpk.GLP_UNBND:
+        return LpStatusUnbounded
+    return LpStatusUndefined
+
+class GLPK_API(LpSolver):
+    """
+        A PuLP solver that keeps the problem in an in-process GLPK object
+        (see the module docstring)
+    """
+
+    def available(self):
+        return glpk is not None
+
+    def actualSolve(self, lp):
+        if not self.available():
+            raise ImportError('swiglpk is not installed, please run '
+                              '"pip install swiglpk"')
+        session = getattr(lp, '_glpk_session', None)
+        if session is None or \
+                any(name not in lp.constraints for name in session.rows):
+            # a new problem, or constraints were removed: build from scratch
+            session = _Session(lp)
+            lp._glpk_session = session
+            lp.solverModel = session.problem
+        session.update(lp)
+
+        status = session.solve(self.msg, self.mip)
+        if status == LpStatusOptimal:
+            session.assign_values(self.mip and session.has_integers)
+        lp.status = status
+        return status
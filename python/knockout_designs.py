@@ -0,0 +1,147 @@
+"""
+    Enumeration of the best knockout designs of a prepared OptKnock (or
+    OptSlope) problem, shared by the OptKnock backends (optknock_pulp and
+    optknock_optlang).
+
+    enumerate_designs finds the best few knockout sets for the same number of
+    deletions: after each solve, an integer cut that excludes the knockout set
+    is added (using add_integer_cut of the backend) and the same problem is
+    solved again. sweep_num_deletions finds the best knockout set for every
+    number of deletions, changing only the bound of the number_of_deletions
+    constraint (using set_num_deletions of the backend). In both cases, the
+    problem is modified and not rebuilt, so each solve starts from the
+    previous one (if the solver supports it).
+
+    Each design is then evaluated on the wild-type model with its knockouts
+    (see evaluate_design).
+
+    find_compressed_design runs OptKnock (or OptSlope) on the compressed
+    network (see Model.compress), whose MILP is much smaller, and maps the
+    knockouts back to the reactions of the original model.
+"""
+
+import pandas as pd
+from python import flux_variability
+
+DESIGN_COLUMNS = ['knockouts', 'objective', 'biomass', 'target', 'slope']
+
+def enumerate_designs(optknock, n_designs=5, epsilon_bm=0.01):
+    """
+        Find the best n_designs knockout sets of the problem prepared by
+        prepare_optknock or prepare_optslope, until n_designs are found or
+        the problem becomes infeasible.
+
+        Returns:
+            a DataFrame ranked by the objective value, with the maximal
+            biomass production of each design, the minimal target flux at
+            this biomass production and the slope (see get_slope)
+    """
+    optknock.enable_warm_start()
+    designs = []
+    while len(designs) < n_designs:
+        optknock.solve()
+        objective_value = optknock.get_objective_value()
+        if objective_value is None:
+            break
+        kos = optknock.get_optknock_knockouts()
+        designs.append((kos, objective_value))
+        optknock.add_integer_cut([rid for rid in kos.split(',') if rid != ''])
+
+    data = [(kos, objective_value) + optknock.evaluate_design(kos, epsilon_bm)
+            for kos, objective_value in designs]
+    df = pd.DataFrame(data=data, columns=DESIGN_COLUMNS)
+    df.index = pd.RangeIndex(1, df.shape[0] + 1, name='rank')
+    return df
+
+def sweep_num_deletions(optknock, max_deletions, min_deletions=1,
+                        epsilon_bm=0.01):
+    """
+        Solve the problem prepared by prepare_optknock or prepare_optslope
+        for every number of knockouts between min_deletions and
+        max_deletions. The solution for K knockouts is also feasible for
+        K+1, so each solve starts from the previous one (if the solver
+        supports MIP starts).
+
+        Returns:
+            a DataFrame with the best knockout set for each number of
+            deletions (see enumerate_designs for the other columns)
+    """
+    optknock.enable_warm_start()
+    data = []
+    for num_deletions in range(min_deletions, max_deletions + 1):
+        optknock.set_num_deletions(num_deletions)
+        optknock.solve()
+        objective_value = optknock.get_objective_value()
+        if objective_value is None:
+            data.append((num_deletions, None, None, None, None, None))
+            continue
+        kos = optknock.get_optknock_knockouts()
+        data.append((num_deletions, kos, objective_value) +
+                    optknock.evaluate_design(kos, epsilon_bm))
+    return pd.DataFrame(data=data, columns=['num_deletions'] + DESIGN_COLUMNS)
+
+def evaluate_design(optknock_class, model, solver, target_reaction,
+                    epsilon_bm=0.01):
+    """
+        Returns the maximal biomass production of the model (i.e. the
+        wild-type model with the knockouts of the design), the minimal
+        target flux at this biomass production, and the slope (see
+        get_slope)
+    """
+    ok = optknock_class(model, solver)
+    biomass, slope = ok._get_yield_and_slope(target_reaction, epsilon_bm)
+    target = ok.get_flux_bound(target_reaction, max(0, biomass - 1e-5),
+                               maximize=False)
+    return biomass, target, slope
+
+def find_compressed_design(optknock_class, model, solver, target_reaction,
+                           num_deletions=5, optslope=False, find_blocked=True,
+                           epsilon_bm=0.01, **kwargs):
+    """
+        Compress the model (keeping the target reaction), find the best
+        knockout set of the compressed model using prepare_optknock (or
+        prepare_optslope, if optslope is True), and map it back to the
+        original reactions. Knocking out any of the members of a lumped
+        reaction has the same effect, so the first one is used.
+
+        Args:
+            find_blocked - remove the reactions found to be blocked by FVA
+                           before compressing (see
+                           flux_variability.find_blocked_reactions)
+
+        Other keyword arguments are passed on to prepare_optknock (or
+        prepare_optslope). Note that ko_candidates should then be reactions
+        of the compressed model.
+
+        Returns:
+            a tuple with the values of DESIGN_COLUMNS, where the knockouts are
+            original reaction IDs and the design is evaluated on the original
+            model, or None if the problem could not be solved
+    """
+    blocked = []
+    if find_blocked:
+        blocked = flux_variability.find_blocked_reactions(
+            optknock_class, model, solver)
+    compressed = model.compress(blocked, keep=[target_reaction])
+
+    ok = optknock_class(compressed, solver)
+    if optslope:
+        ok.prepare_optslope(target_reaction, num_deletions=num_deletions,
+                            **kwargs)
+    else:
+        ok.prepare_optknock(target_reaction, num_deletions=num_deletions,
+                            **kwargs)
+    ok.solve()
+    objective_value = ok.get_objective_value()
+    if objective_value is None:
+        return None
+
+    knockouts = ','.join(members[0] for members in
+                         compressed.decompress_knockouts(
+                             ok.get_optknock_knockouts()))
+    ko_model = model.clone()
+    if knockouts:
+        ko_model.knockout_reactions(knockouts)
+    return (knockouts, objective_value) + \
+        evaluate_design(optknock_class, ko_model, solver, target_reaction,
+                        epsilon_bm)
@@ -0,0 +1,786 @@
+"""
+    Evaluation of knockout x carbon-source grids, shared by the OptKnock
+    backends (optknock_pulp and optknock_optlang).
+
+    The grid can be evaluated serially or using a pool of worker processes.
+    Each worker is initialized once with the wild-type model and then
+    receives chunks of (knockouts, carbon source) tasks.
+
+    By default, every task clones the wild-type model, applies the carbon
+    source and knockouts to the clone and builds new LPs from it. With
+    reuse_problem=True, each worker builds the wild-type LP only once and
+    every task is applied as a set of flux bound changes, which are reverted
+    after the task is solved.
+
+    With warm_start=True (which implies reuse_problem), the bounds are not
+    reverted after each task. Instead, only the bounds that differ between
+    consecutive tasks are changed, and the solver starts from the basis of the
+    previous solve. The grid is ordered by knockout set and then by carbon
+    source, and each worker receives contiguous chunks of it, so consecutive
+    tasks differ only by a few bounds.
+
+    With a checkpoint file, every result is appended to the file (as a CSV
+    row) as soon as it is ready. If the scan is interrupted and started again
+    with the same checkpoint file, the tasks that are already in it are
+    skipped. The parameters of the scan are stored next to it (in a JSON
+    file), and a scan with other parameters refuses to use it. Both files
+    are removed once the scan is complete.
+
+    With prefilter=True, the knockout candidates that are blocked or
+    essential on all carbon sources (according to FVA) are dropped before
+    the combinations are enumerated.
+
+    With prune_lethal=True, knockout sets are evaluated in increasing size,
+    and the supersets of lethal sets are not solved at all.
+
+    For very large grids, iter_kos generates the tasks lazily and yields the
+    results as they are ready, and write_kos writes them to a CSV or Parquet
+    file in chunks, so the memory used does not depend on the grid size.
+
+    With profile=True, every result row also has the time spent in each
+    phase of its task and the solver statistics (see profiling.Profile), and
+    analyze_kos prints a summary of them.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import multiprocessing
+import pandas as pd
+from itertools import combinations, islice
+from python.models import Model
+from python import flux_variability, profiling
+
+COLUMNS = ['knockouts', 'carbon source', 'yield', 'slope']
+
+# the biomass lower bound used for calculating the slope
+EPSILON_BM = 0.01
+
+# the number of tasks (or result rows) held in memory at once when
+# streaming the results (see iter_kos)
+BATCH_SIZE = 10000
+
+# the state of the current (worker) process, set by init_worker()
+_worker = {}
+
+def init_worker(optknock_class, solver, wt_model, target_reaction,
+                carbon_uptake_rate, carbon_sources=(), reuse_problem=False,
+                warm_start=False, profile=False):
+    """
+        Prepare the state needed for evaluating tasks in this process
+    """
+    _worker['profile'] = profile
+    _worker['optknock_class'] = optknock_class
+    _worker['solver'] = optknock_class.get_solver(solver)
+    # a lightweight clone, so that cloning it for every task does not copy
+    # the bounds of the whole cobra model
+    _worker['wt_model'] = wt_model.clone()
+    _worker['target_reaction'] = target_reaction
+    _worker['carbon_uptake_rate'] = carbon_uptake_rate
+    _worker['optknock'] = None
+    _worker['warm_start'] = warm_start
+
+    # the reactions whose bounds are currently changed in the LP, mapped to
+    # their (wild-type bounds, current bounds)
+    _worker['applied_bounds'] = {}
+
+    if reuse_problem or warm_start:
+        # all the reactions needed for the carbon sources must exist before
+        # the LP is built, since later they can only be changed by setting
+        # their bounds. they are added as blocked reactions, so the
+        # wild-type LP stays the same.
+        model = wt_model.clone()
+        for carbon_source in carbon_sources:
+            if carbon_source == 'electrons':
+                if not model.has_reaction('RED'):
+                    model.knockin_reactions('RED', 0, 0)
+            elif carbon_source != '':
+                for cs in carbon_source.split(','):
+                    if not model.has_reaction('EX_' + cs + '_e'):
+                        model.add_metabolite_exchange(cs, 0, 0)
+
+        optknock = optknock_class(model, _worker['solver'])
+        if warm_start:
+            optknock.enable_warm_start()
+        optknock.prepare_FBA_primal()
+        _worker['optknock'] = optknock
+
+def get_uptake_rate(model, carbon_source, carbon_uptake_rate):
+    """
+        Find out how many carbon atoms are in the carbon source and
+        normalize the uptake rate to be in units of
+        mmol carbon-source / (gDW*h)
+    """
+    nC = 0
+    for cs in carbon_source.split(','):
+        nC += model.get_carbon_count(cs + '_c')
+    return carbon_uptake_rate / float(nC)
+
+def get_task_bounds(wt_model, kos, carbon_source, carbon_uptake_rate):
+    """
+        Translate a task (a list of knockouts and a carbon source) into
+        the flux bounds that should be set in the wild-type LP
+    """
+    bounds = {}
+    if carbon_source == 'electrons':
+        bounds['RED'] = (0, carbon_uptake_rate*2)
+    elif carbon_source != '':
+        uptake_rate = get_uptake_rate(wt_model, carbon_source,
+                                      carbon_uptake_rate)
+        for cs in carbon_source.split(','):
+            bounds['EX_' + cs + '_e'] = (-uptake_rate, 0)
+
+    for ko in kos:
+        if ko != '':
+            for rid in ko.split(','):
+                bounds[rid] = (0, 0)
+    return bounds
+
+def apply_carbon_source(model, carbon_source, carbon_uptake_rate):
+    """
+        Change the model to take up the given carbon source(s)
+    """
+    if carbon_source == 'electrons':
+        model.knockin_reactions('RED', 0, carbon_uptake_rate*2)
+    elif carbon_source != '':
+        uptake_rate = get_uptake_rate(model, carbon_source,
+                                      carbon_uptake_rate)
+        for cs in carbon_source.split(','):
+            model.set_exchange_bounds(cs, lower_bound=-uptake_rate)
+
+def filter_candidates(optknock_class, solver, wt_model, carbon_sources,
+                      single_kos, carbon_uptake_rate, n_threads=1):
+    """
+        Drop the knockout candidates that are blocked or essential (see
+        flux_variability.filter_ko_candidates) on all the carbon sources
+        on which the wild-type can grow. Prints the dropped candidates and
+        the reasons.
+
+        Returns:
+            the list of candidates that were kept, and a DataFrame of the
+            dropped ones
+    """
+    solver = optknock_class.get_solver(solver)
+
+    # the reasons for dropping each candidate, on each carbon source
+    reasons = {}
+    n_growing = 0
+    for carbon_source in carbon_sources:
+        model = wt_model.clone()
+        apply_carbon_source(model, carbon_source, carbon_uptake_rate)
+        if not optknock_class(model, solver).solve_FBA():
+            # nothing can be learned from a carbon source that does not
+            # support growth
+            continue
+        n_growing += 1
+        _, dropped = flux_variability.filter_ko_candidates(
+            optknock_class, model, solver, single_kos, n_threads=n_threads)
+        for ko, reason in dropped.itertuples(index=False):
+            reasons.setdefault(ko, []).append(reason)
+
+    # a candidate is dropped only if it is useless on all carbon sources
+    dropped = [(ko, ' or '.join(sorted(set(reasons[ko]))))
+               for ko in single_kos
+               if n_growing > 0 and len(reasons.get(ko, [])) == n_growing]
+
+    if dropped:
+        sys.stdout.write("Dropped %d of the %d knockout candidates:\n" %
+                         (len(dropped), len(single_kos)))
+        for ko, reason in dropped:
+            sys.stdout.write("  %s: %s\n" % (ko, reason))
+
+    dropped_kos = set(ko for ko, _ in dropped)
+    kept = [ko for ko in single_kos if ko not in dropped_kos]
+    return kept, pd.DataFrame(data=dropped,
+                              columns=flux_variability.FILTER_COLUMNS)
+
+def calculate_yield_and_slope(params):
+    kos, carbon_source = params
+    sys.stderr.write('KOs = ' + ', '.join(kos) + ': ' + carbon_source + '\n')
+
+    if _worker['optknock'] is not None:
+        _worker['optknock'].profile.reset()
+        yd, slope = _solve_with_bounds(kos, carbon_source)
+        return _make_row(kos, carbon_source, yd, slope,
+                         _worker['optknock'].profile)
+
+    optknock_class = _worker['optknock_class']
+    solver = _worker['solver']
+    wt_model = _worker['wt_model']
+    target_reaction = _worker['target_reaction']
+    carbon_uptake_rate = _worker['carbon_uptake_rate']
+
+    start = time.time()
+    temp_model = wt_model.clone()
+    apply_carbon_source(temp_model, carbon_source, carbon_uptake_rate)
+    for ko in kos:
+        if ko != '':
+            temp_model.knockout_reactions(ko)
+    copy_time = time.time() - start
+
+    optknock = optknock_class(temp_model, solver)
+    optknock.profile.times['model copy'] += copy_time
+    yd, slope = optknock.get_yield_and_slope(target_reaction, EPSILON_BM)
+    return _make_row(kos, carbon_source, yd, slope, optknock.profile)
+
+def _make_row(kos, carbon_source, yd, slope, profile):
+    row = ('|'.join(kos), carbon_source, yd, slope)
+    if _worker['profile']:
+        row += profile.to_row()
+    return row
+
+def get_columns(profile=False):
+    """
+        Returns the columns of the result rows
+    """
+    if profile:
+        return COLUMNS + profiling.COLUMNS
+    return COLUMNS
+
+def summarize_profile(df):
+    """
+        Returns the total and mean of each profiling column over all tasks
+    """
+    columns = [col for col in profiling.COLUMNS if col != 'mip_gap']
+    df = df[columns].astype(float)
+    # the total of a column without any values (e.g. the nodes of LP-only
+    # scans) is NaN rather than 0
+    total = df.sum().where(df.notnull().any())
+    return pd.DataFrame({'total': total, 'mean': df.mean()},
+                        columns=['total', 'mean'])
+
+def _apply_bounds(bounds):
+    """
+        Set the given flux bounds in the LP prepared in init_worker(), and
+        restore the wild-type bounds of all other reactions that were changed
+        by previous tasks. Bounds that already have the right value are not
+        touched, so the LP changes as little as possible.
+    """
+    optknock = _worker['optknock']
+    applied_bounds = _worker['applied_bounds']
+
+    for rid in list(applied_bounds.keys()):
+        if rid not in bounds:
+            wt_bounds, _ = applied_bounds.pop(rid)
+            optknock.set_reaction_bounds(rid, *wt_bounds)
+
+    for rid, new_bounds in bounds.items():
+        if rid in applied_bounds:
+            wt_bounds, current_bounds = applied_bounds[rid]
+            if current_bounds == new_bounds:
+                continue
+            optknock.set_reaction_bounds(rid, *new_bounds)
+        else:
+            wt_bounds = optknock.set_reaction_bounds(rid, *new_bounds)
+        applied_bounds[rid] = (wt_bounds, new_bounds)
+
+def _solve_with_bounds(kos, carbon_source):
+    """
+        Calculate the yield and slope of a task by changing the bounds of
+        the LP prepared in init_worker()
+    """
+    optknock = _worker['optknock']
+    target_reaction = _worker['target_reaction']
+    bounds = get_task_bounds(_worker['wt_model'], kos, carbon_source,
+                             _worker['carbon_uptake_rate'])
+
+    try:
+        _apply_bounds(bounds)
+
+        optknock.solve()
+        yd = optknock.get_objective_value() or 0
+        if target_reaction is None:
+            slope = None
+        elif yd == 0:
+            slope = 0
+        elif bounds.get(target_reaction) == (0, 0):
+            # the target reaction itself is knocked out
+            slope = None
+        else:
+            min_v_target = optknock.get_flux_bound(target_reaction,
+                                                   EPSILON_BM, maximize=False)
+            if min_v_target is None:
+                slope = None
+            else:
+                slope = min_v_target / EPSILON_BM
+    finally:
+        if not _worker['warm_start']:
+            # revert to the wild-type LP
+            _apply_bounds({})
+    return yd, slope
+
+def load_checkpoint(fname):
+    """
+        Read the results stored in a checkpoint file, as a dictionary
+        mapping (knockouts, carbon source) to the result row. A row which
+        was only partially written (e.g. if the process was killed) is
+        removed from the file.
+    """
+    if not os.path.exists(fname):
+        return {}
+
+    with open(fname, 'rb+') as fp:
+        content = fp.read()
+        end = content.rfind(b'\n') + 1
+        if end < len(content):
+            fp.truncate(end)
+    if end == 0:
+        return {}
+
+    df = pd.read_csv(fname, dtype={'knockouts': str, 'carbon source': str},
+                     keep_default_na=False,
+                     na_values={'yield': [''], 'slope': ['']})
+    results = {}
+    for row in df[COLUMNS].itertuples(index=False):
+        row = tuple(None if pd.isnull(x) else x for x in row)
+        results[(row[0], row[1])] = row
+    return results
+
+def _get_checkpoint_params_fname(checkpoint):
+    return checkpoint + '.json'
+
+def get_checkpoint_params(optknock_class, target_reaction, knockins,
+                          n_knockouts, carbon_uptake_rate, solver, prefilter):
+    """
+        The parameters of a scan that its checkpoint file depends on
+    """
+    return dict(backend=optknock_class.__module__,
+                target_reaction=target_reaction, knockins=knockins,
+                n_knockouts=n_knockouts, carbon_uptake_rate=carbon_uptake_rate,
+                solver=solver, prefilter=prefilter)
+
+def check_checkpoint_params(checkpoint, params):
+    """
+        The rows of a checkpoint file are keyed only by the knockouts and
+        the carbon source, so make sure that the file was written by a scan
+        with the same parameters (which are stored in a JSON file next to
+        it). For a new checkpoint, the parameters are stored.
+    """
+    params_fname = _get_checkpoint_params_fname(checkpoint)
+    if os.path.exists(params_fname):
+        with open(params_fname) as fp:
+            stored_params = json.load(fp)
+        if stored_params != params:
+            raise ValueError('The checkpoint file %s was written by a scan '
+                             'with different parameters (%s), remove it or '
+                             'use another checkpoint file' %
+                             (checkpoint, json.dumps(stored_params,
+                                                     sort_keys=True)))
+    elif os.path.exists(checkpoint) and os.path.getsize(checkpoint) > 0:
+        raise ValueError('The parameters of the scan which wrote the '
+                         'checkpoint file %s are unknown, remove it or use '
+                         'another checkpoint file' % checkpoint)
+    else:
+        with open(params_fname, 'w') as fp:
+            json.dump(params, fp, sort_keys=True)
+
+def remove_checkpoint(checkpoint):
+    for fname in [checkpoint, _get_checkpoint_params_fname(checkpoint)]:
+        if os.path.exists(fname):
+            os.remove(fname)
+
+def _append_to_checkpoint(rows, checkpoint):
+    """
+        Append each of the result rows to the checkpoint file as soon as it
+        is ready, and pass it on
+    """
+    write_header = not os.path.exists(checkpoint) or \
+                   os.path.getsize(checkpoint) == 0
+    with open(checkpoint, 'a') as fp:
+        writer = csv.writer(fp)
+        if write_header:
+            writer.writerow(COLUMNS)
+            fp.flush()
+        for row in rows:
+            writer.writerow(['' if x is None else x for x in row])
+            fp.flush()
+            yield row
+
+def iter_tasks(carbon_sources, single_kos, n_knockouts, skip=()):
+    """
+        Lazily generate the (knockouts, carbon source) tasks of the grid,
+        ordered by knockout set and then by carbon source. Tasks whose
+        (knockouts, carbon source) key is in 'skip' are not generated.
+    """
+    for kos in combinations(single_kos, n_knockouts):
+        key = '|'.join(kos)
+        for cs in carbon_sources:
+            if (key, cs) not in skip:
+                yield (kos, cs)
+
+def _iter_batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def _prepare_wt_model(optknock_class, solver, knockins, cache_dir,
+                      carbon_sources, single_kos, carbon_uptake_rate,
+                      prefilter=False, n_threads=1):
+    """
+        Returns the wild-type model, and the knockout candidates (without
+        the useless ones, if prefilter is True)
+    """
+    # resolve the solver name early, so that errors are raised here and
+    # not inside the worker processes
+    optknock_class.get_solver(solver)
+
+    wt_model = Model.initialize(cache_dir=cache_dir)
+
+    if knockins is not None:
+        wt_model.knockin_reactions(knockins, 0, 1000)
+
+    sys.stdout.write("There are %d single knockouts\n" % len(single_kos))
+    sys.stdout.write("There are %d carbon sources: %s\n" %
+                     (len(carbon_sources), ', '.join(carbon_sources)))
+
+    if prefilter:
+        single_kos, _ = filter_candidates(optknock_class, solver, wt_model,
+                                          carbon_sources, single_kos,
+                                          carbon_uptake_rate, n_threads)
+    return wt_model, single_kos
+
+def _start_workers(init_args, n_threads):
+    """
+        Returns a pool of worker processes, or None if the tasks should be
+        evaluated serially (in which case this process is initialized)
+    """
+    if n_threads is None or n_threads <= 1:
+        init_worker(*init_args)
+        return None
+    return multiprocessing.Pool(n_threads, init_worker, init_args)
+
+def _stop_workers(pool, finished):
+    if pool is None:
+        return
+    if finished:
+        pool.close()
+    else:
+        # the scan was stopped early (or failed), so the remaining tasks are
+        # not needed
+        pool.terminate()
+    pool.join()
+
+def _default_chunksize(n_tasks, n_threads):
+    # send a few contiguous chunks to each worker, large enough to amortize
+    # the IPC overhead (and to keep neighbouring tasks on the same worker,
+    # for warm starts) but small enough to balance the load
+    return max(1, n_tasks // (4 * n_threads))
+
+def _iter_results(pool, tasks, chunksize, batch_size=BATCH_SIZE,
+                  ordered=True):
+    """
+        Evaluate the tasks (serially if pool is None) and yield the results
+    """
+    if pool is None:
+        for task in tasks:
+            yield calculate_yield_and_slope(task)
+        return
+
+    if ordered:
+        imap = pool.imap
+    else:
+        imap = pool.imap_unordered
+
+    # the next batch is sent to the pool before the results of the current
+    # one are consumed, so the workers are never idle
+    pending = None
+    for batch in _iter_batches(tasks, batch_size):
+        results = imap(calculate_yield_and_slope, batch, chunksize)
+        if pending is not None:
+            for row in pending:
+                yield row
+        pending = results
+    if pending is not None:
+        for row in pending:
+            yield row
+
+def iter_kos(optknock_class, carbon_sources, single_kos,
+             target_reaction, knockins="", n_knockouts=2, n_threads=2,
+             carbon_uptake_rate=50, solver='glpk', chunksize=None,
+             reuse_problem=False, warm_start=False, cache_dir=None,
+             prefilter=False, skip=(), batch_size=BATCH_SIZE, ordered=True,
+             profile=False):
+    """
+        Like analyze_kos, but returns a generator of the result rows
+        (knockouts, carbon source, yield, slope, and the profiling columns
+        if profile is True) as soon as they are ready.
+
+        The tasks are generated lazily and sent to the worker processes in
+        batches of batch_size, so the memory used does not depend on the
+        size of the grid.
+
+        Extra args:
+            skip       - a set of (knockouts, carbon source) keys which should
+                         not be evaluated (e.g. from a checkpoint)
+            batch_size - the number of tasks held in memory at once
+            ordered    - yield the rows in the order of the tasks. Otherwise,
+                         rows are yielded in the order in which they are ready
+    """
+    wt_model, single_kos = _prepare_wt_model(
+        optknock_class, solver, knockins, cache_dir, carbon_sources,
+        single_kos, carbon_uptake_rate, prefilter, n_threads)
+    for row in _iter_kos(optknock_class, wt_model, carbon_sources, single_kos,
+                         target_reaction, n_knockouts, n_threads,
+                         carbon_uptake_rate, solver, chunksize, reuse_problem,
+                         warm_start, skip, batch_size, ordered, profile):
+        yield row
+
+def _iter_kos(optknock_class, wt_model, carbon_sources, single_kos,
+              target_reaction, n_knockouts, n_threads, carbon_uptake_rate,
+              solver, chunksize, reuse_problem, warm_start, skip=(),
+              batch_size=BATCH_SIZE, ordered=True, profile=False):
+    """
+        Like iter_kos, but with the wild-type model and the knockout
+        candidates already prepared (see _prepare_wt_model)
+    """
+    tasks = iter_tasks(carbon_sources, single_kos, n_knockouts, skip)
+    init_args = (optknock_class, solver, wt_model, target_reaction,
+                 carbon_uptake_rate, carbon_sources, reuse_problem,
+                 warm_start, profile)
+
+    if chunksize is None and n_threads is not None and n_threads > 1:
+        n_tasks = min(batch_size, count_tasks(carbon_sources, single_kos,
+                                              n_knockouts))
+        chunksize = _default_chunksize(n_tasks, n_threads)
+
+    pool = _start_workers(init_args, n_threads)
+    finished = False
+    try:
+        for row in _iter_results(pool, tasks, chunksize, batch_size, ordered):
+            yield row
+        finished = True
+    finally:
+        _stop_workers(pool, finished)
+
+def analyze_kos_pruned(optknock_class, carbon_sources, single_kos,
+                       target_reaction, knockins="", n_knockouts=2,
+                       n_threads=2, carbon_uptake_rate=50, solver='glpk',
+                       chunksize=None, reuse_problem=False, warm_start=False,
+                       cache_dir=None, prefilter=False):
+    """
+        Like analyze_kos, but skips the knockout sets that are known to be
+        lethal without solving them.
+
+        Knocking out more reactions can only lower the maximal yield, so if
+        a set of knockouts is lethal (zero yield) on a carbon source, so are
+        all of its supersets. The knockout sets are therefore evaluated in
+        increasing size (starting from the wild-type), and a set is solved
+        only if none of its subsets (with one knockout less) is lethal.
+        Otherwise, its yield and slope are set to 0.
+
+        The sets smaller than n_knockouts are solved only once, and are used
+        for the results of the combinations that include the empty knockout
+        ('').
+    """
+    wt_model, single_kos = _prepare_wt_model(
+        optknock_class, solver, knockins, cache_dir, carbon_sources,
+        single_kos, carbon_uptake_rate, prefilter, n_threads)
+    init_args = (optknock_class, solver, wt_model, target_reaction,
+                 carbon_uptake_rate, carbon_sources, reuse_problem,
+                 warm_start)
+
+    # the slope that calculate_yield_and_slope() returns for a zero yield
+    lethal_slope = None if target_reaction is None else 0
+
+    items = [ko for ko in single_kos if ko != '']
+    results = {} # (set of knockouts, carbon source) -> (yield, slope)
+    lethal = set()
+    n_solved = 0
+    n_pruned = 0
+
+    pool = _start_workers(init_args, n_threads)
+    finished = False
+    try:
+        for k in range(n_knockouts + 1):
+            tasks = []
+            for kos in combinations(items, k):
+                ko_set = frozenset(kos)
+                for cs in carbon_sources:
+                    if any((ko_set.difference([ko]), cs) in lethal
+                           for ko in kos):
+                        lethal.add((ko_set, cs))
+                        results[(ko_set, cs)] = (0, lethal_slope)
+                        n_pruned += 1
+                    else:
+                        tasks.append((kos, cs))
+
+            level_chunksize = chunksize
+            if level_chunksize is None and pool is not None:
+                level_chunksize = _default_chunksize(len(tasks), n_threads)
+
+            rows = _iter_results(pool, tasks, level_chunksize)
+            for (kos, cs), (_, _, yd, slope) in zip(tasks, rows):
+                results[(frozenset(kos), cs)] = (yd, slope)
+                if yd == 0:
+                    lethal.add((frozenset(kos), cs))
+            n_solved += len(tasks)
+        finished = True
+    finally:
+        _stop_workers(pool, finished)
+
+    sys.stdout.write("Solved %d knockout sets, skipped %d lethal ones\n" %
+                     (n_solved, n_pruned))
+
+    data = []
+    for kos in combinations(single_kos, n_knockouts):
+        ko_set = frozenset(ko for ko in kos if ko != '')
+        for cs in carbon_sources:
+            yd, slope = results[(ko_set, cs)]
+            data.append(('|'.join(kos), cs, yd, slope))
+    return pd.DataFrame(data=data, columns=COLUMNS)
+
+def count_tasks(carbon_sources, single_kos, n_knockouts):
+    """
+        The number of tasks in the grid (without generating them)
+    """
+    n = len(single_kos)
+    if n_knockouts > n:
+        return 0
+    n_combinations = 1
+    for i in range(n_knockouts):
+        n_combinations = n_combinations * (n - i) // (i + 1)
+    return n_combinations * len(carbon_sources)
+
+def write_kos(fname, *args, **kwargs):
+    """
+        Run a knockout scan (see iter_kos for the arguments) and write the
+        results to a CSV file, or to a Parquet file if fname ends with
+        '.parquet' (requires pyarrow). The rows are written in chunks of
+        'rows_per_chunk', so only one chunk is kept in memory.
+
+        Returns:
+            the number of rows written
+    """
+    rows_per_chunk = kwargs.pop('rows_per_chunk', BATCH_SIZE)
+    columns = get_columns(kwargs.get('profile', False))
+    rows = iter_kos(*args, **kwargs)
+
+    if fname.endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow is not installed, please run '
+                              '"pip install pyarrow" or use a CSV file')
+        schema = pa.schema([('knockouts', pa.string()),
+                            ('carbon source', pa.string())] +
+                           [(col, pa.float64()) for col in columns[2:]])
+        writer = pq.ParquetWriter(fname, schema)
+        write_chunk = lambda df, first: writer.write_table(
+            pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+    else:
+        writer = open(fname, 'w')
+        write_chunk = lambda df, first: df.to_csv(writer, header=first,
+                                                  index=False)
+
+    n_rows = 0
+    try:
+        for chunk in _iter_batches(rows, rows_per_chunk):
+            df = pd.DataFrame(data=chunk, columns=columns)
+            write_chunk(df, n_rows == 0)
+            n_rows += len(chunk)
+        if n_rows == 0:
+            write_chunk(pd.DataFrame(columns=columns), True)
+    finally:
+        writer.close()
+    return n_rows
+
+def analyze_kos(optknock_class, carbon_sources, single_kos,
+                target_reaction, knockins="", n_knockouts=2, n_threads=2,
+                carbon_uptake_rate=50, solver='glpk', chunksize=None,
+                reuse_problem=False, warm_start=False, cache_dir=None,
+                checkpoint=None, prune_lethal=False, prefilter=False,
+                profile=False):
+    """
+        Args:
+            optknock_class  - the OptKnock class of the backend to use
+            target_reaction - the reaction for which the coupling to BM yield is made
+            knockins        - extra reactions to add to the model
+            n_knockouts     - the number of simultaneous knockouts
+            n_threads       - the number of worker processes (1 for serial)
+            carbon_uptake_rate - in units of mmol C / (gDW*h)
+            solver          - the name of the solver used by the backend
+            chunksize       - the number of tasks sent to a worker at once
+            reuse_problem   - build the wild-type LP once per worker and apply
+                              each task as bound changes
+            warm_start      - like reuse_problem, but also start each solve
+                              from the basis of the previous task
+            cache_dir       - a directory for caching the initialized model
+                              (see Model.initialize)
+            checkpoint      - a CSV file to which the results are appended
+                              as they are ready. Tasks that are already in
+                              it (from a previous run with the same
+                              parameters) are not solved again. It is
+                              removed when the scan is complete.
+            prune_lethal    - do not solve the knockout sets which contain a
+                              smaller lethal set (see analyze_kos_pruned)
+            prefilter       - drop the knockout candidates which are blocked
+                              or essential (see filter_candidates) before
+                              enumerating the combinations
+            profile         - add the time spent in each phase and the solver
+                              statistics of every task to the results (see
+                              profiling.COLUMNS), and print their summary
+    """
+    if profile and (prune_lethal or checkpoint is not None):
+        raise ValueError('profiling is not supported with checkpoints or '
+                         'prune_lethal')
+
+    if prune_lethal:
+        if checkpoint is not None:
+            raise ValueError('checkpoints are not supported with prune_lethal')
+        return analyze_kos_pruned(
+            optknock_class, carbon_sources, single_kos, target_reaction,
+            knockins=knockins, n_knockouts=n_knockouts, n_threads=n_threads,
+            carbon_uptake_rate=carbon_uptake_rate, solver=solver,
+            chunksize=chunksize, reuse_problem=reuse_problem,
+            warm_start=warm_start, cache_dir=cache_dir, prefilter=prefilter)
+
+    if checkpoint is None:
+        data = list(iter_kos(optknock_class, carbon_sources, single_kos,
+                             target_reaction, knockins=knockins,
+                             n_knockouts=n_knockouts, n_threads=n_threads,
+                             carbon_uptake_rate=carbon_uptake_rate,
+                             solver=solver, chunksize=chunksize,
+                             reuse_problem=reuse_problem,
+                             warm_start=warm_start, cache_dir=cache_dir,
+                             prefilter=prefilter, profile=profile))
+        df = pd.DataFrame(data=data, columns=get_columns(profile))
+        if profile:
+            sys.stdout.write("%s\n" % summarize_profile(df).to_string())
+        return df
+
+    check_checkpoint_params(checkpoint, get_checkpoint_params(
+        optknock_class, target_reaction, knockins, n_knockouts,
+        carbon_uptake_rate, solver, prefilter))
+
+    # the candidates are filtered before the tasks are counted and compared
+    # with the checkpoint, so that they are those of the filtered grid
+    wt_model, single_kos = _prepare_wt_model(
+        optknock_class, solver, knockins, cache_dir, carbon_sources,
+        single_kos, carbon_uptake_rate, prefilter, n_threads)
+
+    done = load_checkpoint(checkpoint)
+    keys = [('|'.join(kos), cs)
+            for kos in combinations(single_kos, n_knockouts)
+            for cs in carbon_sources]
+    sys.stdout.write("%d of the %d tasks are already in %s\n" %
+                     (sum(1 for key in keys if key in done), len(keys),
+                      checkpoint))
+
+    # store each result as soon as it is ready, the order is restored below
+    rows = _iter_kos(optknock_class, wt_model, carbon_sources, single_kos,
+                     target_reaction, n_knockouts, n_threads,
+                     carbon_uptake_rate, solver, chunksize, reuse_problem,
+                     warm_start, skip=done, ordered=False)
+    for row in _append_to_checkpoint(rows, checkpoint):
+        done[(row[0], row[1])] = row
+
+    data = [done[key] for key in keys]
+    df = pd.DataFrame(data=data, columns=COLUMNS)
+    remove_checkpoint(checkpoint)
+    return df
@@ -1,24 +1,304 @@
+import os
+import csv
+import hashlib
+import pickle
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse, linalg
 from copy import deepcopy
+import cobra
 from cobra.manipulation.modify import convert_to_irreversible
 from cobra.io.sbml import create_cobra_model_from_sbml_file
 from cobra.core import Reaction, Metabolite
 from cobra.core.formula import Formula
 
+SBML_FILES = {'core': 'data/ecoli_core.xml',
+              'full': 'data/iJO1366.xml',
+              'toy': 'data/toymodel.xml'}
+
+# the library of reactions that can be added by Model.knockin_reactions, and
+# of the metabolites that they need and which are not in the E. coli models
+KNOCKIN_REACTIONS_FILE = 'data/knockin_reactions.csv'
+KNOCKIN_METABOLITES_FILE = 'data/knockin_metabolites.csv'
+
+# increase this number whenever the post-processing in Model.initialize
+# changes, so that models cached by older versions are not used
+CACHE_VERSION = 1
+
+# kernel entries (and stoichiometric coefficients of lumped reactions) smaller
+# than this are considered to be zero during the network compression
+COMPRESSION_TOLERANCE = 1e-9
+
+def sparse_rows(matrix):
+    """
+        Iterate over the rows of a sparse CSR matrix, yielding for each row
+        a list of (column index, value) pairs of its non-zero entries
+    """
+    indptr = matrix.indptr.tolist()
+    indices = matrix.indices.tolist()
+    data = matrix.data.tolist()
+    for i in range(matrix.shape[0]):
+        start, end = indptr[i], indptr[i+1]
+        yield list(zip(indices[start:end], data[start:end]))
+
+def build_stoichiometric_matrix(cobra_model):
+    """
+        Returns the stoichiometric matrix of a cobra model (metabolites x
+        reactions) as a sparse CSR matrix
+    """
+    met_index = dict((m.id, i) for i, m in enumerate(cobra_model.metabolites))
+    rows, cols, data = [], [], []
+    for j, r in enumerate(cobra_model.reactions):
+        for m, coeff in r._metabolites.items():
+            if coeff != 0:
+                rows.append(met_index[m.id])
+                cols.append(j)
+                data.append(coeff)
+    shape = (len(cobra_model.metabolites), len(cobra_model.reactions))
+    return sparse.csr_matrix((data, (rows, cols)), shape=shape, dtype=float)
+
+def _round_coefficient(x, tolerance=COMPRESSION_TOLERANCE):
+    """
+        Round numerical noise away from (nearly) integer coefficients
+    """
+    if abs(x - round(x)) < tolerance * max(1.0, abs(x)):
+        return float(round(x))
+    return x
+
+def find_enzyme_subsets(S, tolerance=COMPRESSION_TOLERANCE):
+    """
+        Find the reactions that are blocked and the groups of reactions whose
+        fluxes are proportional in every steady state (enzyme subsets), using
+        the kernel (null space) of the stoichiometric matrix S. The reactions
+        of a linear chain (i.e. linked by metabolites which take part only in
+        these two reactions) are always in the same subset.
+
+        Returns:
+            the indices of the blocked reactions, and a list of the subsets,
+            each one is a list of (reaction index, factor) pairs, such that
+            v_j = factor_j * v_k where k is the first reaction in the subset
+    """
+    if sparse.issparse(S):
+        S = S.toarray()
+    K = linalg.null_space(S)
+    norms = np.sqrt((K**2).sum(axis=1))
+    blocked = [j for j in range(K.shape[0]) if norms[j] <= tolerance]
+
+    # normalize the rows of K to unit length, so that the rows of reactions
+    # in the same subset are equal up to their sign (and numerical noise).
+    # each row is compared to the first row of every subset found so far
+    group_tolerance = np.sqrt(tolerance)
+    first_rows = np.zeros((0, K.shape[1]))
+    subsets = []
+    for j in range(K.shape[0]):
+        if norms[j] <= tolerance:
+            continue
+        row = K[j, :] / norms[j]
+        distances = [np.abs(first_rows - row).max(axis=1),
+                     np.abs(first_rows + row).max(axis=1)]
+        for sign, distance in zip([1, -1], distances):
+            matches = np.nonzero(distance <= group_tolerance)[0]
+            if len(matches) > 0:
+                subsets[matches[0]].append((j, sign * norms[j]))
+                break
+        else:
+            first_rows = np.vstack([first_rows, row])
+            subsets.append([(j, norms[j])])
+
+    result = []
+    for members in subsets:
+        j0, scale0 = members[0]
+        result.append([(j, _round_coefficient(scale / scale0, tolerance))
+                       for j, scale in members])
+    return blocked, result
+
+def parse_equation(equation):
+    """
+        Parse a reaction equation, such as 'rubp_D_c + co2_c => 2 3pg_c',
+        into a dictionary of metabolite IDs and stoichiometric coefficients
+    """
+    sparse = OrderedDict()
+    substrates, products = equation.split('=>')
+    for side, sign in [(substrates, -1), (products, 1)]:
+        for term in side.split(' + '):
+            tokens = term.split()
+            if len(tokens) == 0:
+                continue
+            elif len(tokens) == 1:
+                coeff, cid = 1, tokens[0]
+            elif len(tokens) == 2:
+                coeff, cid = float(tokens[0]), tokens[1]
+            else:
+                raise ValueError('cannot parse the reaction equation: ' + equation)
+            sparse[cid] = sparse.get(cid, 0) + sign * coeff
+    return sparse
+
+_knockin_library = None
+
+def get_knockin_library():
+    """
+        Returns the library of knockin reactions, read from the CSV files
+        (only once per process), as two dictionaries:
+            metabolite ID -> (formula, name)
+            reaction ID   -> (name, sparse)
+    """
+    global _knockin_library
+    if _knockin_library is None:
+        with open(KNOCKIN_METABOLITES_FILE) as fp:
+            metabolites = dict((row['metabolite'], (row['formula'], row['name']))
+                               for row in csv.DictReader(fp))
+        with open(KNOCKIN_REACTIONS_FILE) as fp:
+            reactions = OrderedDict((row['reaction'],
+                                     (row['name'], parse_equation(row['equation'])))
+                                    for row in csv.DictReader(fp))
+        _knockin_library = (metabolites, reactions)
+    return _knockin_library
+
+class _SharedModel(object):
+    """
+        The cobra model of a model, shared (read-only) with its lightweight
+        clones. The indexes and arrays derived from its reactions and
+        metabolites are computed only once. Before the model itself adds or
+        removes reactions or metabolites, it calls detach(), so that the
+        clones keep using a private copy of the original cobra model.
+    """
+
+    def __init__(self, cobra_model):
+        self.cobra_model = cobra_model
+        self.reaction_ids = [r.id for r in cobra_model.reactions]
+        self.metabolite_ids = [m.id for m in cobra_model.metabolites]
+        self.reaction_index = dict((rid, j) for j, rid in enumerate(self.reaction_ids))
+        self.metabolite_index = dict((cid, i) for i, cid in enumerate(self.metabolite_ids))
+        self.carbon_counts = dict((m.id, m.elements.get('C', 0))
+                                  for m in cobra_model.metabolites)
+        self._stoichiometric_matrix = None
+
+    @property
+    def stoichiometric_matrix(self):
+        if self._stoichiometric_matrix is None:
+            self._stoichiometric_matrix = build_stoichiometric_matrix(self.cobra_model)
+        return self._stoichiometric_matrix
+
+    def detach(self):
+        self.cobra_model = deepcopy(self.cobra_model)
+
+class _Overlay(object):
+    """
+        The changes made to a lightweight clone, relative to the shared
+        cobra model. Removed reactions are applied first, then the added
+        metabolites and reactions (in order), and finally the bounds.
+    """
+
+    def __init__(self):
+        self.removed = set()            # IDs of removed shared reactions
+        self.metabolites = OrderedDict() # ID -> add_metabolite() arguments
+        self.reactions = OrderedDict()   # ID -> add_reaction() arguments
+        self.bounds = {}                # ID -> (lower_bound, upper_bound)
+
+    def copy(self):
+        new_overlay = _Overlay()
+        new_overlay.removed = set(self.removed)
+        new_overlay.metabolites = OrderedDict(self.metabolites)
+        new_overlay.reactions = OrderedDict(self.reactions)
+        new_overlay.bounds = dict(self.bounds)
+        return new_overlay
 
 class Model(object):
+    """
+        A wrapper for a cobra model.
+
+        A model created by clone() is lightweight: it shares the cobra model
+        of its parent (which is not changed by cloning) and only records its
+        own changes (removed reactions, changed bounds and added metabolites
+        and reactions) in an overlay. The bounds and objective of the parent
+        are copied when cloning, so later changes of the parent do not
+        affect the clone. Its own full cobra model is created only when it
+        is accessed (e.g. through the cobra_model, reactions or metabolites
+        attributes), so clone(), knockout_reactions(), knockin_reactions(),
+        set_exchange_bounds() and set_reaction_bounds() only cost as much as
+        the changes they make.
+
+        The indexes of the reactions and metabolites (reaction_index,
+        metabolite_index and exchange_reactions) are built when they are
+        first used, and then kept up to date by the methods of this class.
+        They are not updated when the cobra model is changed directly.
+    """
 
     def __init__(self):
+        self._base = None
+        self._overlay = None
         self.cobra_model = None
+
+        # for compressed models, maps the ID of every reaction to the list of
+        # (original reaction ID, factor) pairs it replaces (see compress())
+        self.reaction_map = None
     
     @staticmethod
     def initialize(model_name='core',
                    carbon_sources={},
                    irreversible=False,
-                   ATP_maintenance=False, BM_lower_bound=0.1):
-        
+                   ATP_maintenance=False, BM_lower_bound=0.1,
+                   cache_dir=None):
+        """
+            Read one of the E. coli models from its SBML file and prepare it
+            for the analysis.
+
+            If cache_dir is given, the prepared model is stored there in a
+            binary file, keyed by the hash of the SBML file, the knockin
+            library files and the arguments.
+            Later calls with the same arguments load it instead of parsing
+            the SBML file again.
+        """
+        args = (model_name, sorted(carbon_sources.items()), irreversible,
+                ATP_maintenance, BM_lower_bound)
+        if cache_dir is None:
+            return Model._initialize(*args)
+
+        cache_fname = Model._get_cache_fname(cache_dir, *args)
+        if os.path.exists(cache_fname):
+            try:
+                with open(cache_fname, 'rb') as fp:
+                    return pickle.load(fp)
+            except Exception:
+                # the cache file is corrupt (e.g. it was written by an
+                # incompatible version), ignore it and parse the SBML again
+                pass
+
+        m = Model._initialize(*args)
+
+        # write to a temporary file first, and then rename it, so that
+        # processes running in parallel never read a partially written file
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # another process created it in the meantime
+                pass
+        fd, tmp_fname = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(m, fp, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_fname, cache_fname)
+        return m
+
+    @staticmethod
+    def _get_cache_fname(cache_dir, model_name, carbon_sources, *args):
+        h = hashlib.sha1()
+        for fname in [SBML_FILES[model_name], KNOCKIN_REACTIONS_FILE,
+                      KNOCKIN_METABOLITES_FILE]:
+            with open(fname, 'rb') as fp:
+                h.update(fp.read())
+        key = (CACHE_VERSION, cobra.__version__, model_name,
+               carbon_sources) + args
+        h.update(repr(key).encode('utf-8'))
+        return os.path.join(cache_dir, '%s_%s.pkl' % (model_name, h.hexdigest()))
+
+    @staticmethod
+    def _initialize(model_name, carbon_sources, irreversible,
+                    ATP_maintenance, BM_lower_bound):
         if model_name == 'core':
             model = create_cobra_model_from_sbml_file(
-                'data/ecoli_core.xml', old_sbml=True)
+                SBML_FILES['core'], old_sbml=True)
             if irreversible:
                 convert_to_irreversible(model)
             # the core model has these annoying '_b' metabolites that are used as
@@ -36,15 +316,15 @@ class Model(object):
                 rxns['ATPM'].lower_bound = 0 # remove the ATP maintenance requirement
             rxns['EX_glc_e'].lower_bound = 0 # remove the default carbon source
         elif model_name == 'full':
-            model = create_cobra_model_from_sbml_file('data/iJO1366.xml')
+            model = create_cobra_model_from_sbml_file(SBML_FILES['full'])
             rxns = dict([(r.id, r) for r in model.reactions])
             if not ATP_maintenance:
                 rxns['ATPM'].lower_bound = 0 # remove the ATP maintenance requirement
             rxns['EX_glc_e'].lower_bound = 0 # remove the default carbon source
         elif model_name == 'toy':
-            model = create_cobra_model_from_sbml_file('data/toymodel.xml')
+            model = create_cobra_model_from_sbml_file(SBML_FILES['toy'])
             
-        for key, val in carbon_sources.items():
+        for key, val in carbon_sources:
             rxns['EX_' + key + '_e'].lower_bound = val
             
         # set BM lower bound
@@ -63,9 +343,81 @@ class Model(object):
         return m
     
     def clone(self):
+        """
+            Returns a lightweight copy of this model (see the class docstring)
+        """
         new_model = Model()
-        new_model.cobra_model = deepcopy(self.cobra_model)
+        if self._base is None:
+            if self._shared is None:
+                self._shared = _SharedModel(self._cobra_model)
+            new_model._base = self._shared
+            new_model._base_vectors = (self.lower_bounds, self.upper_bounds,
+                                       self.objective_coefficients)
+            new_model._overlay = _Overlay()
+        else:
+            new_model._base = self._base
+            new_model._base_vectors = self._base_vectors
+            new_model._overlay = self._overlay.copy()
+        new_model.reaction_map = self.reaction_map
         return new_model
+
+    def _detach_clones(self):
+        """
+            Called before adding or removing reactions or metabolites of the
+            cobra model of this model, which its clones must not see
+        """
+        if self._shared is not None:
+            self._shared.detach()
+            self._shared = None
+
+    @property
+    def cobra_model(self):
+        if self._base is not None:
+            self._materialize()
+        return self._cobra_model
+
+    @cobra_model.setter
+    def cobra_model(self, cobra_model):
+        self._base = None
+        self._base_vectors = None
+        self._overlay = None
+        self._shared = None
+        self._cobra_model = cobra_model
+        self._invalidate_cache()
+        self._reaction_index = None
+        self._metabolite_index = None
+        self._exchange_reactions = None
+        self._carbon_counts = {}
+
+    def _materialize(self):
+        """
+            Create a full cobra model for a lightweight clone, by copying the
+            shared cobra model and applying the overlay to it
+        """
+        base, overlay = self._base, self._overlay
+        lower_bounds, upper_bounds, objective_coefficients = self._base_vectors
+        cobra_model = deepcopy(base.cobra_model)
+
+        # the parent may have changed the bounds or the objective of the
+        # shared cobra model since it was cloned
+        for r, lb, ub, c in zip(cobra_model.reactions, lower_bounds,
+                                upper_bounds, objective_coefficients):
+            if r.lower_bound != lb or r.upper_bound != ub:
+                r.lower_bound = lb
+                r.upper_bound = ub
+            if r.objective_coefficient != c:
+                r.objective_coefficient = c
+
+        self.cobra_model = cobra_model
+        if overlay.removed:
+            self._cobra_model.remove_reactions(
+                [r for r in self._cobra_model.reactions if r.id in overlay.removed])
+        self.add_metabolites_and_reactions(overlay.metabolites.values(),
+                                           overlay.reactions.values())
+        for rid, (lb, ub) in overlay.bounds.items():
+            r = self._cobra_model.reactions.get_by_id(rid)
+            r.lower_bound = lb
+            r.upper_bound = ub
     
     @property
     def metabolites(self):
@@ -74,145 +426,375 @@ class Model(object):
     @property
     def reactions(self):
         return self.cobra_model.reactions
+
+    @property
+    def reaction_ids(self):
+        if self._base is None:
+            return [r.id for r in self._cobra_model.reactions]
+        return [rid for rid in self._base.reaction_ids
+                if rid not in self._overlay.removed] + \
+               list(self._overlay.reactions.keys())
+
+    @property
+    def metabolite_ids(self):
+        if self._base is None:
+            return [m.id for m in self._cobra_model.metabolites]
+        return self._base.metabolite_ids + list(self._overlay.metabolites.keys())
+
+    @property
+    def reaction_index(self):
+        """
+            A dictionary mapping each reaction ID to its column in the
+            stoichiometric matrix (and in the bound and objective vectors)
+        """
+        if self._reaction_index is None:
+            self._reaction_index = dict((rid, j) for j, rid
+                                        in enumerate(self.reaction_ids))
+        return self._reaction_index
+
+    @property
+    def metabolite_index(self):
+        """
+            A dictionary mapping each metabolite ID to its row in the
+            stoichiometric matrix
+        """
+        if self._metabolite_index is None:
+            self._metabolite_index = dict((cid, i) for i, cid
+                                          in enumerate(self.metabolite_ids))
+        return self._metabolite_index
+
+    @property
+    def exchange_reactions(self):
+        """
+            A dictionary mapping each metabolite (without the compartment
+            suffix, e.g. 'succ') to its exchange reaction ('EX_succ_e')
+        """
+        if self._exchange_reactions is None:
+            self._exchange_reactions = {}
+            self._add_exchange_reactions(self.reaction_ids)
+        return self._exchange_reactions
+
+    def _add_exchange_reactions(self, reaction_ids):
+        for rid in reaction_ids:
+            if rid.startswith('EX_') and rid.endswith('_e'):
+                self._exchange_reactions[rid[3:-2]] = rid
+
+    def _update_indexes(self, metabolite_ids, reaction_ids):
+        """
+            Add metabolites and reactions that were appended to the model to
+            the indexes that were already built
+        """
+        if self._metabolite_index is not None:
+            for cid in metabolite_ids:
+                self._metabolite_index[cid] = len(self._metabolite_index)
+        if self._reaction_index is not None:
+            for rid in reaction_ids:
+                self._reaction_index[rid] = len(self._reaction_index)
+        if self._exchange_reactions is not None:
+            self._add_exchange_reactions(reaction_ids)
+
+    def has_reaction(self, rid):
+        if self._base is None:
+            return rid in self._cobra_model.reactions
+        return rid in self._overlay.reactions or \
+            (rid in self._base.reaction_index and rid not in self._overlay.removed)
+
+    def has_metabolite(self, cid):
+        if self._base is None:
+            return cid in self._cobra_model.metabolites
+        return cid in self._overlay.metabolites or cid in self._base.metabolite_index
+
+    def get_metabolite(self, cid):
+        """
+            Returns the cobra metabolite with the given ID. For lightweight
+            clones, the metabolite is not part of any model and should be
+            used only for reading its properties (e.g. its formula).
+        """
+        if self._base is None:
+            if cid not in self._cobra_model.metabolites:
+                raise KeyError('Model does not have a metabolite with ID: ' + cid)
+            return self._cobra_model.metabolites.get_by_id(cid)
+        if cid in self._overlay.metabolites:
+            _, formula, name, compartment = self._overlay.metabolites[cid]
+            return Metabolite(id=cid, formula=Formula(formula),
+                              name=name, compartment=compartment)
+        if cid in self._base.metabolite_index:
+            return self._base.cobra_model.metabolites[self._base.metabolite_index[cid]]
+        raise KeyError('Model does not have a metabolite with ID: ' + cid)
+
+    def get_reaction(self, rid):
+        """
+            Returns the cobra reaction with the given ID (for lightweight
+            clones, this creates the full cobra model)
+        """
+        if not self.has_reaction(rid):
+            raise KeyError('Model does not have a reaction with ID: ' + rid)
+        return self.cobra_model.reactions.get_by_id(rid)
+
+    def get_carbon_count(self, cid):
+        """
+            Returns the number of carbon atoms in a metabolite
+        """
+        if self._base is not None and cid in self._base.carbon_counts:
+            return self._base.carbon_counts[cid]
+        if cid not in self._carbon_counts:
+            self._carbon_counts[cid] = self.get_metabolite(cid).elements.get('C', 0)
+        return self._carbon_counts[cid]
+
+    @property
+    def stoichiometric_matrix(self):
+        """
+            The stoichiometric matrix S (metabolites x reactions) as a sparse
+            CSR matrix, with rows and columns in the same order as
+            self.metabolite_ids and self.reaction_ids. It is cached until
+            metabolites or reactions are added or removed.
+        """
+        if self._stoichiometric_matrix is None:
+            if self._base is None:
+                self._stoichiometric_matrix = build_stoichiometric_matrix(
+                    self._cobra_model)
+            else:
+                self._stoichiometric_matrix = self._overlay_stoichiometric_matrix()
+        return self._stoichiometric_matrix
+
+    def _kept_columns(self):
+        return [j for j, rid in enumerate(self._base.reaction_ids)
+                if rid not in self._overlay.removed]
+
+    def _overlay_stoichiometric_matrix(self):
+        base, overlay = self._base, self._overlay
+        S = base.stoichiometric_matrix[:, self._kept_columns()]
+
+        n_mets = len(base.metabolite_ids) + len(overlay.metabolites)
+        met_index = dict(base.metabolite_index)
+        for cid in overlay.metabolites.keys():
+            met_index[cid] = len(met_index)
+        rows, cols, data = [], [], []
+        for j, (_, _, sprs, _, _) in enumerate(overlay.reactions.values()):
+            for cid, coeff in sprs.items():
+                if coeff != 0:
+                    rows.append(met_index[cid])
+                    cols.append(j)
+                    data.append(coeff)
+        S_added = sparse.csr_matrix((data, (rows, cols)), dtype=float,
+                                    shape=(n_mets, len(overlay.reactions)))
+        S = sparse.vstack([S, sparse.csr_matrix((n_mets - S.shape[0], S.shape[1]))])
+        return sparse.hstack([S, S_added]).tocsr()
+
+    def _overlay_vector(self, base_vector, added_index, bound_index=None):
+        """
+            Returns a vector with a value per reaction of a lightweight clone
+        """
+        overlay = self._overlay
+        vector = np.hstack([base_vector[self._kept_columns()],
+                            [args[added_index] for args in overlay.reactions.values()]])
+        if bound_index is not None and overlay.bounds:
+            column = self.reaction_index
+            for rid, bounds in overlay.bounds.items():
+                vector[column[rid]] = bounds[bound_index]
+        return vector.astype(float)
+
+    # for models that are not lightweight clones, the bound and objective
+    # vectors are not cached, since the bounds are often changed directly
+    # through the cobra reaction objects
+    @property
+    def lower_bounds(self):
+        if self._base is not None:
+            return self._overlay_vector(self._base_vectors[0], 3, 0)
+        return np.array([r.lower_bound for r in self.reactions], dtype=float)
+
+    @property
+    def upper_bounds(self):
+        if self._base is not None:
+            return self._overlay_vector(self._base_vectors[1], 4, 1)
+        return np.array([r.upper_bound for r in self.reactions], dtype=float)
+
+    @property
+    def objective_coefficients(self):
+        if self._base is not None:
+            # added reactions are never part of the objective
+            return np.hstack([self._base_vectors[2][self._kept_columns()],
+                              np.zeros(len(self._overlay.reactions))])
+        return np.array([r.objective_coefficient for r in self.reactions],
+                        dtype=float)
+
+    def _invalidate_cache(self):
+        self._stoichiometric_matrix = None
     
+    def add_metabolites_and_reactions(self, metabolites=(), reactions=()):
+        """
+            Adds many metabolites and reactions to the model at once, using a
+            single cobra call for each. Metabolites and reactions that are
+            already in the model are ignored.
+
+            Args:
+                metabolites - (ID, formula, name, compartment) tuples
+                reactions   - (ID, name, sparse, lower bound, upper bound)
+                              tuples, where sparse maps metabolite IDs to
+                              stoichiometric coefficients
+        """
+        new_metabolites = OrderedDict()
+        for args in metabolites:
+            if not self.has_metabolite(args[0]):
+                new_metabolites.setdefault(args[0], tuple(args))
+
+        new_reactions = OrderedDict()
+        for rid, name, sparse, lower_bound, upper_bound in reactions:
+            for key in sparse.keys():
+                if key not in new_metabolites and not self.has_metabolite(key):
+                    raise Exception("cannot find the cytoplasmic metabolite %s in the model" % key)
+            if not self.has_reaction(rid):
+                new_reactions.setdefault(rid, (rid, name, dict(sparse),
+                                               lower_bound, upper_bound))
+
+        if not new_metabolites and not new_reactions:
+            return
+        self._invalidate_cache()
+        self._update_indexes(new_metabolites.keys(), new_reactions.keys())
+
+        if self._base is not None:
+            # lightweight clones only record the changes
+            self._overlay.metabolites.update(new_metabolites)
+            self._overlay.reactions.update(new_reactions)
+            return
+
+        self._detach_clones()
+        self._cobra_model.add_metabolites(
+            [Metabolite(id=cid, formula=Formula(formula), name=name,
+                        compartment=compartment)
+             for cid, formula, name, compartment in new_metabolites.values()])
+
+        met_dict = self._cobra_model.metabolites
+        new_cobra_reactions = []
+        for rid, name, sparse, lower_bound, upper_bound in new_reactions.values():
+            reaction = Reaction(rid, name=name)
+            reaction.add_metabolites(dict((met_dict.get_by_id(key), val)
+                                          for key, val in sparse.items()))
+            reaction.lower_bound = lower_bound
+            reaction.upper_bound = upper_bound
+            new_cobra_reactions.append(reaction)
+        self._cobra_model.add_reactions(new_cobra_reactions)
+
     def add_metabolite(self, cid, formula, name, compartment='C'):
-        try:
-            self.metabolites.index(cid)
-        except ValueError:
-            met = Metabolite(id=cid, formula=Formula(formula),
-                             name=name, compartment=compartment)
-            self.cobra_model.add_metabolites([met])
+        self.add_metabolites_and_reactions(
+            metabolites=[(cid, formula, name, compartment)])
     
     def knockout_reactions(self, ko_reactions):
         for r in ko_reactions.split(','):
-            self.cobra_model.remove_reactions(r)
+            if self._base is None:
+                self._detach_clones()
+                self._cobra_model.remove_reactions(r)
+            elif r in self._overlay.reactions:
+                del self._overlay.reactions[r]
+                self._overlay.bounds.pop(r, None)
+            elif self.has_reaction(r):
+                self._overlay.removed.add(r)
+                self._overlay.bounds.pop(r, None)
+            else:
+                raise KeyError('Model does not have a reaction with ID: ' + r)
+            if self._exchange_reactions is not None and \
+                    self._exchange_reactions.get(r[3:-2]) == r:
+                del self._exchange_reactions[r[3:-2]]
+        self._invalidate_cache()
+        # the columns of the following reactions have changed
+        self._reaction_index = None
     
     def add_reaction(self, rid, name, sparse,
                      lower_bound=0, upper_bound=1000):
         """
-            Adds a reaction to the model
+            Adds a reaction to the model. Returns the cobra reaction, or None
+            for lightweight clones.
         """
-        # convert the sparse representation using the metabolites in the model
-        for key in sparse.keys():
-            if key not in self.metabolites:
-                raise Exception("cannot find the cytoplasmic metabolite %s in the model" % key)
-    
-        r = dict([(self.metabolites[self.metabolites.index(key)], val)
-                  for key, val in sparse.items()])
-        reaction = Reaction(name)
-        reaction.id = rid
-        reaction.add_metabolites(r)
-        reaction.lower_bound = lower_bound
-        reaction.upper_bound = upper_bound
-        self.cobra_model.add_reactions([reaction])
-        return reaction
+        self.add_metabolites_and_reactions(
+            reactions=[(rid, name, sparse, lower_bound, upper_bound)])
+        if self._base is not None:
+            return None
+        return self._cobra_model.reactions.get_by_id(rid)
             
     def knockin_reactions(self, ki_reactions, lower_bound=0, upper_bound=1000):
+        """
+            Adds reactions from the knockin library (see get_knockin_library)
+            together with the metabolites they need, all at once. IDs of the
+            form 'EX_<metabolite>' add an exchange reaction (and a transport
+            reaction) for the cytoplasmic metabolite.
+        """
+        library_metabolites, library_reactions = get_knockin_library()
+        metabolites = OrderedDict()
+        reactions = []
         for rid in ki_reactions.split(','):
             if rid.startswith('EX_'):
-                rid = rid[3:]
-                self.add_metabolite_exchange(rid, lower_bound, upper_bound)
-            elif rid == 'PRK':
-                self.add_metabolite('rubp_D_c', 'C5H12O11P2', 'D-ribulose 1,5-bisphosphate')
-                sprs = {'ru5p_D_c' : -1, 'atp_c' : -1, 'rubp_D_c' : 1, 'adp_c' : 1}
-                self.add_reaction(rid, 'phosphoribulokinase', sprs, lower_bound, upper_bound)
-            elif rid == 'RBC':
-                self.add_metabolite('rubp_D_c', 'C5H12O11P2', 'D-ribulose 1,5-bisphosphate')
-                sprs = {'rubp_D_c' : -1, 'h2o_c' : -1, 'co2_c' : -1, '3pg_c' : 2, 'h_c' : 3}
-                self.add_reaction(rid, 'RuBisCO carboxylation', sprs, lower_bound, upper_bound)
-            elif rid == 'RBC':
-                self.add_metabolite('rubp_D_c', 'C5H12O11P2', 'D-ribulose 1,5-bisphosphate')
-                sprs = {'rubp_D_c' : -1, 'h2o_c' : -1, 'co2_c' : -1, '3pg_c' : 2, 'h_c' : 3}
-                self.add_reaction(rid, 'RuBisCO carboxylation', sprs, lower_bound, upper_bound)
-            elif rid == 'PRK+RBC':
-                sprs = {'ru5p_D_c' : -1, 'atp_c' : -1, 'h2o_c' : -1, 'co2_c' : -1, '3pg_c' : 2, 'h_c' : 3, 'adp_c' : 1}
-                self.add_reaction(rid, 'PRK+RuBisCO', sprs, lower_bound, upper_bound)
-            elif rid == 'EDD':
-                self.add_metabolite('2ddg6p_c', 'C6H8O9P', '2-dehydro-3-deoxy-D-gluconate 6-phosphate')
-                sprs = {'6pgc_c' : -1, 'h2o_c' : 1, '2ddg6p_c' : 1}
-                self.add_reaction(rid, '6-phosphogluconate dehydratase', sprs, lower_bound, upper_bound)
-            elif rid == 'EDA':
-                self.add_metabolite('2ddg6p_c', 'C6H8O9P', '2-dehydro-3-deoxy-D-gluconate 6-phosphate')
-                sprs = {'2ddg6p_c' : -1, 'g3p_c' : 1, 'pyr_c' : 1}
-                self.add_reaction(rid, '2-dehydro-3-deoxy-phosphogluconate aldolase', sprs, lower_bound, upper_bound)
-            elif rid == 'PKT':
-                sprs = {'f6p_c' : -1, 'pi_c' : -1, 'e4p_c' : 1, 'actp_c' : 1, 'h2o_c' : 1}
-                self.add_reaction(rid, 'phosphoketolase', sprs, lower_bound, upper_bound)
-            elif rid == 'RED':
-                sprs = {'nad_c' : -1, 'nadh_c' : 1}
-                self.add_reaction(rid, 'free_e', sprs, lower_bound, upper_bound)            
-            elif rid == 'ATP':
-                sprs = {'adp_c' : -1, 'atp_c' : 1}
-                self.add_reaction(rid, 'free_e', sprs, lower_bound, upper_bound)            
-            elif rid == 'DXS':
-                sprs = {'3pg_c':-1, 'pyr_c':-1}
-                self.add_reaction(rid, 'deoxyribose synthase', sprs, lower_bound, upper_bound)
-            elif rid == 'MCS':
-                self.add_metabolite('malcoa_c', 'C25H40N7O20P3S', 'Malyl-CoA')
-                sprs = {'mal_L_c':-1, 'atp_c':-1, 'coa_c':-1, 'malcoa_c':1, 'adp_c':1, 'pi_c':1}
-                self.add_reaction(rid, 'malyl-CoA synthase', sprs, lower_bound, upper_bound)
-            elif rid == 'MCL':
-                self.add_metabolite('malcoa_c', 'C25H40N7O20P3S', 'Malyl-CoA')
-                sprs = {'malcoa_c':-1, 'accoa_c':1, 'glx_c':1}
-                self.add_reaction(rid, 'malyl-CoA lyase', sprs, lower_bound, upper_bound)
-            elif rid == 'SBP':
-                self.add_metabolite('sbp_c', 'C7H16O13P2', 'D-sedoheptulose 1,7-bisphosphate')
-                sprs = {'sbp_c':-1, 'h2o_c':-1, 's7p_c':1, 'pi_c':1}
-                self.add_reaction(rid, 'sedoheptulose bisphosphate phosphatase', sprs, lower_bound, upper_bound)
-            elif rid == 'SBA':
-                self.add_metabolite('sbp_c', 'C7H16O13P2', 'D-sedoheptulose 1,7-bisphosphate')
-                sprs = {'sbp_c':1, 'g3p_c':-1, 'e4p_c':-1}
-                self.add_reaction(rid, 'sedoheptulose bisphosphate aldolase', sprs, lower_bound, upper_bound)
-            elif rid == 'MEDH':
-                self.add_metabolite('methanol_c', 'CH4O', 'methanol')
-                self.add_metabolite('formaldehyde_c', 'CH2O', 'formaldehyde')
-                sprs = {'methanol_c' : -1, 'nad_c' : -1, 'formaldehyde_c' : 1, 'nadh_c' : 1}
-                self.add_reaction(rid, 'methanol dehydrogenase', sprs, lower_bound, upper_bound)
-            elif rid == 'H6PS':
-                self.add_metabolite('hexulose6p_c', 'CH4O', 'D-hexulose 6-phosphate')
-                sprs = {'ru5p_D_c' : -1, 'formaldehyde_c' : -1, 'hexulose6p_c' : 1}
-                self.add_reaction(rid, 'hexulose-6-phosphate synthetase', sprs, lower_bound, upper_bound)
-            elif rid == 'H6PI':
-                self.add_metabolite('hexulose6p_c', 'CH4O', 'D-hexulose 6-phosphate')
-                sprs = {'hexulose6p_c' : -1, 'f6p_c' : 1}
-                self.add_reaction(rid, 'hexulose-6-phosphate isomerase', sprs, lower_bound, upper_bound)
-            elif rid == 'H4MPTP':
-                self.add_metabolite('formaldehyde_c', 'CH2O', 'formaldehyde')
-                self.add_metabolite('for_c', 'CH2O2', 'formate')
-                sprs = {'formaldehyde_c' : -1, 'for_c' : 1}
-                self.add_reaction(rid, 'methylene tetrahydromethanopterin pathway', sprs, lower_bound, upper_bound)
-            elif rid == 'FDH':
-                sprs = {'for_c' : -1, 'nad_c': -1, 'co2_c' : 1, 'nadh_c': 1}
-                self.add_reaction(rid, 'formate dehydrogenase', sprs, lower_bound, upper_bound)
+                mets, rxns = self._get_exchange(rid[3:], lower_bound,
+                                                upper_bound, metabolites)
+                for args in mets:
+                    metabolites.setdefault(args[0], args)
+                reactions += rxns
+            elif rid in library_reactions:
+                name, sprs = library_reactions[rid]
+                for cid in sprs.keys():
+                    if cid in library_metabolites:
+                        formula, met_name = library_metabolites[cid]
+                        metabolites.setdefault(cid, (cid, formula, met_name, 'C'))
+                reactions.append((rid, name, sprs, lower_bound, upper_bound))
             else:
                 raise Exception('unknown knockin reaction: ' + rid)
-                
+        self.add_metabolites_and_reactions(metabolites.values(), reactions)
+
+    def _get_exchange(self, metabolite, lower_bound, upper_bound,
+                      new_metabolites={}):
+        """
+            Returns the metabolites and reactions (in the format of
+            add_metabolites_and_reactions) needed for exchanging a
+            cytoplasmic metabolite, which is either in the model or in
+            new_metabolites
+        """
+        cid = metabolite + '_c'
+        if cid in new_metabolites:
+            _, formula, name, _ = new_metabolites[cid]
+        else:
+            met = self.get_metabolite(cid)
+            formula, name = str(met.formula), met.name
+
+        metabolites = [(metabolite + '_e', formula, name, 'E')]
+        reactions = [(metabolite + '_transport', name + ' permease',
+                      {cid : -1, metabolite + '_e' : 1}, -1000, 1000),
+                     ('EX_' + metabolite + '_e', name + ' exchange',
+                      {metabolite + '_e' : -1}, lower_bound, upper_bound)]
+        return metabolites, reactions
+
     def add_metabolite_exchange(self, metabolite, lower_bound, upper_bound=0):
-        try:
-            met = self.metabolites[self.metabolites.index(metabolite + '_c')]
-        except AttributeError:
-            raise KeyError('Model does not have a metabolite with ID: ' + metabolite)
-        
-        self.add_metabolite(metabolite + '_e', str(met.formula), met.name, 'E')
-        self.add_reaction(metabolite + '_transport', met.name + ' permease',
-                     {metabolite + '_c' : -1, metabolite + '_e' : 1}, -1000, 1000)
-                     
-        self.add_reaction('EX_' + metabolite + '_e', met.name + ' exchange',
-                     {metabolite + '_e' : -1}, lower_bound, upper_bound)
+        self.add_metabolites_and_reactions(
+            *self._get_exchange(metabolite, lower_bound, upper_bound))
     
+    def set_reaction_bounds(self, rid, lower_bound, upper_bound):
+        """
+            Change the bounds of a reaction (for lightweight clones, the
+            change is only recorded)
+        """
+        if self._base is None:
+            r = self.get_reaction(rid)
+            r.lower_bound = lower_bound
+            r.upper_bound = upper_bound
+        elif self.has_reaction(rid):
+            self._overlay.bounds[rid] = (lower_bound, upper_bound)
+        else:
+            raise KeyError('Model does not have a reaction with ID: ' + rid)
+
     def set_exchange_bounds(self, metabolite, lower_bound, upper_bound=0):
-        rxns = dict([(r.id, r) for r in self.cobra_model.reactions])
-        try:
-            rxns['EX_' + metabolite + '_e'].lower_bound = lower_bound
-            rxns['EX_' + metabolite + '_e'].upper_bound = upper_bound
-        except KeyError:
+        if self._base is not None:
+            # avoid building the exchange index of every clone
+            rid = 'EX_' + metabolite + '_e'
+            if not self.has_reaction(rid):
+                rid = None
+        else:
+            rid = self.exchange_reactions.get(metabolite)
+
+        if rid is None:
             self.add_metabolite_exchange(metabolite, lower_bound, upper_bound)
+        else:
+            self.set_reaction_bounds(rid, lower_bound, upper_bound)
     
     def set_single_precursor_objective(self, metabolite, lower_bound=0, upper_bound=1000):
-        try:
-            met = self.metabolites[self.metabolites.index(metabolite + '_c')]
-        except AttributeError:
-            raise KeyError('Model does not have a metabolite with ID: ' + metabolite)
+        met = self.get_metabolite(metabolite + '_c')
         
         for r in self.cobra_model.reactions:
             r.objective_coefficient = 0
@@ -225,5 +807,139 @@ class Model(object):
                              {metabolite + '_c' : -1}, lower_bound, upper_bound)
         r.objective_coefficient = 1
         
+    def compress(self, blocked_reactions=(), keep=(),
+                 tolerance=COMPRESSION_TOLERANCE):
+        """
+            Returns a compressed copy of this model, which has the same
+            steady-state flux space (projected on its reactions), but fewer
+            reactions and metabolites, and therefore a much smaller OptKnock
+            MILP. The compression is repeated until nothing changes:
+                - blocked reactions are removed: those that are given (e.g.
+                  found by flux_variability.find_blocked_reactions), those
+                  using a dead-end metabolite (which can only be produced or
+                  only be consumed, given the reaction bounds), those with
+                  a zero row in the kernel of S, and enzyme subsets whose
+                  bounds cannot be satisfied together with a non-zero flux
+                - every enzyme subset (including linear chains) is lumped
+                  into a single reaction, named after its first member and
+                  with the intersection of the (scaled) bounds of its members
+                - metabolites that are left without reactions are removed
+
+            The objective reactions and the reactions in 'keep' (e.g. the
+            target reaction) are never lumped. Bounds should be set (e.g. the
+            carbon sources) before compressing, since closed reactions are
+            removed.
+
+            The reaction_map attribute of the compressed model maps each one
+            of its reactions to the original reactions (and their flux
+            relative to it). Use decompress_knockouts() to map knockouts
+            found on the compressed model back to the original reactions, or
+            knockout_designs.find_compressed_design to do all of this in one
+            step.
+        """
+        reaction_ids = self.reaction_ids
+        S = self.stoichiometric_matrix.tocsc()
+        lb = self.lower_bounds
+        ub = self.upper_bounds
+        c = self.objective_coefficients
+        fixed = set(keep).union(rid for rid, coeff in zip(reaction_ids, c)
+                                if coeff != 0)
+
+        active = [j for j, rid in enumerate(reaction_ids)
+                  if rid not in set(blocked_reactions) and
+                  (lb[j] < 0 or ub[j] > 0)]
+        while True:
+            n_active = len(active)
+
+            # remove reactions using dead-end metabolites
+            S_active = S[:, active].tocsr()
+            dead_ends = set()
+            for row in sparse_rows(S_active):
+                produced = any((coeff > 0 and ub[active[k]] > 0) or
+                               (coeff < 0 and lb[active[k]] < 0)
+                               for k, coeff in row)
+                consumed = any((coeff < 0 and ub[active[k]] > 0) or
+                               (coeff > 0 and lb[active[k]] < 0)
+                               for k, coeff in row)
+                if row and not (produced and consumed):
+                    dead_ends.update(k for k, _ in row)
+            active = [j for k, j in enumerate(active) if k not in dead_ends]
+            if len(active) < n_active:
+                continue
+
+            # find the enzyme subsets, and remove the blocked ones
+            blocked, subsets = find_enzyme_subsets(S[:, active], tolerance)
+            blocked = set(blocked)
+            lumped = []
+            for subset in subsets:
+                members = [(active[k], f) for k, f in subset
+                           if reaction_ids[active[k]] not in fixed]
+                lumped += [[(active[k], 1.0)] for k, f in subset
+                           if reaction_ids[active[k]] in fixed]
+                if not members:
+                    continue
+                j0, f0 = members[0]
+                members = [(j, f / f0) for j, f in members]
+                lower = max(min(lb[j] / f, ub[j] / f) for j, f in members)
+                upper = min(max(lb[j] / f, ub[j] / f) for j, f in members)
+                if upper < lower - tolerance:
+                    raise Exception('The bounds of the reactions %s cannot be '
+                                    'satisfied together' %
+                                    ','.join(reaction_ids[j] for j, _ in members))
+                if abs(lower) <= tolerance and abs(upper) <= tolerance:
+                    blocked.update(k for k, _ in subset)
+                else:
+                    lumped.append(members)
+            active = [j for k, j in enumerate(active) if k not in blocked]
+            if len(active) == n_active:
+                break
+
+        # build the compressed model, keeping the original reaction order
+        lumped.sort(key=lambda members: members[0][0])
+        compressed = Model()
+        compressed.cobra_model = cobra.core.Model(self.cobra_model.id)
+        compressed.reaction_map = OrderedDict()
+        columns = list(sparse_rows(S.T.tocsr()))
+        metabolite_ids = self.metabolite_ids
+        for members in lumped:
+            stoichiometry = {}
+            for j, f in members:
+                for i, coeff in columns[j]:
+                    cid = metabolite_ids[i]
+                    stoichiometry[cid] = stoichiometry.get(cid, 0) + f * coeff
+            stoichiometry = dict((cid, _round_coefficient(coeff, tolerance))
+                                 for cid, coeff in stoichiometry.items()
+                                 if abs(coeff) > tolerance)
+            for cid in sorted(stoichiometry.keys()):
+                if not compressed.has_metabolite(cid):
+                    met = self.get_metabolite(cid)
+                    compressed.add_metabolite(cid, str(met.formula), met.name,
+                                              met.compartment)
+
+            rid = reaction_ids[members[0][0]]
+            lower = max(min(lb[j] / f, ub[j] / f) for j, f in members)
+            upper = min(max(lb[j] / f, ub[j] / f) for j, f in members)
+            name = '+'.join(reaction_ids[j] for j, _ in members)
+            r = compressed.add_reaction(rid, name, stoichiometry, lower, upper)
+            r.objective_coefficient = sum(f * c[j] for j, f in members)
+            compressed.reaction_map[rid] = [(reaction_ids[j], f)
+                                            for j, f in members]
+        return compressed
+
+    def decompress_knockouts(self, knockouts):
+        """
+            Maps a comma-separated list of knockouts of a compressed model to
+            the original reactions. Knocking out any of the members of a
+            lumped reaction has the same effect, so each knockout is mapped
+            to all of them.
+
+            Returns:
+                a list with the list of original reaction IDs of each knockout
+        """
+        if self.reaction_map is None:
+            raise Exception('This model was not created by Model.compress()')
+        return [[rid for rid, _ in self.reaction_map[ko]]
+                for ko in knockouts.split(',') if ko != '']
+
     def solve(self):
         return self.cobra_model.solve()
\ No newline at end of file
@@ -1,144 +1,258 @@
+import warnings
 import numpy as np
-from copy import deepcopy
+from collections import OrderedDict
 from pulp import LpProblem, LpMaximize, LpMinimize, LpVariable, LpAffineExpression,\
                  solvers, LpContinuous, LpBinary, LpStatusOptimal, lpSum, LpStatus
 from cobra.core import Solution
-from python.models import Model
-import sys
-import pandas as pd
-from itertools import combinations
+from python import knockout_scan, knockout_designs, phase_plane, flux_variability, profiling, \
+                   glpk_session, result_cache
+from python.models import sparse_rows
 
 M = 1000
 
-class OptKnock(object):
+class OptKnock(result_cache.CachedResults):
 
     def __init__(self, model, solver, verbose=False):
-        self.model = deepcopy(model)
         self.verbose = verbose
         self.solver = solver
 
-        # locate the biomass reaction
-        biomass_reactions = [r for r in self.model.reactions
-                             if r.objective_coefficient != 0]
-        if len(biomass_reactions) != 1:
+        # the wall time of each phase and the solver statistics
+        self.profile = profiling.Profile()
+        with self.profile.timer('model copy'):
+            # a lightweight clone, the problems are built from its arrays and
+            # indexes, so its full cobra model is never created (unless the
+            # names of the reactions are printed)
+            self.model = model.clone()
+
+            # locate the biomass reaction
+            biomass_indices = np.nonzero(self.model.objective_coefficients)[0]
+        if len(biomass_indices) != 1:
             raise Exception('There should be only one single biomass reaction')
-        self.r_biomass = biomass_reactions[0]
+        self.biomass_id = self.model.reaction_ids[biomass_indices[0]]
         
         self.has_flux_as_variables = False
-    
+        self.warm_start = False
+
+        # the flux range of each reaction (found by find_flux_ranges), used
+        # to tighten the big-M constraints of the OptKnock MILP
+        self.flux_ranges = None
+
+        # the wild-type bounds of reactions changed by prepare_optslope
+        self.wt_bounds = {}
+        self.n_integer_cuts = 0
+
     def create_prob(self, sense=LpMaximize):
         # create the LP
         self.prob = LpProblem('OptKnock', sense=sense)
-        self.prob.solver = self.solver(msg=self.verbose)
+        self.prob.solver = self.create_solver()
         if not self.prob.solver.available():
             raise Exception("solver not available")
 
+    def create_solver(self):
+        if not self.warm_start or self.solver is glpk_session.GLPK_API:
+            # (the in-process GLPK solver always starts from the basis of
+            # the previous solve)
+            return self.solver(msg=self.verbose)
+        try:
+            return self.solver(msg=self.verbose, warmStart=True)
+        except TypeError:
+            # this solver does not accept the warmStart option
+            pass
+
+        # GLPK writes the problem to a file and starts from scratch, so the
+        # in-process GLPK solver is used instead (if swiglpk is installed)
+        if issubclass(self.solver, solvers.GLPK):
+            solver = glpk_session.GLPK_API(msg=self.verbose)
+            if solver.available():
+                return solver
+        warnings.warn('The solver %s cannot warm start, every solve will '
+                      'start from scratch' % self.solver.__name__)
+        return self.solver(msg=self.verbose)
+
+    def enable_warm_start(self):
+        """
+            Start each solve from the solution of the previous one. PuLP
+            passes the previous solution only to solvers that accept the
+            warmStart option (as a MIP start). The file-based GLPK solver
+            always starts from scratch, so it is replaced by the in-process
+            'glpk_api' solver (see glpk_session), which starts from the basis
+            of the previous solve of the same problem. For other solvers that
+            cannot warm start, a warning is issued.
+        """
+        self.warm_start = True
+        if hasattr(self, 'prob'):
+            self.prob.solver = self.create_solver()
+
     def add_primal_variables_and_constraints(self):
-        # create the continuous flux variables (can be positive or negative)
-        self.var_v = {}
-        for r in self.model.reactions:
-            self.var_v[r] = LpVariable("v_%s" % r.id,
-                                       lowBound=r.lower_bound,
-                                       upBound=r.upper_bound,
-                                       cat=LpContinuous)
+        # create the continuous flux variables (can be positive or negative),
+        # keyed by the reaction IDs
+        reaction_ids = self.model.reaction_ids
+        with self.profile.timer('variables'):
+            self.var_v = {}
+            for rid, lb, ub in zip(reaction_ids, self.model.lower_bounds,
+                                   self.model.upper_bounds):
+                self.var_v[rid] = LpVariable("v_%s" % rid,
+                                             lowBound=lb,
+                                             upBound=ub,
+                                             cat=LpContinuous)
 
         # this flag will be used later to know if to expect the flux
         # variables to exist
         self.has_flux_as_variables = True
         
         # add the mass-balance constraints to each of the metabolites (S*v = 0)
-        for m in self.model.metabolites:
-            S_times_v = LpAffineExpression([(self.var_v[r], r.get_coefficient(m))
-                                            for r in m.reactions])
-            self.prob.addConstraint(S_times_v == 0, 'mass_balance_%s' % m.id)
+        # using the rows of the sparse stoichiometric matrix
+        with self.profile.timer('constraints'):
+            v = [self.var_v[rid] for rid in reaction_ids]
+            S = self.model.stoichiometric_matrix
+            for cid, row in zip(self.model.metabolite_ids, sparse_rows(S)):
+                S_times_v = LpAffineExpression([(v[j], coeff) for j, coeff in row])
+                self.prob.addConstraint(S_times_v == 0, 'mass_balance_%s' % cid)
     
     def add_dual_variables_and_constraints(self):
         # create dual variables associated with stoichiometric constraints
-        self.var_lambda = dict([(m, LpVariable("lambda_%s" % m.id, 
-                                               lowBound=-M,
-                                               upBound=M,
-                                               cat=LpContinuous))
-                                for m in self.model.metabolites])
-
-        # create dual variables associated with the constraints on the primal fluxes
-        self.var_w_U = dict([(r, LpVariable("w_U_%s" % r.id, lowBound=0, upBound=M, cat=LpContinuous))
-                             for r in self.model.reactions])
-        self.var_w_L = dict([(r, LpVariable("w_L_%s" % r.id, lowBound=0, upBound=M, cat=LpContinuous))
-                             for r in self.model.reactions])
-
-        # add the dual constraints:
+        reaction_ids = self.model.reaction_ids
+        metabolite_ids = self.model.metabolite_ids
+        with self.profile.timer('variables'):
+            self.var_lambda = dict([(cid, LpVariable("lambda_%s" % cid, 
+                                                     lowBound=-M,
+                                                     upBound=M,
+                                                     cat=LpContinuous))
+                                    for cid in metabolite_ids])
+
+            # create dual variables associated with the constraints on the primal fluxes
+            # (their upper bound is 0 for flux bounds that are never reached)
+            self.var_w_U = {}
+            self.var_w_L = {}
+            for rid, lb, ub in zip(reaction_ids, self.model.lower_bounds,
+                                   self.model.upper_bounds):
+                _, _, w_L_max, w_U_max, _, _ = self.get_big_M_bounds(rid, lb, ub)
+                self.var_w_U[rid] = LpVariable("w_U_%s" % rid, lowBound=0, upBound=w_U_max, cat=LpContinuous)
+                self.var_w_L[rid] = LpVariable("w_L_%s" % rid, lowBound=0, upBound=w_L_max, cat=LpContinuous)
+
+        # add the dual constraints (using the rows of the transposed
+        # stoichiometric matrix):
         #   S'*lambda + w_U - w_L = c_biomass
-        for r in self.model.reactions:
-            S_times_lambda = LpAffineExpression([(self.var_lambda[m], coeff)
-                                                 for m, coeff in r._metabolites.iteritems()
-                                                 if coeff != 0])
-            row_sum = S_times_lambda + self.var_w_U[r] - self.var_w_L[r]
-            self.prob.addConstraint(row_sum == r.objective_coefficient, 'dual_%s' % r.id)
+        with self.profile.timer('constraints'):
+            lam = [self.var_lambda[cid] for cid in metabolite_ids]
+            S_T = self.model.stoichiometric_matrix.transpose().tocsr()
+            c = self.model.objective_coefficients
+            for j, (rid, row) in enumerate(zip(reaction_ids, sparse_rows(S_T))):
+                row_sum = LpAffineExpression([(lam[i], coeff) for i, coeff in row] +
+                                             [(self.var_w_U[rid], 1), (self.var_w_L[rid], -1)])
+                self.prob.addConstraint(row_sum == c[j], 'dual_%s' % rid)
                                    
     def prepare_FBA_primal(self, use_glpk=False):
         """
             Run standard FBA (primal)
         """
-        self.create_prob(sense=LpMaximize, use_glpk=use_glpk)
+        self.create_prob(sense=LpMaximize)
         self.add_primal_variables_and_constraints()
-        self.prob.setObjective(self.var_v[self.r_biomass])
+        with self.profile.timer('objective'):
+            self.prob.setObjective(self.var_v[self.biomass_id])
 
     def prepare_FBA_dual(self, use_glpk=False):
         """
             Run shadow FBA (dual)
         """
-        self.create_prob(sense=LpMinimize, use_glpk=use_glpk)
+        self.create_prob(sense=LpMinimize)
         self.add_dual_variables_and_constraints()
         
-        w_sum = LpAffineExpression([(self.var_w_U[r], r.upper_bound)
-                                    for r in self.model.reactions if r.upper_bound != 0] +
-                                   [(self.var_w_L[r], -r.lower_bound)
-                                    for r in self.model.reactions if r.lower_bound != 0])
-        self.prob.setObjective(w_sum)
+        bounds = list(zip(self.model.reaction_ids, self.model.lower_bounds,
+                          self.model.upper_bounds))
+        w_sum = LpAffineExpression([(self.var_w_U[rid], ub)
+                                    for rid, lb, ub in bounds if ub != 0] +
+                                   [(self.var_w_L[rid], -lb)
+                                    for rid, lb, ub in bounds if lb != 0])
+        with self.profile.timer('objective'):
+            self.prob.setObjective(w_sum)
     
     def get_reaction_by_id(self, reaction_id):
-        if reaction_id not in self.model.reactions:
+        """
+            Returns the key of the variables of the reaction (its ID), or
+            None if the reaction is not in the model
+        """
+        if not self.model.has_reaction(reaction_id):
             return None
-        reaction_ind = self.model.reactions.index(reaction_id)
-        reaction = self.model.reactions[reaction_ind]
-        return reaction
+        return reaction_id
+
+    def set_reaction_bounds(self, reaction_id, lower_bound, upper_bound):
+        """
+            Change the bounds of a flux variable in the prepared problem
+            (the model itself is not changed). Returns the previous bounds,
+            so that the change can be reverted later.
+        """
+        if self.get_reaction_by_id(reaction_id) is None:
+            raise KeyError('Model does not have a reaction with ID: ' + reaction_id)
+        var = self.var_v[reaction_id]
+        old_bounds = (var.lowBound, var.upBound)
+        var.lowBound = lower_bound
+        var.upBound = upper_bound
+        return old_bounds
         
     def add_optknock_variables_and_constraints(self):
         # create the binary variables indicating which reactions knocked out
-        self.var_y = dict([(r, LpVariable("y_%s" % r.id, cat=LpBinary))
-                           for r in self.model.reactions])
-
-        # create dual variables associated with the constraints on the primal fluxes
-        self.var_mu = dict([(r, LpVariable("mu_%s" % r.id, cat=LpContinuous))
-                             for r in self.model.reactions])
-
-        # equate the objectives of the primal and the dual of the inner problem
-        # to force its optimization:
-        #   sum_j mu_j - v_biomass = 0
-        constr = (lpSum(self.var_mu.values()) - self.var_v[self.r_biomass] == 0)
-        self.prob.addConstraint(constr, 'daul_equals_primal')
-
-        # add the knockout constraints (when y_j = 0, v_j has to be 0)
-        for r in self.model.reactions:
-            # L_jj * y_j <= v_j
-            self.prob.addConstraint(r.lower_bound * self.var_y[r] <= self.var_v[r], 'v_lower_%s' % r.id)
-            # v_j <= U_jj * y_j
-            self.prob.addConstraint(self.var_v[r] <= r.upper_bound * self.var_y[r], 'v_upper_%s' % r.id)
+        reaction_ids = self.model.reaction_ids
+        with self.profile.timer('variables'):
+            self.var_y = OrderedDict([(rid, LpVariable("y_%s" % rid, cat=LpBinary))
+                                      for rid in reaction_ids])
+
+            # create dual variables associated with the constraints on the primal fluxes
+            self.var_mu = OrderedDict([(rid, LpVariable("mu_%s" % rid, cat=LpContinuous))
+                                       for rid in reaction_ids])
+
+        with self.profile.timer('constraints'):
+            # equate the objectives of the primal and the dual of the inner problem
+            # to force its optimization:
+            #   sum_j mu_j - v_biomass = 0
+            constr = (lpSum(self.var_mu.values()) - self.var_v[self.biomass_id] == 0)
+            self.prob.addConstraint(constr, 'daul_equals_primal')
+
+            # add the knockout constraints (when y_j = 0, v_j has to be 0)
+            # using the flux range of each reaction if it is known (otherwise,
+            # its bounds), and M (or a tighter bound on mu_j) as the big-M values
+            for r, lb, ub in zip(reaction_ids, self.model.lower_bounds,
+                                 self.model.upper_bounds):
+                L, U, _, _, mu_min, mu_max = self.get_big_M_bounds(r, lb, ub)
+
+                # L_jj * y_j <= v_j
+                self.prob.addConstraint(L * self.var_y[r] <= self.var_v[r], 'v_lower_%s' % r)
+                # v_j <= U_jj * y_j
+                self.prob.addConstraint(self.var_v[r] <= U * self.var_y[r], 'v_upper_%s' % r)
             
-        # set the constraints on the auxiliary variables (mu):
-        #    mu_j == y_j * (U_jj * w_u_j - L_jj * w_l_j)
-        for r in self.model.reactions:
-            w_sum = LpAffineExpression([(self.var_w_U[r], r.upper_bound),
-                                        (self.var_w_L[r], -r.lower_bound)])
-
-            # mu_j + M*y_j >= 0
-            self.prob.addConstraint(self.var_mu[r] + M*self.var_y[r] >= 0, 'aux_1_%s' % r.id)
-            # -mu_j + M*y_j >= 0
-            self.prob.addConstraint(-self.var_mu[r] + M*self.var_y[r] >= 0, 'aux_2_%s' % r.id)
-            # mu_j - (U_jj * w_u_j - L_jj * w_l_j) + M*(1-y_j) >= 0
-            self.prob.addConstraint(self.var_mu[r] - w_sum + M*(1-self.var_y[r]) >= 0, 'aux_3_%s' % r.id)
-            # -mu_j + (U_jj * w_u_j - L_jj * w_l_j) + M*(1-y_j) >= 0
-            self.prob.addConstraint(-self.var_mu[r] + w_sum + M*(1-self.var_y[r]) >= 0, 'aux_4_%s' % r.id)
+                # set the constraints on the auxiliary variables (mu):
+                #    mu_j == y_j * (U_jj * w_u_j - L_jj * w_l_j)
+                w_sum = LpAffineExpression([(self.var_w_U[r], ub),
+                                            (self.var_w_L[r], -lb)])
+
+                # mu_j + M*y_j >= 0
+                self.prob.addConstraint(self.var_mu[r] - mu_min*self.var_y[r] >= 0, 'aux_1_%s' % r)
+                # -mu_j + M*y_j >= 0
+                self.prob.addConstraint(-self.var_mu[r] + mu_max*self.var_y[r] >= 0, 'aux_2_%s' % r)
+                # mu_j - (U_jj * w_u_j - L_jj * w_l_j) + M*(1-y_j) >= 0
+                self.prob.addConstraint(self.var_mu[r] - w_sum + mu_max*(1-self.var_y[r]) >= 0, 'aux_3_%s' % r)
+                # -mu_j + (U_jj * w_u_j - L_jj * w_l_j) + M*(1-y_j) >= 0
+                self.prob.addConstraint(-self.var_mu[r] + w_sum - mu_min*(1-self.var_y[r]) >= 0, 'aux_4_%s' % r)
+
+    def find_flux_ranges(self, n_threads=1):
+        """
+            Run FVA to find the flux range of every reaction, which is then
+            used (by the next prepare_optknock or prepare_optslope) to tighten
+            the big-M constraints of each reaction, instead of using M for
+            all of them (see flux_variability.get_big_M_bounds)
+        """
+        df = flux_variability.run_FVA(OptKnock, self.model, self.solver,
+                                      fraction_of_optimum=0,
+                                      n_threads=n_threads)
+        self.flux_ranges = dict((rid, (float(row.minimum), float(row.maximum)))
+                                for rid, row in df.iterrows())
+
+    def get_big_M_bounds(self, reaction_id, lower_bound, upper_bound):
+        if self.flux_ranges is None:
+            return lower_bound, upper_bound, M, M, -M, M
+        min_flux, max_flux = self.flux_ranges[reaction_id]
+        return flux_variability.get_big_M_bounds(
+            lower_bound, upper_bound, min_flux, max_flux, M)
 
     def add_knockout_bounds(self, ko_candidates=None, num_deletions=5):
         """ 
@@ -147,53 +261,102 @@ class OptKnock(object):
         """
         ko_candidate_sum_y = []
         
+        reaction_ids = self.model.reaction_ids
         if ko_candidates is None:
-            ko_candidates = [r for r in self.model.reactions if r != self.r_biomass]
-
-        for r in set(self.model.reactions).difference(ko_candidates):
-            # if 'r' is not a candidate constrain it to be 'active'
-            # i.e.   y_j == 1
-            self.prob.addConstraint(self.var_y[r] == 1, 'active_%s' % r.id)
+            ko_candidates = [rid for rid in reaction_ids if rid != self.biomass_id]
+        else:
+            # the candidates can be given as reactions or as reaction IDs
+            ko_candidates = [getattr(r, 'id', r) for r in ko_candidates]
+
+        with self.profile.timer('constraints'):
+            candidates = set(ko_candidates)
+            for rid in reaction_ids:
+                if rid not in candidates:
+                    # if 'rid' is not a candidate constrain it to be 'active'
+                    # i.e.   y_j == 1
+                    self.prob.addConstraint(self.var_y[rid] == 1, 'active_%s' % rid)
+
+            # set the upper bound on the number of knockouts (K)
+            #   sum (1 - y_j) <= K
+            self.n_ko_candidates = len(ko_candidates)
+            ko_candidate_sum_y = [(self.var_y[r], 1) for r in ko_candidates]
+            constr = (LpAffineExpression(ko_candidate_sum_y) >= len(ko_candidate_sum_y) - num_deletions)
+            self.prob.addConstraint(constr, 'number_of_deletions')
+
+    def supports_indicator_constraints(self):
+        """
+            PuLP cannot express indicator constraints (use the optlang
+            backend with CPLEX for them)
+        """
+        return False
 
-        # set the upper bound on the number of knockouts (K)
-        #   sum (1 - y_j) <= K
-        ko_candidate_sum_y = [(self.var_y[r], 1) for r in ko_candidates]
-        constr = (LpAffineExpression(ko_candidate_sum_y) >= len(ko_candidate_sum_y) - num_deletions)
-        self.prob.addConstraint(constr, 'number_of_deletions')
+    def check_indicator_support(self, use_indicators):
+        """
+            Returns use_indicators, unless the solver does not support
+            indicator constraints, in which case the big-M constraints are
+            used instead
+        """
+        if use_indicators and not self.supports_indicator_constraints():
+            print("The solver does not support indicator constraints, "
+                  "using big-M constraints instead")
+            return False
+        return use_indicators
+
+    def prepare_optknock(self, target_reaction_id, ko_candidates=None,
+                         num_deletions=5, use_glpk=False, prefilter=False,
+                         tighten_bounds=False, use_indicators=False):
+        if ko_candidates is None and prefilter:
+            ko_candidates = flux_variability.get_ko_candidates(
+                OptKnock, self.model, self.solver, verbose=self.verbose)
+        use_indicators = self.check_indicator_support(use_indicators)
 
-    def prepare_optknock(self, target_reaction_id, ko_candidates=None, 
-                         num_deletions=5, use_glpk=False):
         # find the target reaction
-        self.r_target = self.get_reaction_by_id(target_reaction_id)
+        self.target_id = self.get_reaction_by_id(target_reaction_id)
+        if tighten_bounds:
+            self.find_flux_ranges()
 
-        self.create_prob(sense=LpMaximize, use_glpk=use_glpk)
+        self.create_prob(sense=LpMaximize)
         self.add_primal_variables_and_constraints()
         self.add_dual_variables_and_constraints()
         self.add_optknock_variables_and_constraints()
 
         # add the objective of maximizing the flux in the target reaction
-        self.prob.setObjective(self.var_v[self.r_target])
+        with self.profile.timer('objective'):
+            self.prob.setObjective(self.var_v[self.target_id])
 
         self.add_knockout_bounds(ko_candidates, num_deletions)
 
     def prepare_optslope(self, target_reaction_id, ko_candidates=None,
-                         num_deletions=5, use_glpk=False):
+                         num_deletions=5, use_glpk=False, prefilter=False,
+                         tighten_bounds=False, use_indicators=False):
+        if ko_candidates is None and prefilter:
+            ko_candidates = flux_variability.get_ko_candidates(
+                OptKnock, self.model, self.solver, verbose=self.verbose)
+        use_indicators = self.check_indicator_support(use_indicators)
+
         # add the objective of maximizing the flux in the target reaction
-        self.r_target = self.get_reaction_by_id(target_reaction_id)
+        self.target_id = self.get_reaction_by_id(target_reaction_id)
 
         # set biomass maximum to 0
-        self.r_biomass.lower_bound = 0
-        self.r_biomass.upper_bound = 0
-        self.r_target.lower_bound = 0
-        self.r_target.upper_bound = 0
+        lower_bounds = self.model.lower_bounds
+        upper_bounds = self.model.upper_bounds
+        self.wt_bounds = {}
+        for rid in [self.biomass_id, self.target_id]:
+            j = self.model.reaction_index[rid]
+            self.wt_bounds[rid] = (lower_bounds[j], upper_bounds[j])
+            self.model.set_reaction_bounds(rid, 0, 0)
+        self.model_fingerprint = None
+        if tighten_bounds:
+            self.find_flux_ranges()
 
-        self.create_prob(sense=LpMaximize, use_glpk=use_glpk)
+        self.create_prob(sense=LpMaximize)
         self.add_primal_variables_and_constraints()
         self.add_dual_variables_and_constraints()
         self.add_optknock_variables_and_constraints()
 
         # set the objective as maximizing the shadow price of v_target upper bound
-        self.prob.setObjective(self.var_w_U[self.r_target] - self.var_w_L[self.r_target])
+        with self.profile.timer('objective'):
+            self.prob.setObjective(self.var_w_U[self.target_id] - self.var_w_L[self.target_id])
 
         self.add_knockout_bounds(ko_candidates, num_deletions)
 
@@ -201,7 +364,12 @@ class OptKnock(object):
         self.prob.writeLP(fname)
 
     def solve(self):
-        self.prob.solve()
+        self.from_cache = False
+        with self.profile.timer('solve'):
+            self.prob.solve()
+        self.profile.add_solver_statistics(**profiling.get_solver_statistics(
+            getattr(self.prob, 'solverModel', None),
+            type(self.prob.solver).__name__))
 
         if self.prob.status != LpStatusOptimal:
             if self.verbose:
@@ -211,7 +379,7 @@ class OptKnock(object):
                                      fluxes=None)
         else:
             if self.has_flux_as_variables:
-                x = [self.var_v[r].varValue for r in self.model.reactions]
+                x = [self.var_v[rid].varValue for rid in self.model.reaction_ids]
             else:
                 x = []
             self.solution = Solution(objective_value=self.prob.objective.value(),
@@ -220,6 +388,7 @@ class OptKnock(object):
         return self.solution
     
     def get_objective_value(self):
+        self.check_solution()
         if self.solution.status != LpStatusOptimal:
             return None
         else:
@@ -234,7 +403,7 @@ class OptKnock(object):
             print("List of reactions : ")
             for r in self.model.reactions:
                 print("%30s (%4g <= v <= %4g) : v = %6.3f" % \
-                    (r.name, r.lower_bound, r.upper_bound, self.var_v[r].varValue))
+                    (r.name, r.lower_bound, r.upper_bound, self.var_v[r.id].varValue))
 
     def print_dual_results(self, short=True):
         obj = self.get_objective_value()
@@ -246,52 +415,119 @@ class OptKnock(object):
             for r in self.model.reactions:
                 print("%30s (%4g <= v <= %4g) : w_L = %5.3f, w_U = %5.3f" % \
                     (r.id, r.lower_bound, r.upper_bound, 
-                     self.var_w_L[r].varValue, self.var_w_U[r].varValue))
+                     self.var_w_L[r.id].varValue, self.var_w_U[r.id].varValue))
             print("List of metabolites : ")
             for m in self.model.metabolites:
                 print("%30s : lambda = %5.3f, " % \
-                    (m.id, self.var_lambda[m].varValue))
+                    (m.id, self.var_lambda[m.id].varValue))
                 
     def print_optknock_results(self, short=True):
+        self.check_solution()
         if self.solution.status != LpStatusOptimal:
             return
         print("Objective : %6.3f" % self.prob.objective.value())
-        print("Biomass rate : %6.3f" % self.var_v[self.r_biomass].varValue)
+        print("Biomass rate : %6.3f" % self.var_v[self.biomass_id].varValue)
         print("Sum of mu : %6.3f" % np.sum([mu.varValue for mu in self.var_mu.values()]))
         print("Knockouts : ")
-        print('   ;   '.join(['"%s" (%s)' % (r.name, r.id) for r, val in self.var_y.iteritems() if val.varValue == 0]))
+        print('   ;   '.join(['"%s" (%s)' % (self.model.get_reaction(rid).name, rid)
+                              for rid, val in self.var_y.items() if val.varValue < 0.5]))
         if not short:
             print("List of reactions : ")
             for r in self.model.reactions:
                 print('%25s (%5s) : %4g  <=  v=%5g  <=  %4g ; y = %d ; mu = %g ; w_L = %5g ; w_U = %5g' % \
                     ('"' + r.name + '"', r.id,
-                     r.lower_bound, self.var_v[r].varValue, r.upper_bound,
-                     self.var_y[r].varValue, self.var_mu[r].varValue,
-                     self.var_w_L[r].varValue, self.var_w_U[r].varValue))
+                     r.lower_bound, self.var_v[r.id].varValue, r.upper_bound,
+                     self.var_y[r.id].varValue, self.var_mu[r.id].varValue,
+                     self.var_w_L[r.id].varValue, self.var_w_U[r.id].varValue))
             print("List of metabolites : ")
             for m in self.model.metabolites:
                 print("%30s : lambda = %6.3f" % \
-                    (m.id, self.var_lambda[m].varValue))
+                    (m.id, self.var_lambda[m.id].varValue))
 
     def get_optknock_knockouts(self):
-        return ','.join([r.id for r, val in self.var_y.iteritems() if val.varValue == 0])
+        self.check_solution()
+        return ','.join([rid for rid, val in self.var_y.items() if val.varValue < 0.5])
     
     def get_optknock_model(self):
+        self.check_solution()
         if self.solution.status != LpStatusOptimal:
             raise Exception('OptKnock failed, cannot generate a KO model')
         
-        optknock_model = deepcopy(self.model)
-        knockout_reactions = [r for r, val in self.var_y.iteritems() if val.varValue == 0]
-        for r in knockout_reactions:
-            new_r = optknock_model.reactions[optknock_model.reactions.index(r.id)]
-            new_r.lower_bound = 0
-            new_r.upper_bound = 0
+        optknock_model = self.model.clone()
+        knockout_reactions = [rid for rid, val in self.var_y.items() if val.varValue < 0.5]
+        for rid in knockout_reactions:
+            optknock_model.set_reaction_bounds(rid, 0, 0)
         return optknock_model
 
+    def get_knockout_model(self, knockouts):
+        """
+            Returns a copy of the wild-type model (i.e. without the changes
+            made by prepare_optslope) with the given knockouts (a
+            comma-separated list of reaction IDs)
+        """
+        model = self.model.clone()
+        for rid, (lb, ub) in self.wt_bounds.items():
+            model.set_reaction_bounds(rid, lb, ub)
+        if knockouts:
+            model.knockout_reactions(knockouts)
+        return model
+
+    def add_integer_cut(self, knockouts):
+        """
+            Exclude a knockout set from the solutions of the prepared
+            problem:
+                sum_{j in KO} y_j + sum_{j not in KO} (1 - y_j) >= 1
+        """
+        knockouts = set(knockouts)
+        self.n_integer_cuts += 1
+        with self.profile.timer('constraints'):
+            cut = LpAffineExpression([(var, 1 if r in knockouts else -1)
+                                      for r, var in self.var_y.items()])
+            self.prob.addConstraint(cut >= 1 - len(self.var_y) + len(knockouts),
+                                    'integer_cut_%d' % self.n_integer_cuts)
+
+    def enumerate_designs(self, n_designs=5, epsilon_bm=0.01):
+        """
+            Find the best n_designs knockout sets of the prepared problem,
+            using integer cuts (see knockout_designs.enumerate_designs)
+        """
+        return knockout_designs.enumerate_designs(self, n_designs, epsilon_bm)
+
+    def set_num_deletions(self, num_deletions):
+        """
+            Change the maximal number of knockouts (K) of the prepared
+            problem, by updating only the bound of its number_of_deletions
+            constraint
+        """
+        self.prob.constraints['number_of_deletions'].changeRHS(
+            self.n_ko_candidates - num_deletions)
+
+    def sweep_num_deletions(self, max_deletions, min_deletions=1,
+                            epsilon_bm=0.01):
+        """
+            Find the best knockout set of the prepared problem for every
+            number of knockouts (see knockout_designs.sweep_num_deletions)
+        """
+        return knockout_designs.sweep_num_deletions(
+            self, max_deletions, min_deletions, epsilon_bm)
+
+    def evaluate_design(self, knockouts, epsilon_bm=0.01):
+        """
+            Evaluate a knockout set on the wild-type model (see
+            knockout_designs.evaluate_design)
+        """
+        return knockout_designs.evaluate_design(
+            OptKnock, self.get_knockout_model(knockouts), self.solver,
+            self.target_id, epsilon_bm)
+
     def solve_FBA(self):
-        self.create_prob(sense=LpMaximize)
-        self.add_primal_variables_and_constraints()
-        self.prob.setObjective(self.var_v[self.r_biomass])
+        """
+            The maximal biomass production (see result_cache)
+        """
+        return self._cached(('FBA',), self._solve_FBA)
+
+    def _solve_FBA(self):
+        self.prepare_FBA_primal()
         self.solve()
         max_biomass = self.get_objective_value()
         return max_biomass
@@ -300,17 +536,36 @@ class OptKnock(object):
         """
             Run Flux Variability Analysis on the provided reaction
         """
-        self.create_prob(sense=LpMaximize)
-        self.add_primal_variables_and_constraints()
-        self.prob.setObjective(self.var_v[self.r_biomass])
-        self.solve()
-        max_biomass = self.get_objective_value()
+        max_biomass = self._solve_FBA()
         if max_biomass is None:
             raise Exception("Cannot run FVA because the model is infeasible")
-        self.var_v[self.r_biomass].lowBound = max_biomass - 1e-5
+        return self.get_flux_range(reaction_id, max_biomass - 1e-5)
+
+    def solve_batch_FVA(self, reaction_ids=None, fraction_of_optimum=1.0,
+                        n_threads=1, chunksize=None):
+        """
+            Run Flux Variability Analysis on many reactions (by default, on
+            all of them), building the problem only once per process.
+            Returns a DataFrame with the minimal and maximal flux of each
+            reaction (see flux_variability.run_FVA)
+        """
+        return flux_variability.run_FVA(OptKnock, self.model, self.solver,
+                                        reaction_ids, fraction_of_optimum,
+                                        n_threads, chunksize)
 
+    def get_flux_range(self, reaction_id, bm_lower_bound):
+        """
+            Find the minimal and maximal flux in a reaction, given a lower
+            bound on the biomass production. Uses the problem prepared by
+            prepare_FBA_primal(), and restores its biomass bound and objective
+            before returning.
+        """
         r_target = self.get_reaction_by_id(reaction_id)
-        self.prob.setObjective(self.var_v[r_target])
+        old_bm_lb = self.var_v[self.biomass_id].lowBound
+        self.var_v[self.biomass_id].lowBound = bm_lower_bound
+        with self.profile.timer('objective'):
+            self.prob.setObjective(self.var_v[r_target])
+
         self.prob.sense = LpMaximize
         self.solve()
         max_v_target = self.get_objective_value()
@@ -318,17 +573,53 @@ class OptKnock(object):
         self.prob.sense = LpMinimize
         self.solve()
         min_v_target = self.get_objective_value()
-        
+
+        self.var_v[self.biomass_id].lowBound = old_bm_lb
+        with self.profile.timer('objective'):
+            self.prob.setObjective(self.var_v[self.biomass_id])
+        self.prob.sense = LpMaximize
         return min_v_target, max_v_target
 
-    def get_PPP_data(self, reaction_id, bm_range=None):
+    def get_flux_bound(self, reaction_id, bm_lower_bound, maximize=True):
+        """
+            Like get_flux_range(), but solves only for the maximal (or
+            minimal) flux
+        """
+        r_target = self.get_reaction_by_id(reaction_id)
+        old_bm_lb = self.var_v[self.biomass_id].lowBound
+        self.var_v[self.biomass_id].lowBound = bm_lower_bound
+        with self.profile.timer('objective'):
+            self.prob.setObjective(self.var_v[r_target])
+        self.prob.sense = LpMaximize if maximize else LpMinimize
+        self.solve()
+        v_target = self.get_objective_value()
+
+        self.var_v[self.biomass_id].lowBound = old_bm_lb
+        with self.profile.timer('objective'):
+            self.prob.setObjective(self.var_v[self.biomass_id])
+        self.prob.sense = LpMaximize
+        return v_target
+
+    def get_PPP_data(self, reaction_id, bm_range=None, adaptive=False,
+                     tolerance=1e-6):
         """
             Run FVA on a gradient of biomass lower bounds and generate
             the data needed for creating the Phenotype Phase Plane
+
+            With adaptive=True (and no bm_range), the envelopes are not
+            sampled on a uniform grid. Instead, only their vertices are
+            found (see phase_plane.find_vertices), which usually takes far
+            fewer LPs and gives the exact corners of the PPP.
         """
-        self.create_prob(sense=LpMaximize)
-        self.add_primal_variables_and_constraints()
-        self.prob.setObjective(self.var_v[self.r_biomass])
+        if bm_range is not None:
+            bm_range = [float(bm) for bm in np.ravel(bm_range)]
+        return self._cached(
+            ('PPP', reaction_id, bm_range, adaptive, tolerance),
+            lambda: self._get_PPP_data(reaction_id, bm_range, adaptive,
+                                       tolerance))
+
+    def _get_PPP_data(self, reaction_id, bm_range, adaptive, tolerance):
+        self.prepare_FBA_primal()
         r_target = self.get_reaction_by_id(reaction_id)
         if r_target is None:
             return None
@@ -339,104 +630,130 @@ class OptKnock(object):
             max_biomass = self.get_objective_value()
             if max_biomass is None:
                 return None
+            if adaptive:
+                return self._get_adaptive_PPP_data(reaction_id, 1e-5,
+                                                   max_biomass - 1e-5,
+                                                   tolerance)
             bm_range = np.linspace(1e-5, max_biomass - 1e-5, 50)
 
-        self.prob.setObjective(self.var_v[r_target])
-
         data = []
         for bm_lb in bm_range:
-            self.var_v[self.r_biomass].lowBound = bm_lb
-
-            self.prob.sense = LpMaximize
-            self.solve()
-            max_v_target = self.get_objective_value()
-
-            self.prob.sense = LpMinimize
-            self.solve()
-            min_v_target = self.get_objective_value()
-            
+            min_v_target, max_v_target = self.get_flux_range(reaction_id, bm_lb)
             data.append((bm_lb, min_v_target, max_v_target))
-            
+
         return np.matrix(data)
-        
+
+    def _get_adaptive_PPP_data(self, reaction_id, bm_min, bm_max, tolerance):
+        x_min, y_min = phase_plane.find_vertices(
+            lambda bm: self.get_flux_bound(reaction_id, bm, maximize=False),
+            bm_min, bm_max, tolerance)
+        x_max, y_max = phase_plane.find_vertices(
+            lambda bm: self.get_flux_bound(reaction_id, bm, maximize=True),
+            bm_min, bm_max, tolerance)
+        if None in y_min or None in y_max:
+            return None
+        return phase_plane.merge_envelopes(x_min, y_min, x_max, y_max)
+
     def get_slope(self, reaction_id, epsilon_bm=0.01):
-        data = self.get_PPP_data(reaction_id, bm_range=[epsilon_bm])
-        if data is None:
+        """
+            The minimal flux in the target reaction, per unit of biomass
+            production, when the biomass production is just above zero
+        """
+        return self._cached(
+            ('slope', reaction_id, epsilon_bm),
+            lambda: self._solve_slope(reaction_id, epsilon_bm))
+
+    def _solve_slope(self, reaction_id, epsilon_bm):
+        self.prepare_FBA_primal()
+        return self._get_slope(reaction_id, epsilon_bm)
+
+    def get_yield_and_slope(self, reaction_id, epsilon_bm=0.01):
+        """
+            Calculate the maximal biomass yield (FBA) and the slope of the
+            target reaction (see get_slope) using the same problem. Only two
+            LPs are solved: the FBA and the minimal target flux.
+        """
+        return self._cached(
+            ('yield_and_slope', reaction_id, epsilon_bm),
+            lambda: self._get_yield_and_slope(reaction_id, epsilon_bm))
+
+    def _get_yield_and_slope(self, reaction_id, epsilon_bm):
+        yd = self._solve_FBA() or 0
+        if reaction_id is None:
+            return yd, None
+        if yd == 0:
+            return yd, 0
+        return yd, self._get_slope(reaction_id, epsilon_bm)
+
+    def _get_slope(self, reaction_id, epsilon_bm):
+        if self.get_reaction_by_id(reaction_id) is None:
             return None
-        else:
-            return data[0, 1] / epsilon_bm
-        
+        min_v_target = self.get_flux_bound(reaction_id, epsilon_bm,
+                                           maximize=False)
+        if min_v_target is None:
+            return None
+        return min_v_target / epsilon_bm
+
     def model_summary(self, html):
+        self.check_solution()
         import analysis_toolbox
         analysis_toolbox.model_summary(self.model, self.solution, html)
         
     @staticmethod
-    def analyze_kos(carbon_sources, single_kos,
-                    target_reaction, knockins="", n_knockouts=2, n_threads=2,
-                    carbon_uptake_rate=50, solver='glpk'):
+    def get_solver(solver):
         """
-            Args:
-                target_reaction - the reaction for which the coupling to BM yield is made
-                knockins        - extra reactions to add to the model
-                max_knockouts   - the maximum number of simultaneous knockouts
-                carbon_uptake_rate - in units of mmol C / (gDW*h)
+            Returns the PuLP solver class matching the given solver name
         """
         if solver.lower() == 'gurobi':
-            solver = solvers.GUROBI
+            return solvers.GUROBI
         elif solver.lower() == 'glpk':
-            solver = solvers.GLPK
+            return solvers.GLPK
+        elif solver.lower() == 'glpk_api':
+            return glpk_session.GLPK_API
         elif solver.lower() == 'scip':
-            solver = solvers.SCIP
+            return solvers.SCIP
         elif solver.lower() == 'cplex':
-            solver = solvers.CPLEX
+            return solvers.CPLEX
         else:
             raise ValueError('unknown solver: ' + solver)
-        wt_model = Model.initialize()
-        
-        if knockins is not None:
-            wt_model.knockin_reactions(knockins, 0, 1000)
-      
-        sys.stdout.write("There are %d single knockouts\n" % len(single_kos))
-        sys.stdout.write("There are %d carbon sources: %s\n" %
-                         (len(carbon_sources), ', '.join(carbon_sources)))
-        data = []
-        
-        kos_and_cs = [(kos, cs) for kos in combinations(single_kos, n_knockouts)
-                                for cs in carbon_sources]
-            
-        def calculate_yield_and_slope(params):
-            kos, carbon_source = params
-            sys.stderr.write('KOs = ' + ', '.join(kos) + ': ' + carbon_source + '\n')
-            temp_model = wt_model.clone()
-            if carbon_source == 'electrons':
-                temp_model.knockin_reactions('RED', 0, carbon_uptake_rate*2)
-            elif carbon_source != '':
-                # find out how many carbon atoms are in the carbon source
-                # and normalize the uptake rate to be in units of mmol 
-                # carbon-source / (gDW*h) 
-                nC = 0
-                for cs in carbon_source.split(','):
-                    met = wt_model.metabolites[
-                        wt_model.metabolites.index(cs + '_c')]
-                    nC += met.elements['C']
-                uptake_rate = carbon_uptake_rate / float(nC)
-    
-                for cs in carbon_source.split(','):
-                    temp_model.set_exchange_bounds(cs, lower_bound=-uptake_rate)
-            
-            for ko in kos:
-                if ko != '':
-                    temp_model.knockout_reactions(ko)
-            
-            yd = OptKnock(temp_model, solver=solver).solve_FBA() or 0
-            if (target_reaction is not None) and (yd == 0):
-                slope = 0
-            else:
-                slope = OptKnock(temp_model, solver=solver).get_slope(target_reaction)
-            return ('|'.join(kos), carbon_source, yd, slope)
-        
-        data = map(calculate_yield_and_slope, kos_and_cs)
-        df = pd.DataFrame(data=list(data),
-                          columns=['knockouts', 'carbon source', 'yield', 'slope'])
-    
-        return df
+
+    @staticmethod
+    def analyze_kos(carbon_sources, single_kos,
+                    target_reaction, knockins="", n_knockouts=2, n_threads=2,
+                    carbon_uptake_rate=50, solver='glpk', **kwargs):
+        """
+            Args:
+                target_reaction - the reaction for which the coupling to BM yield is made
+                knockins        - extra reactions to add to the model
+                n_knockouts     - the number of simultaneous knockouts
+                n_threads       - the number of worker processes (1 for serial)
+                carbon_uptake_rate - in units of mmol C / (gDW*h)
+
+            Other keyword arguments (e.g. chunksize, reuse_problem) are
+            passed on to knockout_scan.analyze_kos
+        """
+        return knockout_scan.analyze_kos(
+            OptKnock, carbon_sources, single_kos, target_reaction,
+            knockins=knockins, n_knockouts=n_knockouts, n_threads=n_threads,
+            carbon_uptake_rate=carbon_uptake_rate, solver=solver, **kwargs)
+
+    @staticmethod
+    def iter_kos(carbon_sources, single_kos, target_reaction, **kwargs):
+        """
+            Like analyze_kos, but returns a generator of the result rows (see
+            knockout_scan.iter_kos)
+        """
+        kwargs.setdefault('solver', 'glpk')
+        return knockout_scan.iter_kos(OptKnock, carbon_sources, single_kos,
+                                      target_reaction, **kwargs)
+
+    @staticmethod
+    def write_kos(fname, carbon_sources, single_kos, target_reaction,
+                  **kwargs):
+        """
+            Like analyze_kos, but writes the results to a CSV (or Parquet)
+            file in chunks (see knockout_scan.write_kos)
+        """
+        kwargs.setdefault('solver', 'glpk')
+        return knockout_scan.write_kos(fname, OptKnock, carbon_sources,
+                                       single_kos, target_reaction, **kwargs)
@@ -0,0 +1,337 @@
+"""
+    An FBA engine which solves the LPs directly on the arrays of the model
+    (the sparse stoichiometric matrix, the flux bounds and the objective
+    coefficients) using scipy.optimize.linprog with the HiGHS solvers
+    (requires scipy >= 1.6).
+
+    It has the same methods as the LP part of the other backends
+    (optknock_pulp and optknock_optlang): solve_FBA, solve_FVA, get_slope,
+    get_yield_and_slope and get_PPP_data, so it can be used by analyze_kos
+    and flux_variability. There is no modelling layer, and lightweight
+    clones of the model (see Model.clone) are never turned into full cobra
+    models. The OptKnock MILP itself is not supported.
+"""
+import numpy as np
+from scipy.optimize import linprog
+from cobra.core import Solution
+from python import knockout_scan, phase_plane, flux_variability, profiling, \
+                   result_cache
+
+# the methods of linprog that can be used as the solver
+SOLVERS = ['highs', 'highs-ds', 'highs-ipm']
+
+# the status returned by linprog when the LP was solved
+STATUS_OPTIMAL = 0
+
+class OptKnock(result_cache.CachedResults):
+
+    def __init__(self, model, solver, verbose=False):
+        self.verbose = verbose
+        self.solver = solver
+
+        # the wall time of each phase and the solver statistics
+        self.profile = profiling.Profile()
+        with self.profile.timer('model copy'):
+            self.model = model.clone()
+            self.reaction_ids = self.model.reaction_ids
+            self.reaction_index = self.model.reaction_index
+
+            # locate the biomass reaction
+            biomass_indices = np.nonzero(self.model.objective_coefficients)[0]
+        if len(biomass_indices) != 1:
+            raise Exception('There should be only one single biomass reaction')
+        self.i_biomass = biomass_indices[0]
+
+        self.has_flux_as_variables = False
+        self.solution = None
+
+    def create_prob(self):
+        # the LP is: maximize (or minimize) c*v, subject to S*v = 0 and
+        # lb <= v <= ub
+        with self.profile.timer('constraints'):
+            self.S = self.model.stoichiometric_matrix
+            self.b = np.zeros(self.S.shape[0])
+        with self.profile.timer('variables'):
+            self.lower_bounds = self.model.lower_bounds
+            self.upper_bounds = self.model.upper_bounds
+        self.c = np.zeros(len(self.reaction_ids))
+        self.maximize = True
+
+    def enable_warm_start(self):
+        """
+            linprog does not keep the basis between calls, so every solve
+            starts from scratch
+        """
+        pass
+
+    def set_objective(self, j, maximize=True):
+        """
+            Set the objective to the flux of the reaction in column j
+        """
+        with self.profile.timer('objective'):
+            self.c[:] = 0
+            self.c[j] = 1
+            self.maximize = maximize
+
+    def prepare_FBA_primal(self):
+        """
+            Run standard FBA (primal)
+        """
+        self.create_prob()
+        self.has_flux_as_variables = True
+        self.set_objective(self.i_biomass)
+
+    def get_reaction_by_id(self, reaction_id):
+        """
+            Returns the column of the reaction in the LP (or None if the
+            reaction is not in the model)
+        """
+        return self.reaction_index.get(reaction_id)
+
+    def set_reaction_bounds(self, reaction_id, lower_bound, upper_bound):
+        """
+            Change the bounds of a flux in the prepared problem (the model
+            itself is not changed). Returns the previous bounds, so that the
+            change can be reverted later.
+        """
+        j = self.get_reaction_by_id(reaction_id)
+        if j is None:
+            raise KeyError('Model does not have a reaction with ID: ' + reaction_id)
+        old_bounds = (self.lower_bounds[j], self.upper_bounds[j])
+        self.lower_bounds[j] = lower_bound
+        self.upper_bounds[j] = upper_bound
+        return old_bounds
+
+    def solve(self):
+        self.from_cache = False
+        c = -self.c if self.maximize else self.c
+        bounds = np.column_stack([self.lower_bounds, self.upper_bounds])
+        with self.profile.timer('solve'):
+            res = linprog(c, A_eq=self.S, b_eq=self.b, bounds=bounds,
+                          method=self.solver)
+        self.profile.add_solver_statistics(iterations=res.nit)
+
+        if res.status != STATUS_OPTIMAL:
+            if self.verbose:
+                print("LP was not solved because: " + res.message)
+            self.solution = Solution(objective_value=None,
+                                     status=res.status,
+                                     fluxes=None)
+        else:
+            self.solution = Solution(objective_value=float(self.c.dot(res.x)),
+                                     status=res.status,
+                                     fluxes=list(res.x))
+        return self.solution
+
+    def get_objective_value(self):
+        self.check_solution()
+        if self.solution.status != STATUS_OPTIMAL:
+            return None
+        else:
+            return self.solution.objective_value
+
+    def solve_FBA(self):
+        """
+            The maximal biomass production (see result_cache)
+        """
+        return self._cached(('FBA',), self._solve_FBA)
+
+    def _solve_FBA(self):
+        self.prepare_FBA_primal()
+        self.solve()
+        max_biomass = self.get_objective_value()
+        return max_biomass
+
+    def solve_FVA(self, reaction_id):
+        """
+            Run Flux Variability Analysis on the provided reaction
+        """
+        max_biomass = self._solve_FBA()
+        if max_biomass is None:
+            raise Exception("Cannot run FVA because the model is infeasible")
+        return self.get_flux_range(reaction_id, max_biomass - 1e-5)
+
+    def solve_batch_FVA(self, reaction_ids=None, fraction_of_optimum=1.0,
+                        n_threads=1, chunksize=None):
+        """
+            Run Flux Variability Analysis on many reactions (by default, on
+            all of them), building the problem only once per process.
+            Returns a DataFrame with the minimal and maximal flux of each
+            reaction (see flux_variability.run_FVA)
+        """
+        return flux_variability.run_FVA(OptKnock, self.model, self.solver,
+                                        reaction_ids, fraction_of_optimum,
+                                        n_threads, chunksize)
+
+    def get_flux_range(self, reaction_id, bm_lower_bound):
+        """
+            Find the minimal and maximal flux in a reaction, given a lower
+            bound on the biomass production. Uses the problem prepared by
+            prepare_FBA_primal(), and restores its biomass bound and objective
+            before returning.
+        """
+        min_v_target = self.get_flux_bound(reaction_id, bm_lower_bound,
+                                           maximize=False)
+        max_v_target = self.get_flux_bound(reaction_id, bm_lower_bound,
+                                           maximize=True)
+        return min_v_target, max_v_target
+
+    def get_flux_bound(self, reaction_id, bm_lower_bound, maximize=True):
+        """
+            Like get_flux_range(), but solves only for the maximal (or
+            minimal) flux
+        """
+        j = self.get_reaction_by_id(reaction_id)
+        old_bm_lb = self.lower_bounds[self.i_biomass]
+        self.lower_bounds[self.i_biomass] = bm_lower_bound
+        self.set_objective(j, maximize)
+        self.solve()
+        v_target = self.get_objective_value()
+
+        self.lower_bounds[self.i_biomass] = old_bm_lb
+        self.set_objective(self.i_biomass)
+        return v_target
+
+    def get_PPP_data(self, reaction_id, bm_range=None, adaptive=False,
+                     tolerance=1e-6):
+        """
+            Run FVA on a gradient of biomass lower bounds and generate
+            the data needed for creating the Phenotype Phase Plane
+
+            With adaptive=True (and no bm_range), only the vertices of the
+            envelopes are found (see phase_plane.find_vertices).
+        """
+        if bm_range is not None:
+            bm_range = [float(bm) for bm in np.ravel(bm_range)]
+        return self._cached(
+            ('PPP', reaction_id, bm_range, adaptive, tolerance),
+            lambda: self._get_PPP_data(reaction_id, bm_range, adaptive,
+                                       tolerance))
+
+    def _get_PPP_data(self, reaction_id, bm_range, adaptive, tolerance):
+        self.prepare_FBA_primal()
+        if self.get_reaction_by_id(reaction_id) is None:
+            return None
+
+        self.solve()
+
+        if bm_range is None:
+            max_biomass = self.get_objective_value()
+            if max_biomass is None:
+                return None
+            if adaptive:
+                return self._get_adaptive_PPP_data(reaction_id, 1e-5,
+                                                   max_biomass - 1e-5,
+                                                   tolerance)
+            bm_range = np.linspace(1e-5, max_biomass - 1e-5, 50)
+
+        data = []
+        for bm_lb in bm_range:
+            min_v_target, max_v_target = self.get_flux_range(reaction_id, bm_lb)
+            data.append((bm_lb, min_v_target, max_v_target))
+
+        return np.matrix(data)
+
+    def _get_adaptive_PPP_data(self, reaction_id, bm_min, bm_max, tolerance):
+        x_min, y_min = phase_plane.find_vertices(
+            lambda bm: self.get_flux_bound(reaction_id, bm, maximize=False),
+            bm_min, bm_max, tolerance)
+        x_max, y_max = phase_plane.find_vertices(
+            lambda bm: self.get_flux_bound(reaction_id, bm, maximize=True),
+            bm_min, bm_max, tolerance)
+        if None in y_min or None in y_max:
+            return None
+        return phase_plane.merge_envelopes(x_min, y_min, x_max, y_max)
+
+    def get_slope(self, reaction_id, epsilon_bm=0.01):
+        """
+            The minimal flux in the target reaction, per unit of biomass
+            production, when the biomass production is just above zero
+        """
+        return self._cached(
+            ('slope', reaction_id, epsilon_bm),
+            lambda: self._solve_slope(reaction_id, epsilon_bm))
+
+    def _solve_slope(self, reaction_id, epsilon_bm):
+        self.prepare_FBA_primal()
+        return self._get_slope(reaction_id, epsilon_bm)
+
+    def get_yield_and_slope(self, reaction_id, epsilon_bm=0.01):
+        """
+            Calculate the maximal biomass yield (FBA) and the slope of the
+            target reaction (see get_slope) using the same problem. Only two
+            LPs are solved: the FBA and the minimal target flux.
+        """
+        return self._cached(
+            ('yield_and_slope', reaction_id, epsilon_bm),
+            lambda: self._get_yield_and_slope(reaction_id, epsilon_bm))
+
+    def _get_yield_and_slope(self, reaction_id, epsilon_bm):
+        yd = self._solve_FBA() or 0
+        if reaction_id is None:
+            return yd, None
+        if yd == 0:
+            return yd, 0
+        return yd, self._get_slope(reaction_id, epsilon_bm)
+
+    def _get_slope(self, reaction_id, epsilon_bm):
+        if self.get_reaction_by_id(reaction_id) is None:
+            return None
+        min_v_target = self.get_flux_bound(reaction_id, epsilon_bm,
+                                           maximize=False)
+        if min_v_target is None:
+            return None
+        return min_v_target / epsilon_bm
+
+    @staticmethod
+    def get_solver(solver):
+        """
+            Returns the linprog method matching the given solver name (one
+            of SOLVERS, other solvers such as GLPK cannot be used by linprog)
+        """
+        if solver.lower() in SOLVERS:
+            return solver.lower()
+        else:
+            raise ValueError('linprog does not support the solver: %s '
+                             '(use one of: %s)' % (solver, ', '.join(SOLVERS)))
+
+    @staticmethod
+    def analyze_kos(carbon_sources, single_kos,
+                    target_reaction, knockins="", n_knockouts=2, n_threads=2,
+                    carbon_uptake_rate=50, solver='highs', **kwargs):
+        """
+            Args:
+                target_reaction - the reaction for which the coupling to BM yield is made
+                knockins        - extra reactions to add to the model
+                n_knockouts     - the number of simultaneous knockouts
+                n_threads       - the number of worker processes (1 for serial)
+                carbon_uptake_rate - in units of mmol C / (gDW*h)
+
+            Other keyword arguments (e.g. chunksize, reuse_problem) are
+            passed on to knockout_scan.analyze_kos
+        """
+        return knockout_scan.analyze_kos(
+            OptKnock, carbon_sources, single_kos, target_reaction,
+            knockins=knockins, n_knockouts=n_knockouts, n_threads=n_threads,
+            carbon_uptake_rate=carbon_uptake_rate, solver=solver, **kwargs)
+
+    @staticmethod
+    def iter_kos(carbon_sources, single_kos, target_reaction, **kwargs):
+        """
+            Like analyze_kos, but returns a generator of the result rows (see
+            knockout_scan.iter_kos)
+        """
+        kwargs.setdefault('solver', 'highs')
+        return knockout_scan.iter_kos(OptKnock, carbon_sources, single_kos,
+                                      target_reaction, **kwargs)
+
+    @staticmethod
+    def write_kos(fname, carbon_sources, single_kos, target_reaction,
+                  **kwargs):
+        """
+            Like analyze_kos, but writes the results to a CSV (or Parquet)
+            file in chunks (see knockout_scan.write_kos)
+        """
+        kwargs.setdefault('solver', 'highs')
+        return knockout_scan.write_kos(fname, OptKnock, carbon_sources,
+                                       single_kos, target_reaction, **kwargs)
@@ -0,0 +1,131 @@
+"""
+    Adaptive sampling of Phenotype Phase Plane (PPP) envelopes.
+
+    The minimal (maximal) flux of a target reaction, as a function of the
+    lower bound on the biomass production, is a convex (concave) piecewise-
+    linear function. Instead of sampling it on a uniform grid, its vertices
+    can be found using only a few LPs:
+
+    * if f(x) is on the chord between f(a) and f(b) for some a < x < b, then
+      f is linear on all of [a, b] (since it is convex or concave).
+    * if the segments on both sides of [a, b] are linear, their lines
+      intersect at the vertex of [a, b] (if it has only one). If f at the
+      intersection is on both lines, the vertex is exact and both new
+      segments are linear.
+    * otherwise, [a, b] is bisected.
+"""
+
+import numpy as np
+
+
+def _is_close(y, y_expected, tolerance):
+    return abs(y - y_expected) <= tolerance * max(1.0, abs(y_expected))
+
+def find_vertices(func, x_min, x_max, tolerance=1e-6, min_width=1e-6):
+    """
+        Find the vertices of a convex or concave piecewise-linear function
+
+        Args:
+            func      - the function, returns None where it is undefined
+                        (e.g. where the LP is infeasible)
+            x_min     - the lower end of the range
+            x_max     - the upper end of the range
+            tolerance - the relative tolerance for deciding that a point is
+                        on a line
+            min_width - segments shorter than this are not refined further
+
+        Returns:
+            two lists, the x and f(x) values of the vertices (including the
+            two ends of the range)
+    """
+    xs = [x_min, x_max]
+    ys = {x_min: func(x_min), x_max: func(x_max)}
+    done = set() # segments (a, b) which are linear or cannot be refined
+
+    def slope(a, b):
+        return (ys[b] - ys[a]) / (b - a)
+
+    def crossing(i):
+        """
+            the intersection of the lines of the segments on both sides of
+            segment i, if both are known to be linear
+        """
+        a, b = xs[i], xs[i+1]
+        if i == 0 or i + 2 == len(xs) or \
+           (xs[i-1], a) not in done or (b, xs[i+2]) not in done or \
+           ys[xs[i-1]] is None or ys[xs[i+2]] is None:
+            return None
+        s_left = slope(xs[i-1], a)
+        s_right = slope(b, xs[i+2])
+        if s_left == s_right:
+            return None
+        x = (ys[b] - ys[a] + s_left * a - s_right * b) / (s_left - s_right)
+        if not a < x < b:
+            return None
+        return x, ys[a] + s_left * (x - a)
+
+    while True:
+        pending = []
+        for i in range(len(xs) - 1):
+            a, b = xs[i], xs[i+1]
+            if (a, b) in done:
+                continue
+            if ys[a] is None or ys[b] is None or b - a <= min_width:
+                done.add((a, b))
+                continue
+            pending.append(i)
+        if not pending:
+            break
+
+        # prefer segments whose vertex can be found by intersection, and
+        # otherwise bisect the widest segment (so that segments are
+        # verified to be linear before their neighbours need them)
+        x, y_vertex = None, None
+        for i in pending:
+            cross = crossing(i)
+            if cross is not None:
+                x, y_vertex = cross
+                break
+        else:
+            i = max(pending, key=lambda j: xs[j+1] - xs[j])
+            x = (xs[i] + xs[i+1]) / 2.0
+        a, b = xs[i], xs[i+1]
+
+        y = func(x)
+        if y is None:
+            # the function is undefined inside this segment, so we cannot
+            # tell if it is linear
+            done.add((a, b))
+        elif y_vertex is not None and _is_close(y, y_vertex, tolerance):
+            xs.insert(i + 1, x)
+            ys[x] = y
+            done.add((a, x))
+            done.add((x, b))
+        elif _is_close(y, ys[a] + slope(a, b) * (x - a), tolerance):
+            done.add((a, b))
+        else:
+            xs.insert(i + 1, x)
+            ys[x] = y
+
+    # remove the points that are not vertices (i.e. on the line between
+    # their two neighbours)
+    vertices = [xs[0]]
+    for i in range(1, len(xs) - 1):
+        x0, x1, x2 = vertices[-1], xs[i], xs[i+1]
+        if ys[x0] is None or ys[x1] is None or ys[x2] is None or \
+           not _is_close(ys[x1], ys[x0] + slope(x0, x2) * (x1 - x0), tolerance):
+            vertices.append(x1)
+    vertices.append(xs[-1])
+    return vertices, [ys[x] for x in vertices]
+
+def merge_envelopes(x_lower, y_lower, x_upper, y_upper):
+    """
+        Combine the vertices of the lower and upper envelopes into one
+        matrix with the columns (x, lower, upper). Each envelope is linearly
+        interpolated at the vertices of the other one (which is exact, since
+        it is linear between its own vertices).
+    """
+    xs = sorted(set(x_lower).union(x_upper))
+    lower = np.interp(xs, x_lower, y_lower)
+    upper = np.interp(xs, x_upper, y_upper)
+    return np.matrix(list(zip(xs, lower, upper)))
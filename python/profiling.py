@@ -0,0 +1,117 @@
+"""
+    Instrumentation of OptKnock runs, shared by the OptKnock backends
+    (optknock_pulp and optknock_optlang).
+
+    Every OptKnock object has a Profile, which records the wall time spent in
+    each phase (copying the model, creating the variables and constraints,
+    setting the objective and solving) and the statistics reported by the
+    solver (simplex iterations, branch-and-bound nodes and the MIP gap),
+    when the solver makes them available.
+"""
+
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+
+PHASES = ['model copy', 'variables', 'constraints', 'objective', 'solve']
+
+STATISTICS = ['solves', 'iterations', 'nodes', 'mip_gap']
+
+COLUMNS = PHASES + STATISTICS
+
+class Profile(object):
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.times = OrderedDict((phase, 0.0) for phase in PHASES)
+        self.solves = 0
+        self.iterations = None
+        self.nodes = None
+        self.mip_gap = None
+
+    @contextmanager
+    def timer(self, phase):
+        """
+            Add the wall time spent in the 'with' block to the given phase
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.times[phase] += time.time() - start
+
+    def add_solver_statistics(self, iterations=None, nodes=None,
+                              mip_gap=None):
+        """
+            Record the statistics of one solve. The iterations and nodes are
+            summed over all the solves, and the MIP gap of the last solve is
+            kept. Statistics that are not available (None) are ignored.
+        """
+        self.solves += 1
+        if iterations is not None:
+            self.iterations = (self.iterations or 0) + iterations
+        if nodes is not None:
+            self.nodes = (self.nodes or 0) + nodes
+        if mip_gap is not None:
+            self.mip_gap = mip_gap
+
+    def to_row(self):
+        """
+            Returns the times and statistics as a tuple, in the order of
+            COLUMNS
+        """
+        return tuple(self.times.values()) + \
+            (self.solves, self.iterations, self.nodes, self.mip_gap)
+
+    def to_dict(self):
+        return OrderedDict(zip(COLUMNS, self.to_row()))
+
+def _get_glpk_statistics(problem):
+    import swiglpk
+    # the iteration counter of GLPK is cumulative, so it is reset after
+    # reading it, to get the number of iterations of each solve
+    iterations = swiglpk.glp_get_it_cnt(problem)
+    swiglpk.glp_set_it_cnt(problem, 0)
+    return {'iterations': iterations}
+
+def _get_gurobi_statistics(problem):
+    stats = {'iterations': int(problem.IterCount)}
+    if problem.IsMIP:
+        stats['nodes'] = int(problem.NodeCount)
+        stats['mip_gap'] = problem.MIPGap
+    return stats
+
+def _get_cplex_statistics(problem):
+    stats = {'iterations': problem.solution.progress.get_num_iterations()}
+    if problem.get_problem_type() != problem.problem_type.LP:
+        stats['nodes'] = problem.solution.progress.get_num_nodes_processed()
+        stats['mip_gap'] = problem.solution.MIP.get_mip_relative_gap()
+    return stats
+
+def get_solver_statistics(problem, solver_name):
+    """
+        Returns the statistics of the last solve of a native solver problem
+        (a GLPK, Gurobi or CPLEX object), as a dictionary which can be passed
+        to Profile.add_solver_statistics. Statistics that are not available
+        are omitted.
+
+        Args:
+            problem     - the native problem object of the solver
+            solver_name - the name of the solver (e.g. 'glpk' or 'gurobi')
+    """
+    if problem is None:
+        return {}
+    solver_name = solver_name.lower()
+    try:
+        if solver_name.startswith('glpk'):
+            return _get_glpk_statistics(problem)
+        if solver_name.startswith('gurobi'):
+            return _get_gurobi_statistics(problem)
+        if solver_name.startswith('cplex'):
+            return _get_cplex_statistics(problem)
+    except Exception:
+        # e.g. the problem was not solved to optimality
+        pass
+    return {}
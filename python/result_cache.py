@@ -0,0 +1,236 @@
+"""
+    A cache for the results of the LP analyses of the OptKnock backends
+    (solve_FBA, get_slope, get_yield_and_slope and get_PPP_data), so that
+    model states which were already solved (e.g. the same knockouts and
+    carbon sources in another scan, or in a re-run of a script) are not
+    solved again.
+
+    The results are kept in memory (up to max_size of them, dropping the
+    least recently used ones) and, if a cache_dir is given, also on disk,
+    so that they are shared between processes and runs.
+
+    The cache is disabled by default. It is used by all the backends once
+    it is enabled:
+
+        from python import result_cache
+        result_cache.enable(cache_dir='res/result_cache')
+        ...
+        print(result_cache.get_cache().get_statistics())
+
+    The results are keyed by a hash of the stoichiometric matrix, the flux
+    bounds, the objective coefficients and the reaction IDs of the model,
+    and of the query (e.g. the target reaction and epsilon of a slope). The
+    solver is not part of the key, since all solvers should give the same
+    optimal values.
+
+    When a result is taken from the cache, no problem is solved, so the
+    accessors of the solution of the OptKnock object (e.g.
+    get_objective_value and print_primal_results) raise an exception until
+    the next solve.
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+from copy import deepcopy
+from collections import OrderedDict
+import numpy as np
+
+# increase this number whenever the results of the cached queries change,
+# so that results stored on disk by older versions are not used
+CACHE_VERSION = 1
+
+DEFAULT_MAX_SIZE = 10000
+
+class ResultCache(object):
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, cache_dir=None):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _get_fname(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def get(self, key):
+        """
+            Returns (True, value) if the key is in the cache, and
+            (False, None) otherwise
+        """
+        if key in self.entries:
+            value = self.entries.pop(key)
+            self.entries[key] = value # mark as the most recently used
+            self.hits += 1
+            return True, value
+
+        if self.cache_dir is not None:
+            fname = self._get_fname(key)
+            if os.path.exists(fname):
+                try:
+                    with open(fname, 'rb') as fp:
+                        value = pickle.load(fp)
+                except Exception:
+                    # a corrupt file, e.g. written by an incompatible version
+                    pass
+                else:
+                    self._add(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return True, value
+
+        self.misses += 1
+        return False, None
+
+    def _add(self, key, value):
+        self.entries[key] = value
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def set(self, key, value):
+        self._add(key, value)
+        if self.cache_dir is None:
+            return
+
+        # write to a temporary file first, and then rename it, so that
+        # processes running in parallel never read a partially written file
+        if not os.path.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # another process created it in the meantime
+                pass
+        fd, tmp_fname = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(value, fp, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_fname, self._get_fname(key))
+
+    def clear(self):
+        """
+            Remove all the results kept in memory, and reset the statistics
+            (results stored on disk are not removed)
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get_statistics(self):
+        n_queries = self.hits + self.misses
+        return OrderedDict([('hits', self.hits),
+                            ('disk_hits', self.disk_hits),
+                            ('misses', self.misses),
+                            ('hit_rate', self.hits / float(n_queries)
+                                         if n_queries > 0 else None),
+                            ('size', len(self.entries))])
+
+def get_model_fingerprint(model):
+    """
+        A hash of everything in the model that affects the results of the
+        LP analyses
+    """
+    h = hashlib.sha1()
+    S = model.stoichiometric_matrix.tocsr(copy=True)
+    S.sum_duplicates()
+    S.sort_indices()
+    h.update(np.array(S.shape, dtype=np.int64).tobytes())
+    h.update(S.indptr.astype(np.int64).tobytes())
+    h.update(S.indices.astype(np.int64).tobytes())
+    # adding 0.0 turns -0.0 into 0.0, which would otherwise hash differently
+    for array in [S.data, model.lower_bounds, model.upper_bounds,
+                  model.objective_coefficients]:
+        h.update((np.asarray(array, dtype=np.float64) + 0.0).tobytes())
+    h.update(repr(list(model.reaction_ids)).encode('utf-8'))
+    return h.hexdigest()
+
+class CachedResults(object):
+    """
+        A mixin for the OptKnock backends, which caches the results of their
+        analyses. The public analyses call _cached with the query that
+        identifies them and the function that solves them.
+    """
+
+    # the fingerprint of the model (computed when first needed), and
+    # whether the last analysis was taken from the cache, in which case
+    # nothing was solved
+    model_fingerprint = None
+    from_cache = False
+
+    def get_model_fingerprint(self):
+        """
+            The fingerprint of the model for the result cache, computed only
+            once (the backends reset it when they change the model, e.g. in
+            prepare_optslope)
+        """
+        if self.model_fingerprint is None:
+            self.model_fingerprint = get_model_fingerprint(self.model)
+        return self.model_fingerprint
+
+    def _cached(self, query, func):
+        value, self.from_cache = cached(self.get_model_fingerprint, query, func)
+        return value
+
+    def check_solution(self):
+        """
+            Raise an exception if the last analysis was taken from the result
+            cache, since then no problem was solved and there is no solution
+            to inspect
+        """
+        if self.from_cache:
+            raise Exception('The last result was taken from the result cache, '
+                            'so no problem was solved (disable the cache with '
+                            'result_cache.disable() to inspect the solution)')
+
+def get_key(fingerprint, query):
+    h = hashlib.sha1()
+    h.update(repr((CACHE_VERSION, fingerprint, query)).encode('utf-8'))
+    return h.hexdigest()
+
+_cache = None
+
+def enable(max_size=DEFAULT_MAX_SIZE, cache_dir=None):
+    """
+        Start caching the results, and return the (new) cache.
+        The cache is also used by worker processes started afterwards (on
+        systems where they are forked), but each has its own in-memory
+        results, so use a cache_dir to share them.
+    """
+    global _cache
+    _cache = ResultCache(max_size, cache_dir)
+    return _cache
+
+def disable():
+    global _cache
+    _cache = None
+
+def get_cache():
+    """
+        Returns the current cache, or None if caching is disabled
+    """
+    return _cache
+
+def cached(get_fingerprint, query, func):
+    """
+        Returns the result of func() for the model and query, using the
+        cache if it is enabled, and whether the result was taken from the
+        cache (in which case func was not called). get_fingerprint should
+        return the fingerprint of the model (see get_model_fingerprint), and
+        is only called when the cache is enabled, so that the backends can
+        compute it once and reuse it. The query should be a tuple of simple
+        values (strings and numbers) that identifies the analysis.
+    """
+    if _cache is None:
+        return func(), False
+
+    key = get_key(get_fingerprint(), query)
+    found, value = _cache.get(key)
+    if not found:
+        value = func()
+        _cache.set(key, deepcopy(value))
+    else:
+        # so that callers changing the result do not change the cache
+        value = deepcopy(value)
+    return value, found
@@ -0,0 +1,191 @@
+import unittest
+
+class TestModel(unittest.TestCase):
+
+    def test_stoichiometric_matrix(self):
+        from python.models import Model
+
+        model = Model.initialize()
+        S = model.stoichiometric_matrix
+        self.assertEqual(S.shape, (len(model.metabolites), len(model.reactions)))
+        for j, r in enumerate(model.reactions):
+            for m in r.metabolites:
+                i = model.metabolites.index(m)
+                self.assertEqual(S[i, j], r.get_coefficient(m))
+
+        # adding reactions should invalidate the cached matrix
+        model.knockin_reactions('PRK,RBC', 0, 1000)
+        self.assertEqual(model.stoichiometric_matrix.shape[1],
+                         len(model.reactions))
+
+    def test_knockin_library(self):
+        from python.models import Model, parse_equation
+
+        self.assertDictEqual(dict(parse_equation('rubp_D_c + co2_c => 2 3pg_c')),
+                             {'rubp_D_c': -1, 'co2_c': -1, '3pg_c': 2})
+
+        model = Model.initialize()
+        model.knockin_reactions('MEDH,H6PS,H6PI,EX_methanol', 0, 1000)
+        r = model.reactions.get_by_id('MEDH')
+        self.assertEqual(r.name, 'methanol dehydrogenase')
+        self.assertEqual(r.get_coefficient('methanol_c'), -1)
+        self.assertEqual(str(model.get_metabolite('methanol_e').formula), 'CH4O')
+        self.assertTrue(model.has_reaction('EX_methanol_e'))
+
+        with self.assertRaises(Exception):
+            model.knockin_reactions('UNKNOWN')
+
+    def test_indexes(self):
+        from python.models import Model
+
+        wt_model = Model.initialize()
+        for model in [wt_model.clone(), Model.initialize()]:
+            # build the indexes before changing the model
+            self.assertEqual(model.metabolite_index['succ_c'],
+                             model.metabolite_ids.index('succ_c'))
+            self.assertEqual(model.exchange_reactions['g6p'], 'EX_g6p_e')
+
+            model.knockin_reactions('MEDH,EX_methanol', 0, 1000)
+            model.knockout_reactions('PGI,EX_g6p_e')
+            model.set_exchange_bounds('succ', -5)
+            for j, rid in enumerate(model.reaction_ids):
+                self.assertEqual(model.reaction_index[rid], j)
+            for i, cid in enumerate(model.metabolite_ids):
+                self.assertEqual(model.metabolite_index[cid], i)
+            self.assertEqual(model.exchange_reactions['methanol'], 'EX_methanol_e')
+            self.assertNotIn('g6p', model.exchange_reactions)
+            self.assertEqual(model.get_reaction('EX_succ_e').lower_bound, -5)
+            self.assertEqual(model.get_carbon_count('succ_c'), 4)
+            self.assertEqual(model.get_carbon_count('methanol_c'), 1)
+
+    def test_lightweight_clone(self):
+        import numpy as np
+        from python.models import Model
+
+        wt_model = Model.initialize()
+        model = wt_model.clone()
+        model.set_exchange_bounds('succ', -5)
+        model.knockout_reactions('PGI,EDD')
+        model.knockin_reactions('RED', 0, 100)
+        S = model.stoichiometric_matrix.toarray()
+        lb = model.lower_bounds
+        ub = model.upper_bounds
+
+        # the changes are only recorded, and applied when the cobra model
+        # is accessed
+        self.assertIsNone(model._cobra_model)
+        self.assertListEqual(model.reaction_ids,
+                             [r.id for r in model.reactions])
+        self.assertTrue(np.array_equal(S, model.stoichiometric_matrix.toarray()))
+        self.assertTrue(np.array_equal(lb, model.lower_bounds))
+        self.assertTrue(np.array_equal(ub, model.upper_bounds))
+        self.assertFalse(model.has_reaction('PGI'))
+        self.assertTrue(model.has_reaction('RED'))
+
+        # the parent model should not be affected
+        self.assertTrue(wt_model.has_reaction('PGI'))
+        self.assertFalse(wt_model.has_reaction('RED'))
+
+    def test_clone_keeps_parent(self):
+        from python.models import Model
+
+        wt_model = Model.initialize()
+        r = wt_model.reactions.get_by_id('PGI')
+        model = wt_model.clone()
+
+        # the cobra reactions of the parent are still its own after cloning,
+        # and changing them does not change the clone
+        r.lower_bound = -7
+        wt_model.knockout_reactions('EDD')
+        self.assertIs(wt_model.reactions.get_by_id('PGI'), r)
+        self.assertEqual(wt_model.lower_bounds[wt_model.reaction_index['PGI']], -7)
+        self.assertNotEqual(model.lower_bounds[model.reaction_index['PGI']], -7)
+        self.assertNotEqual(model.get_reaction('PGI').lower_bound, -7)
+        self.assertTrue(model.has_reaction('EDD'))
+        self.assertListEqual(model.reaction_ids,
+                             [r.id for r in model.reactions])
+
+    def test_initialize_cache(self):
+        import os
+        import shutil
+        import tempfile
+        from python import models
+        from python.models import Model
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            model = Model.initialize(cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached_model = Model.initialize(cache_dir=cache_dir)
+            self.assertListEqual([r.id for r in model.reactions],
+                                 [r.id for r in cached_model.reactions])
+            self.assertEqual((model.stoichiometric_matrix !=
+                              cached_model.stoichiometric_matrix).nnz, 0)
+
+            # different arguments should not use the same cache file
+            Model.initialize(BM_lower_bound=0.2, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            # neither should a changed knockin library
+            knockin_fname = os.path.join(cache_dir, 'knockin_reactions.csv')
+            shutil.copy(models.KNOCKIN_REACTIONS_FILE, knockin_fname)
+            with open(knockin_fname, 'a') as fp:
+                fp.write('\n')
+            old_fname = models.KNOCKIN_REACTIONS_FILE
+            models.KNOCKIN_REACTIONS_FILE = knockin_fname
+            try:
+                Model.initialize(cache_dir=cache_dir)
+            finally:
+                models.KNOCKIN_REACTIONS_FILE = old_fname
+            self.assertEqual(len(os.listdir(cache_dir)), 4)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_compress(self):
+        from python import optknock_pulp
+        from python.models import Model
+
+        model = Model.initialize()
+        model.knockin_reactions('MEDH,H6PS,H6PI,H4MPTP,FDH', 0, 1000)
+        model.set_exchange_bounds('methanol', lower_bound=-10)
+        model.set_exchange_bounds('xu5p_D', lower_bound=-2)
+        compressed = model.compress(keep=['H6PS'])
+        self.assertLess(len(compressed.reaction_ids), len(model.reaction_ids))
+        self.assertTrue(compressed.has_reaction('H6PS'))
+
+        # every original reaction is represented at most once
+        members = [rid for ko in compressed.decompress_knockouts(
+                       ','.join(compressed.reaction_ids)) for rid in ko]
+        self.assertEqual(len(members), len(set(members)))
+        self.assertTrue(set(members).issubset(model.reaction_ids))
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        self.assertAlmostEqual(
+            optknock_pulp.OptKnock(model, solver).solve_FBA(),
+            optknock_pulp.OptKnock(compressed, solver).solve_FBA(), 6)
+        for x, y in zip(optknock_pulp.OptKnock(model, solver).solve_FVA('H6PS'),
+                        optknock_pulp.OptKnock(compressed, solver).solve_FVA('H6PS')):
+            self.assertAlmostEqual(x, y, 6)
+
+    def test_enzyme_subsets(self):
+        import numpy as np
+        from python.models import find_enzyme_subsets
+
+        # uptake of A, A => 2 B (with numerical noise), export of B, and
+        # export of A
+        S = np.array([[1, -1, 0, -1],
+                      [0, 2 + 1e-10, -1, 0]])
+        blocked, subsets = find_enzyme_subsets(S)
+        self.assertListEqual(blocked, [])
+        self.assertEqual(len(subsets), 3)
+        self.assertIn([(1, 1.0), (2, 2.0)], subsets)
+
+        # scaling the reactions changes only the factors
+        blocked, subsets = find_enzyme_subsets(S * [1, 1, -3, 1])
+        self.assertEqual(len(subsets), 3)
+        subset = [s for s in subsets if s[0][0] == 1][0]
+        self.assertListEqual([j for j, _ in subset], [1, 2])
+        self.assertAlmostEqual(subset[1][1], -2.0 / 3, 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,56 @@ Created on Thu Aug 10 17:22:11 2017
 """
 
 import unittest
+import warnings
+
+TARGET_REACTION = 'H6PS'
+KNOCKINS = 'MEDH,H6PS,H6PI,H4MPTP,FDH'
+CARBON_SOURCES = ['methanol,succ', 'methanol,xu5p_D']
+
+# the arguments of the small knockout scans (carbon sources, single
+# knockouts, target reaction and knockins)
+SCAN_ARGS = (CARBON_SOURCES, ['', 'FBP', 'RPI'], TARGET_REACTION, KNOCKINS)
+
+def get_rump_model():
+    """
+        The core model with the RuMP knockins, growing on methanol and xu5p_D
+    """
+    from python.models import Model
+
+    model = Model.initialize()
+    model.knockin_reactions(KNOCKINS, 0, 1000)
+    model.set_exchange_bounds('methanol', lower_bound=-10)
+    model.set_exchange_bounds('xu5p_D', lower_bound=-2)
+    return model
+
+def get_knockout_iterations(optknock_class, solver,
+                            knockouts=('RPI', 'FBP', 'TKT1', 'TALA', 'GND')):
+    """
+        The number of simplex iterations for solving the FBA of the RuMP
+        model with each of the knockouts, when the same problem is changed
+        and solved again (with warm start), and when a new problem is
+        built for each knockout
+    """
+    model = get_rump_model()
+    ok = optknock_class(model, solver)
+    ok.enable_warm_start()
+    ok.prepare_FBA_primal()
+    ok.solve()
+    iterations = ok.profile.iterations
+    cold_iterations = 0
+    for rid in knockouts:
+        old_bounds = ok.set_reaction_bounds(rid, 0, 0)
+        ok.solve()
+        ok.set_reaction_bounds(rid, *old_bounds)
+
+        ko_model = model.clone()
+        ko_model.knockout_reactions(rid)
+        ok_cold = optknock_class(ko_model, solver)
+        ok_cold.prepare_FBA_primal()
+        ok_cold.solve()
+        assert abs(ok.get_objective_value() - ok_cold.get_objective_value()) < 1e-6
+        cold_iterations += ok_cold.profile.iterations
+    return ok.profile.iterations - iterations, cold_iterations
 
 class TestReactionParsing(unittest.TestCase):
     
@@ -51,6 +101,625 @@ class TestReactionParsing(unittest.TestCase):
         slope_df = df.pivot('knockouts', 'carbon source', 'slope')        
         self.assertAlmostEqual(yield_df['methanol,succ']['FBP'], 0.682, 3)
         self.assertAlmostEqual(slope_df['methanol,xu5p_D']['RPI'], 9.396, 3)
-        
+
+    def test_parallel_pulp(self):
+        from python import optknock_pulp
+
+        df_serial = optknock_pulp.OptKnock.analyze_kos(
+                *SCAN_ARGS, n_knockouts=1, n_threads=1, solver='glpk')
+        df_parallel = optknock_pulp.OptKnock.analyze_kos(
+                *SCAN_ARGS, n_knockouts=1, n_threads=2, solver='glpk')
+
+        self.assertEqual(df_serial.shape, (6, 4))
+        self.assertListEqual(list(df_serial['knockouts']),
+                             list(df_parallel['knockouts']))
+        self.assertListEqual(list(df_serial['carbon source']),
+                             list(df_parallel['carbon source']))
+        for col in ['yield', 'slope']:
+            for x, y in zip(df_serial[col], df_parallel[col]):
+                self.assertAlmostEqual(x, y, 3)
+
+    def test_profile_pulp(self):
+        from python import optknock_pulp, profiling
+
+        df = optknock_pulp.OptKnock.analyze_kos(
+                *SCAN_ARGS, n_knockouts=1, n_threads=1, solver='glpk')
+        df_profile = optknock_pulp.OptKnock.analyze_kos(
+                *SCAN_ARGS, n_knockouts=1, n_threads=1, solver='glpk',
+                profile=True)
+
+        self.assertEqual(df_profile.shape, (6, 4 + len(profiling.COLUMNS)))
+        for col in ['yield', 'slope']:
+            for x, y in zip(df[col], df_profile[col]):
+                self.assertAlmostEqual(x, y, 3)
+        for x in df_profile['solve']:
+            self.assertGreater(x, 0)
+        for x in df_profile['solves']:
+            self.assertGreaterEqual(x, 1)
+
+    def test_reuse_problem_pulp(self):
+        from python import optknock_pulp
+
+        df = optknock_pulp.OptKnock.analyze_kos(
+                CARBON_SOURCES, ['FBP', 'RPI'], TARGET_REACTION, KNOCKINS,
+                n_knockouts=1, n_threads=1, solver='glpk',
+                reuse_problem=True)
+
+        yield_df = df.pivot('knockouts', 'carbon source', 'yield')
+        slope_df = df.pivot('knockouts', 'carbon source', 'slope')
+        self.assertAlmostEqual(yield_df['methanol,succ']['FBP'], 0.682, 3)
+        self.assertAlmostEqual(slope_df['methanol,xu5p_D']['RPI'], 9.396, 3)
+
+    def test_yield_and_slope_pulp(self):
+        from python import optknock_pulp
+
+        model = get_rump_model()
+        model.knockout_reactions('RPI')
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        yd, slope = optknock_pulp.OptKnock(model, solver).get_yield_and_slope(TARGET_REACTION)
+        self.assertAlmostEqual(yd, optknock_pulp.OptKnock(model, solver).solve_FBA(), 6)
+        self.assertAlmostEqual(slope, optknock_pulp.OptKnock(model, solver).get_slope(TARGET_REACTION), 6)
+
+    def test_warm_start_pulp(self):
+        from pulp import LpSolver
+        from python import optknock_pulp, glpk_session
+
+        model = get_rump_model()
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+
+        class NoWarmStartGLPK(solver):
+            def __init__(self, *args, **kwargs):
+                if 'warmStart' in kwargs:
+                    raise TypeError('unexpected keyword argument: warmStart')
+                solver.__init__(self, *args, **kwargs)
+
+        class NoWarmStartSolver(LpSolver):
+            def __init__(self, msg=True):
+                LpSolver.__init__(self, msg=msg)
+
+        ok = optknock_pulp.OptKnock(model, solver)
+        ok.prepare_optknock(TARGET_REACTION, num_deletions=1)
+        ok.solve()
+        objective_value = ok.get_objective_value()
+
+        # warm starting (also from the solution of the previous solve) should
+        # not change the optimum, and GLPK (which does not accept the
+        # warmStart option) should be replaced by the in-process GLPK solver
+        for optknock_solver in [solver, NoWarmStartGLPK]:
+            ok = optknock_pulp.OptKnock(model, optknock_solver)
+            ok.enable_warm_start()
+            ok.prepare_optknock(TARGET_REACTION, num_deletions=1)
+            for _ in range(2):
+                ok.solve()
+                self.assertAlmostEqual(ok.get_objective_value(), objective_value, 3)
+        self.assertIsInstance(ok.prob.solver, glpk_session.GLPK_API)
+
+        # other solvers that cannot warm start are used with a warning
+        ok = optknock_pulp.OptKnock(model, NoWarmStartSolver)
+        ok.enable_warm_start()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertIsInstance(ok.create_solver(), NoWarmStartSolver)
+        self.assertEqual(len(caught), 1)
+
+        # re-solving after a knockout should take fewer simplex iterations
+        # than solving a new problem
+        warm_iterations, cold_iterations = get_knockout_iterations(
+            optknock_pulp.OptKnock, optknock_pulp.OptKnock.get_solver('glpk_api'))
+        self.assertLess(warm_iterations, cold_iterations / 2)
+
+    def test_warm_start_optlang(self):
+        from python import optknock_optlang
+
+        solver = optknock_optlang.OptKnock.get_solver('glpk')
+        warm_iterations, cold_iterations = get_knockout_iterations(
+            optknock_optlang.OptKnock, solver)
+        self.assertLess(warm_iterations, cold_iterations / 2)
+
+    def test_glpk_api_pulp(self):
+        from python import optknock_pulp
+
+        model = get_rump_model()
+
+        glpk = optknock_pulp.OptKnock.get_solver('glpk')
+        glpk_api = optknock_pulp.OptKnock.get_solver('glpk_api')
+        ppp = optknock_pulp.OptKnock(model, glpk).get_PPP_data(TARGET_REACTION)
+        ppp_api = optknock_pulp.OptKnock(model, glpk_api).get_PPP_data(TARGET_REACTION)
+        self.assertEqual(ppp.shape, ppp_api.shape)
+        for x, y in zip(ppp.flat, ppp_api.flat):
+            self.assertAlmostEqual(x, y, 4)
+
+        ok = optknock_pulp.OptKnock(model, glpk)
+        ok.prepare_optknock(TARGET_REACTION, num_deletions=1)
+        ok.solve()
+        ok_api = optknock_pulp.OptKnock(model, glpk_api)
+        ok_api.prepare_optknock(TARGET_REACTION, num_deletions=1)
+        ok_api.solve()
+        self.assertAlmostEqual(ok.get_objective_value(),
+                               ok_api.get_objective_value(), 3)
+
+    def test_analyze_kos_scipy(self):
+        from python import optknock_pulp, optknock_scipy
+
+        df_pulp = optknock_pulp.OptKnock.analyze_kos(
+                *SCAN_ARGS, n_knockouts=1, n_threads=1, solver='glpk')
+        df_scipy = optknock_scipy.OptKnock.analyze_kos(
+                *SCAN_ARGS, n_knockouts=1, n_threads=1)
+
+        self.assertEqual(df_scipy.shape, (6, 4))
+        with self.assertRaises(ValueError):
+            optknock_scipy.OptKnock.get_solver('glpk')
+        for col in ['yield', 'slope']:
+            for x, y in zip(df_pulp[col], df_scipy[col]):
+                self.assertAlmostEqual(x, y, 3)
+
+    def test_scan_without_copies(self):
+        from python import models, optknock_pulp, optknock_optlang
+
+        # count the deep copies of cobra models (i.e. the materialized
+        # clones) made during the scans
+        copies = []
+        def counting_deepcopy(x, *args):
+            copies.append(x)
+            return deepcopy(x, *args)
+
+        deepcopy = models.deepcopy
+        models.deepcopy = counting_deepcopy
+        try:
+            for optknock_class in [optknock_pulp.OptKnock,
+                                   optknock_optlang.OptKnock]:
+                for reuse_problem in [False, True]:
+                    df = optknock_class.analyze_kos(
+                            *SCAN_ARGS, n_knockouts=1, n_threads=1,
+                            solver='glpk', reuse_problem=reuse_problem)
+                    self.assertEqual(df.shape[0], 6)
+        finally:
+            models.deepcopy = deepcopy
+        self.assertEqual(len(copies), 0)
+
+    def test_result_cache_pulp(self):
+        import shutil
+        import tempfile
+        from python import optknock_pulp, result_cache
+
+        model = get_rump_model()
+        ko_model = model.clone()
+        ko_model.knockout_reactions('RPI')
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        yd = optknock_pulp.OptKnock(model, solver).solve_FBA()
+        ppp = optknock_pulp.OptKnock(model, solver).get_PPP_data(TARGET_REACTION)
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = result_cache.enable(cache_dir=cache_dir)
+            for _ in range(2):
+                self.assertAlmostEqual(
+                    optknock_pulp.OptKnock(model, solver).solve_FBA(), yd, 6)
+            optknock_pulp.OptKnock(ko_model, solver).solve_FBA()
+            self.assertEqual(cache.hits, 1)
+            self.assertEqual(cache.misses, 2)
+
+            # a new cache finds the results on disk
+            cache = result_cache.enable(cache_dir=cache_dir)
+            self.assertAlmostEqual(
+                optknock_pulp.OptKnock(model, solver).solve_FBA(), yd, 6)
+            self.assertEqual(cache.disk_hits, 1)
+
+            for _ in range(2):
+                ppp_cached = optknock_pulp.OptKnock(model, solver).get_PPP_data(TARGET_REACTION)
+                for x, y in zip(ppp.flat, ppp_cached.flat):
+                    self.assertAlmostEqual(x, y, 6)
+            self.assertEqual(cache.get_statistics()['hits'], 2)
+
+            # nothing is solved for a cached result, so there is no solution
+            # to inspect until the next solve, and the fingerprint of the
+            # model is computed only once
+            ok = optknock_pulp.OptKnock(model, solver)
+            ok.solve_FBA()
+            fingerprint = ok.model_fingerprint
+            self.assertIsNotNone(fingerprint)
+            with self.assertRaises(Exception):
+                ok.get_objective_value()
+            with self.assertRaises(Exception):
+                ok.print_primal_results()
+            ok.get_slope(TARGET_REACTION)
+            self.assertIs(ok.model_fingerprint, fingerprint)
+            ok.prepare_FBA_primal()
+            ok.solve()
+            self.assertAlmostEqual(ok.get_objective_value(), yd, 6)
+        finally:
+            result_cache.disable()
+            shutil.rmtree(cache_dir)
+
+    def test_batch_FVA_pulp(self):
+        from python import optknock_pulp
+        from python.models import Model
+
+        model = Model.initialize()
+        model.set_exchange_bounds('succ', lower_bound=-10)
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        reaction_ids = ['PGI', 'PFK', 'FBP', 'PDH']
+        df = optknock_pulp.OptKnock(model, solver).solve_batch_FVA(
+            reaction_ids, n_threads=2)
+        self.assertListEqual(list(df.index), reaction_ids)
+        for rid in reaction_ids:
+            min_flux, max_flux = optknock_pulp.OptKnock(model, solver).solve_FVA(rid)
+            self.assertAlmostEqual(df.loc[rid, 'minimum'], min_flux, 3)
+            self.assertAlmostEqual(df.loc[rid, 'maximum'], max_flux, 3)
+
+    def test_solve_after_batch_FVA(self):
+        from python import optknock_pulp, optknock_optlang
+
+        model = get_rump_model()
+        for optknock_class in [optknock_pulp.OptKnock,
+                               optknock_optlang.OptKnock]:
+            ok = optknock_class(model, optknock_class.get_solver('glpk'))
+            yd = ok.solve_FBA()
+            ok.solve_batch_FVA(['PGI', 'FBP'])
+            self.assertAlmostEqual(ok.solve_FBA(), yd, 6)
+            self.assertIsNotNone(ok.get_slope(TARGET_REACTION))
+
+    def test_checkpoint_pulp(self):
+        import os
+        import shutil
+        import tempfile
+        from python import optknock_pulp
+
+        carbon_sources, single_kos, target_reaction, knockins = SCAN_ARGS
+        df = optknock_pulp.OptKnock.analyze_kos(
+                *SCAN_ARGS, n_knockouts=1, n_threads=1, solver='glpk')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            checkpoint = os.path.join(tmpdir, 'checkpoint.csv')
+
+            # a scan which fails on its last knockout leaves a checkpoint
+            with self.assertRaises(KeyError):
+                optknock_pulp.OptKnock.analyze_kos(
+                        carbon_sources, single_kos + ['NOT_A_REACTION'],
+                        target_reaction, knockins, n_knockouts=1,
+                        n_threads=1, solver='glpk', checkpoint=checkpoint)
+
+            # keep only the first two results, and a partially written row
+            with open(checkpoint) as fp:
+                lines = fp.readlines()
+            self.assertEqual(len(lines), 7)
+            with open(checkpoint, 'w') as fp:
+                fp.writelines(lines[:3])
+                fp.write('RPI,methanol')
+
+            # a scan with other parameters should not use it
+            with self.assertRaises(ValueError):
+                optknock_pulp.OptKnock.analyze_kos(
+                        *SCAN_ARGS, n_knockouts=1, n_threads=1,
+                        solver='glpk', carbon_uptake_rate=10,
+                        checkpoint=checkpoint)
+
+            df_resumed = optknock_pulp.OptKnock.analyze_kos(
+                    *SCAN_ARGS, n_knockouts=1, n_threads=1, solver='glpk',
+                    checkpoint=checkpoint)
+            self.assertListEqual(os.listdir(tmpdir), [])
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertListEqual(list(df['knockouts']),
+                             list(df_resumed['knockouts']))
+        self.assertListEqual(list(df['carbon source']),
+                             list(df_resumed['carbon source']))
+        for col in ['yield', 'slope']:
+            for x, y in zip(df[col], df_resumed[col]):
+                self.assertAlmostEqual(x, y, 3)
+
+    def test_checkpoint_prefilter_pulp(self):
+        import os
+        import shutil
+        import tempfile
+        from python import optknock_pulp, knockout_scan
+
+        single_kos = ['', 'FBP', 'RPI', 'PGI', 'NOT_A_REACTION']
+        df = optknock_pulp.OptKnock.analyze_kos(
+                CARBON_SOURCES, single_kos, TARGET_REACTION, KNOCKINS,
+                n_knockouts=1, n_threads=1, solver='glpk', prefilter=True)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            # a checkpoint with the first two results, as left by an
+            # interrupted scan
+            checkpoint = os.path.join(tmpdir, 'checkpoint.csv')
+            knockout_scan.check_checkpoint_params(
+                checkpoint, knockout_scan.get_checkpoint_params(
+                    optknock_pulp.OptKnock, TARGET_REACTION, KNOCKINS, 1, 50,
+                    'glpk', True))
+            df.head(2).to_csv(checkpoint, index=False)
+
+            # the wild-type model should be prepared (and the candidates
+            # filtered) only once
+            prepare_wt_model = knockout_scan._prepare_wt_model
+            calls = []
+            def counting_prepare_wt_model(*args):
+                calls.append(args)
+                return prepare_wt_model(*args)
+            knockout_scan._prepare_wt_model = counting_prepare_wt_model
+            try:
+                df_resumed = optknock_pulp.OptKnock.analyze_kos(
+                        CARBON_SOURCES, single_kos, TARGET_REACTION, KNOCKINS,
+                        n_knockouts=1, n_threads=1, solver='glpk',
+                        prefilter=True, checkpoint=checkpoint)
+            finally:
+                knockout_scan._prepare_wt_model = prepare_wt_model
+            self.assertEqual(len(calls), 1)
+            self.assertListEqual(os.listdir(tmpdir), [])
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertListEqual(list(df['knockouts']),
+                             list(df_resumed['knockouts']))
+        self.assertListEqual(list(df['carbon source']),
+                             list(df_resumed['carbon source']))
+        for col in ['yield', 'slope']:
+            for x, y in zip(df[col], df_resumed[col]):
+                self.assertAlmostEqual(x, y, 3)
+
+    def test_write_kos_pulp(self):
+        import os
+        import shutil
+        import tempfile
+        import pandas as pd
+        from python import optknock_pulp
+
+        df = optknock_pulp.OptKnock.analyze_kos(
+                *SCAN_ARGS, n_knockouts=1, n_threads=1, solver='glpk')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'results.csv')
+            n_rows = optknock_pulp.OptKnock.write_kos(
+                    fname, *SCAN_ARGS[:3], knockins=KNOCKINS, n_knockouts=1,
+                    n_threads=2, solver='glpk', batch_size=2,
+                    rows_per_chunk=4)
+            df_written = pd.read_csv(fname, keep_default_na=False)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertEqual(n_rows, 6)
+        self.assertListEqual(list(df['knockouts']),
+                             list(df_written['knockouts']))
+        for x, y in zip(df['yield'], df_written['yield']):
+            self.assertAlmostEqual(x, y, 3)
+
+    def test_prune_lethal_pulp(self):
+        from python import optknock_pulp
+
+        args = (CARBON_SOURCES, ['', 'FBP', 'RPI', 'TKT1', 'TALA'],
+                TARGET_REACTION, KNOCKINS)
+        df = optknock_pulp.OptKnock.analyze_kos(
+                *args, n_knockouts=3, n_threads=1, solver='glpk')
+        df_pruned = optknock_pulp.OptKnock.analyze_kos(
+                *args, n_knockouts=3, n_threads=1, solver='glpk',
+                prune_lethal=True)
+
+        self.assertListEqual(list(df['knockouts']),
+                             list(df_pruned['knockouts']))
+        self.assertListEqual(list(df['carbon source']),
+                             list(df_pruned['carbon source']))
+        for col in ['yield', 'slope']:
+            for x, y in zip(df[col], df_pruned[col]):
+                self.assertAlmostEqual(x, y, 3)
+
+    def test_prefilter_pulp(self):
+        from python import optknock_pulp
+
+        single_kos = ['', 'FBP', 'RPI', 'PGI']
+        df = optknock_pulp.OptKnock.analyze_kos(
+                CARBON_SOURCES, single_kos, TARGET_REACTION, KNOCKINS,
+                n_knockouts=1, n_threads=1, solver='glpk')
+        df_filtered = optknock_pulp.OptKnock.analyze_kos(
+                CARBON_SOURCES, single_kos + ['NOT_A_REACTION'],
+                TARGET_REACTION, KNOCKINS, n_knockouts=1, n_threads=1,
+                solver='glpk', prefilter=True)
+
+        self.assertNotIn('NOT_A_REACTION', list(df_filtered['knockouts']))
+        df = df.set_index(['knockouts', 'carbon source'])
+        for kos, cs, yd, slope in df_filtered.itertuples(index=False):
+            self.assertAlmostEqual(df.loc[(kos, cs), 'yield'], yd, 3)
+            self.assertAlmostEqual(df.loc[(kos, cs), 'slope'], slope, 3)
+
+    def test_prefilter_optknock(self):
+        from python import optknock_pulp, optknock_optlang, flux_variability
+
+        model = get_rump_model()
+        objective_values = []
+        for optknock_class in [optknock_pulp.OptKnock,
+                               optknock_optlang.OptKnock]:
+            solver = optknock_class.get_solver('glpk')
+            kept, _ = flux_variability.filter_ko_candidates(
+                optknock_class, model, solver)
+
+            ok = optknock_class(model, solver)
+            ok.prepare_optknock(TARGET_REACTION, num_deletions=1,
+                                prefilter=True)
+            self.assertEqual(ok.n_ko_candidates, len(kept))
+            self.assertLess(ok.n_ko_candidates, len(model.reaction_ids) - 1)
+            ok.solve()
+            objective_values.append(ok.get_objective_value())
+        self.assertAlmostEqual(objective_values[0], objective_values[1], 3)
+
+    def test_tighten_bounds_pulp(self):
+        from python import optknock_pulp
+
+        model = get_rump_model()
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        objective_values = []
+        for tighten_bounds in [False, True]:
+            ok = optknock_pulp.OptKnock(model, solver)
+            ok.prepare_optslope(TARGET_REACTION, num_deletions=1,
+                                tighten_bounds=tighten_bounds)
+            ok.solve()
+            objective_values.append(ok.get_objective_value())
+        self.assertAlmostEqual(objective_values[0], objective_values[1], 3)
+
+    def test_indicators_optlang(self):
+        from python import optknock_optlang
+
+        model = get_rump_model()
+
+        # GLPK does not support indicator constraints, so the big-M
+        # constraints should be used instead
+        engine = optknock_optlang.OptKnock.get_solver('glpk')
+        objective_values = []
+        for use_indicators in [False, True]:
+            ok = optknock_optlang.OptKnock(model, engine)
+            ok.prepare_optslope(TARGET_REACTION, num_deletions=1,
+                                use_indicators=use_indicators)
+            ok.solve()
+            objective_values.append(ok.get_objective_value())
+        self.assertFalse(ok.supports_indicator_constraints())
+        self.assertAlmostEqual(objective_values[0], objective_values[1], 3)
+
+    def test_indicator_constraints_optlang(self):
+        from optlang import interface
+        from python import optknock_optlang
+
+        class Constraint(interface.Constraint):
+            _INDICATOR_CONSTRAINT_SUPPORT = True
+
+        class Engine(object):
+            pass
+
+        class Problem(object):
+            def __init__(self):
+                self.constraints = {}
+
+            def add(self, constraints):
+                for c in constraints:
+                    self.constraints[c.name] = c
+
+        model = get_rump_model()
+
+        # build the variables with GLPK, and then record the indicator
+        # constraints with an engine that claims to support them, since
+        # CPLEX or Gurobi are not needed for checking their structure
+        ok = optknock_optlang.OptKnock(model, optknock_optlang.OptKnock.get_solver('glpk'))
+        ok.prepare_optknock(TARGET_REACTION, num_deletions=1)
+        ok.engine = Engine()
+        ok.engine.Constraint = Constraint
+        ok.prob = Problem()
+        self.assertTrue(ok.supports_indicator_constraints())
+        ok.add_indicator_constraints()
+
+        self.assertEqual(len(ok.prob.constraints), 3 * len(ok.model.reaction_ids))
+        for r, lb, ub in zip(ok.model.reaction_ids, ok.model.lower_bounds,
+                             ok.model.upper_bounds):
+            w_sum = ok.var_w_U[r] * ub - ok.var_w_L[r] * lb
+            for name, expression, active_when in [
+                    ('v_ko_%s' % r, ok.var_v[r], 0),
+                    ('mu_ko_%s' % r, ok.var_mu[r], 0),
+                    ('mu_%s' % r, ok.var_mu[r] - w_sum, 1)]:
+                c = ok.prob.constraints[name]
+                self.assertIs(c.indicator_variable, ok.var_y[r])
+                self.assertEqual(c.active_when, active_when)
+                self.assertEqual((c.lb, c.ub), (0, 0))
+                self.assertEqual((c.expression - expression).expand(), 0)
+
+    def test_enumerate_designs_pulp(self):
+        from python import optknock_pulp
+
+        model = get_rump_model()
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        ok = optknock_pulp.OptKnock(model, solver)
+        ok.prepare_optknock(TARGET_REACTION, num_deletions=1)
+        df = ok.enumerate_designs(3)
+
+        self.assertEqual(df.shape[0], 3)
+        self.assertEqual(len(set(df['knockouts'])), 3)
+        for x, y in zip(df['objective'][:-1], df['objective'][1:]):
+            self.assertGreaterEqual(x + 1e-6, y)
+
+    def test_enumerate_designs_optlang(self):
+        from python import optknock_pulp, optknock_optlang
+
+        model = get_rump_model()
+
+        dfs = []
+        for optknock_class in [optknock_pulp.OptKnock,
+                               optknock_optlang.OptKnock]:
+            ok = optknock_class(model, optknock_class.get_solver('glpk'))
+            ok.prepare_optknock(TARGET_REACTION, num_deletions=1)
+            dfs.append(ok.enumerate_designs(3))
+
+        self.assertEqual(dfs[1].shape[0], 3)
+        self.assertEqual(len(set(dfs[1]['knockouts'])), 3)
+        # the knockout sets can differ (when there are alternative optima),
+        # but not their objective values
+        for x, y in zip(dfs[0]['objective'], dfs[1]['objective']):
+            self.assertAlmostEqual(x, y, 3)
+
+    def test_compressed_design_pulp(self):
+        from python import optknock_pulp, knockout_designs
+
+        model = get_rump_model()
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        for optslope in [False, True]:
+            design = knockout_designs.find_compressed_design(
+                optknock_pulp.OptKnock, model, solver, TARGET_REACTION,
+                num_deletions=2, optslope=optslope)
+            knockouts, objective_value = design[:2]
+            for rid in knockouts.split(','):
+                self.assertTrue(model.has_reaction(rid))
+
+            # the compressed model has the same optimum as the original one,
+            # and the design is evaluated on the original model
+            ok = optknock_pulp.OptKnock(model, solver)
+            if optslope:
+                ok.prepare_optslope(TARGET_REACTION, num_deletions=2)
+            else:
+                ok.prepare_optknock(TARGET_REACTION, num_deletions=2)
+            ok.solve()
+            self.assertAlmostEqual(ok.get_objective_value(), objective_value, 3)
+            for x, y in zip(ok.evaluate_design(knockouts), design[2:]):
+                self.assertAlmostEqual(x, y, 3)
+
+    def test_sweep_num_deletions_pulp(self):
+        from python import optknock_pulp
+
+        model = get_rump_model()
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        ok = optknock_pulp.OptKnock(model, solver)
+        ok.prepare_optknock(TARGET_REACTION, num_deletions=0)
+        df = ok.sweep_num_deletions(2, min_deletions=0)
+
+        self.assertListEqual(list(df['num_deletions']), [0, 1, 2])
+        for num_deletions, objective_value in zip(df['num_deletions'],
+                                                  df['objective']):
+            ok = optknock_pulp.OptKnock(model, solver)
+            ok.prepare_optknock(TARGET_REACTION, num_deletions=num_deletions)
+            ok.solve()
+            self.assertAlmostEqual(ok.get_objective_value(), objective_value, 3)
+
+    def test_sweep_num_deletions_optlang(self):
+        from python import optknock_pulp, optknock_optlang
+
+        model = get_rump_model()
+
+        dfs = []
+        for optknock_class in [optknock_pulp.OptKnock,
+                               optknock_optlang.OptKnock]:
+            ok = optknock_class(model, optknock_class.get_solver('glpk'))
+            ok.prepare_optknock(TARGET_REACTION, num_deletions=0)
+            dfs.append(ok.sweep_num_deletions(2, min_deletions=0))
+
+        self.assertListEqual(list(dfs[1]['num_deletions']), [0, 1, 2])
+        # the knockout sets can differ (when there are alternative optima),
+        # but not their objective values
+        for x, y in zip(dfs[0]['objective'], dfs[1]['objective']):
+            self.assertAlmostEqual(x, y, 3)
+
 if __name__ == '__main__':
     unittest.main()
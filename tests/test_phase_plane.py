@@ -0,0 +1,48 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+
+class TestPhasePlane(unittest.TestCase):
+
+    def test_find_vertices(self):
+        from python import phase_plane
+
+        # a convex piecewise-linear function with vertices at 1, 2.5 and 7
+        calls = []
+        def f(x):
+            calls.append(x)
+            return max(0.0, 2 * (x - 1), 5 * (x - 2.5) + 3, 10 * (x - 7) + 25.5)
+
+        xs, ys = phase_plane.find_vertices(f, 0.0, 10.0)
+        self.assertEqual(len(xs), 5)
+        for x, x_expected in zip(xs, [0.0, 1.0, 2.5, 7.0, 10.0]):
+            self.assertAlmostEqual(x, x_expected, 6)
+        for x, y in zip(xs, ys):
+            self.assertAlmostEqual(y, f(x), 6)
+        self.assertLess(len(calls), 30)
+
+    def test_adaptive_PPP_pulp(self):
+        from python import optknock_pulp
+        from python.models import Model
+
+        model = Model.initialize()
+        model.knockin_reactions('MEDH,H6PS,H6PI,H4MPTP,FDH', 0, 1000)
+        model.set_exchange_bounds('methanol', lower_bound=-10)
+        model.set_exchange_bounds('xu5p_D', lower_bound=-2)
+
+        solver = optknock_pulp.OptKnock.get_solver('glpk')
+        ok = optknock_pulp.OptKnock(model, solver)
+        grid = ok.get_PPP_data('H6PS')
+        vertices = ok.get_PPP_data('H6PS', adaptive=True)
+
+        bm = np.asarray(grid[:, 0]).ravel()
+        for col in [1, 2]:
+            envelope = np.interp(bm, np.asarray(vertices[:, 0]).ravel(),
+                                 np.asarray(vertices[:, col]).ravel())
+            for y, y_expected in zip(envelope, np.asarray(grid[:, col]).ravel()):
+                self.assertAlmostEqual(y, y_expected, 3)
+
+if __name__ == '__main__':
+    unittest.main()